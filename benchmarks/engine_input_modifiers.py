@@ -0,0 +1,98 @@
+import logging
+import random
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.gem.gem_input_dict_modifiers import apply_lifetime_sensitivity, apply_opex_adjustment  # noqa: E402
+from src.models.engine_input_index import EngineInputIndex  # noqa: E402
+from src.models.enums.sensitivities import SensitivityTypes  # noqa: E402
+from src.models.settings import SensitivitySettings  # noqa: E402
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.StreamHandler(),
+    ],
+)
+
+CALCULATORS = 400
+OPEX_ITEMS = 20
+YEARS = 35
+REPEATS = 5
+NUMBER = 50
+
+CONFIG = SensitivitySettings(folder="benchmarks", technologies=[], sensitivities={})
+
+
+def _yearly_costs() -> dict[str, float]:
+    return {str(2030 + year): random.random() * 1e5 for year in range(YEARS)}
+
+
+def synthetic_input() -> dict:
+    calculators: list[dict] = []
+    for position in range(CALCULATORS):
+        calculator: dict = {"calculator": random.choice(["GENERIC_OPEX", "LAND_OPEX", "GENERIC_CAPEX", "DEBT"])}
+        if calculator["calculator"].endswith("OPEX"):
+            calculator["items"] = [{"name": f"item_{i}", "risk_factor": 1.0} for i in range(OPEX_ITEMS)]
+        if position % 7 == 0:
+            calculator["operational_lifetime_years"] = 30
+        calculators.append(calculator)
+    return {
+        "operational_lifetime_years": 35,
+        "calculators": calculators,
+        "energy_yield_information": {
+            "energy_loss_calculators": [{"operational_lifetime_years": 30}, {"name": "availability"}],
+        },
+        # Every turbine group shape the scanning modifier accepts, including groups missing one or both O&M tables
+        "turbine_groups": [
+            {"turbine_o_and_m": {"o_and_m_cost_per_turbine": _yearly_costs(), "o_and_m_cost_per_mwh": _yearly_costs()}},
+            {"turbine_o_and_m": {"o_and_m_cost_per_mwh": _yearly_costs()}},
+            {"turbine_o_and_m": {"o_and_m_cost_per_turbine": _yearly_costs()}},
+            {"turbine_o_and_m": {"o_and_m_cost_per_turbine": None}},
+            {"turbine_o_and_m": {}},
+            {"turbine_o_and_m": None},
+            {},
+        ],
+    }
+
+
+def check_indexed_matches_scanning(engine_input: dict) -> None:
+    index = EngineInputIndex(engine_input)
+    for adjustment in (-0.1, 0.25):
+        scanned = apply_opex_adjustment(engine_input, adjustment, SensitivityTypes.PERCENTAGE_ADJUSTMENT, CONFIG)
+        indexed = apply_opex_adjustment(engine_input, adjustment, SensitivityTypes.PERCENTAGE_ADJUSTMENT, CONFIG, index)
+        assert scanned == indexed, f"Indexed opex adjustment of {adjustment} differs from scanning"
+    for lifetime in (-5, 3):
+        scanned = apply_lifetime_sensitivity(engine_input, lifetime, SensitivityTypes.GENERIC_ADDER, CONFIG)
+        indexed = apply_lifetime_sensitivity(engine_input, lifetime, SensitivityTypes.GENERIC_ADDER, CONFIG, index)
+        assert scanned == indexed, f"Indexed lifetime adjustment of {lifetime} differs from scanning"
+
+
+def per_input_microseconds(statement: object) -> float:
+    return min(timeit.repeat(statement, number=NUMBER, repeat=REPEATS)) / NUMBER * 1e6  # type: ignore[arg-type]
+
+
+if __name__ == "__main__":
+    engine_input = synthetic_input()
+    # The indexed modifiers are only worth timing if they build exactly what the scanning ones do
+    check_indexed_matches_scanning(engine_input)
+    # Energy yield information without energy loss calculators is valid and the scan treats it as empty
+    check_indexed_matches_scanning({**engine_input, "energy_yield_information": {}})
+    logging.info("Indexed and scanning modifiers build identical inputs")
+
+    index = EngineInputIndex(engine_input)
+    percentage = SensitivityTypes.PERCENTAGE_ADJUSTMENT
+    logging.info(f"Engine input with {CALCULATORS} calculators, {len(engine_input['turbine_groups'])} turbine groups")
+    logging.info(f"Build index: {per_input_microseconds(lambda: EngineInputIndex(engine_input)):.1f} us")
+    logging.info(
+        f"Opex adjustment, scanning: "
+        f"{per_input_microseconds(lambda: apply_opex_adjustment(engine_input, 0.1, percentage, CONFIG)):.1f} us"
+    )
+    logging.info(
+        f"Opex adjustment, indexed: "
+        f"{per_input_microseconds(lambda: apply_opex_adjustment(engine_input, 0.1, percentage, CONFIG, index)):.1f} us"
+    )
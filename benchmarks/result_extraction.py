@@ -0,0 +1,82 @@
+import json
+import logging
+import random
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.gem.result_extraction import GEM_RESULT_KPIS, ResultExtractor  # noqa: E402
+from src.models.gem_results import GemResult, KpiSpec  # noqa: E402
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.StreamHandler(),
+    ],
+)
+
+# Set to a saved engine response to benchmark against real data instead of a synthetic one
+RESPONSE_FILE: str | None = None
+INPUT_COMPONENTS = 200
+ADDITIONAL_COMPONENT_KPIS = 30
+REPEATS = 5
+NUMBER = 2000
+
+
+def synthetic_response() -> dict:
+    components = [{"name": f"COMPONENT_{i}", "total": random.random() * 1e6} for i in range(INPUT_COMPONENTS)]
+    for name in ("TOTAL_CAPEX", "MERCHANT_REVENUE", "TOTAL_OPEX"):
+        components.insert(random.randrange(len(components)), {"name": name, "total": random.random() * 1e8})
+    return {
+        "solved_development_fee": 1.5e6,
+        "development_fee_irr": 0.08,
+        "bep": 55.2,
+        "target_project_discount_rate": 0.07,
+        "rated_power_mw": 100.0,
+        "project_sale_date": "2027-03-01",
+        "financial_close": "2027-06-01",
+        "commercial_operation": "2028-09-01",
+        "first_year_yield_mwh": 210000.0,
+        "operational_lifetime": 35,
+        "input_components": components,
+    }
+
+
+def per_response_microseconds(statement: object) -> float:
+    return min(timeit.repeat(statement, number=NUMBER, repeat=REPEATS)) / NUMBER * 1e6  # type: ignore[arg-type]
+
+
+if __name__ == "__main__":
+    if RESPONSE_FILE is not None:
+        with open(RESPONSE_FILE, encoding="utf-8") as f:
+            response = json.load(f)
+    else:
+        response = synthetic_response()
+
+    extractor = ResultExtractor(GEM_RESULT_KPIS)
+    additional_kpis = [
+        KpiSpec(name=f"component_{i}", component=f"COMPONENT_{i}")
+        for i in range(0, INPUT_COMPONENTS, max(INPUT_COMPONENTS // ADDITIONAL_COMPONENT_KPIS, 1))
+    ]
+    extended_extractor = ResultExtractor([*GEM_RESULT_KPIS, *additional_kpis])
+    extra_names = [kpi.name for kpi in additional_kpis]
+
+    def parse() -> GemResult:
+        return GemResult(development_fee=float(response["solved_development_fee"]), **extractor.extract(response))
+
+    def parse_extended() -> GemResult:
+        values = extended_extractor.extract(response)
+        extra = {name: values.pop(name) for name in extra_names}
+        return GemResult(development_fee=float(response["solved_development_fee"]), **values, additional_kpis=extra)
+
+    components = len(response.get("input_components", []))
+    logging.info(f"Response with {components} input components")
+    logging.info(f"Extract GemResult KPIs: {per_response_microseconds(lambda: extractor.extract(response)):.1f} us")
+    logging.info(f"Extract and validate GemResult: {per_response_microseconds(parse):.1f} us")
+    logging.info(
+        f"Extract and validate GemResult with {len(additional_kpis)} additional KPIs: "
+        f"{per_response_microseconds(parse_extended):.1f} us"
+    )
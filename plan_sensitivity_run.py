@@ -0,0 +1,30 @@
+import json
+import logging
+
+from src.helpers.base_assessment_cache import base_assessment_cache_path, load_base_assessments
+from src.helpers.latency_history import load_latency_history
+from src.helpers.run_planner import PlanSettings, enforce_plan_limits, format_run_plan, plan_sensitivity_run
+from src.models.settings import SensitivitySettings
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.StreamHandler(),
+    ],
+)
+
+ANALYSIS_NAME = "design_sensitivity"
+SENSITIVITY_CONFIG = "examples/solarmax_scenario.json"
+RESULTS_DIRECTORY = "results"
+BATCH_SIZE = 50000
+
+if __name__ == "__main__":
+    with open(SENSITIVITY_CONFIG) as f:
+        config = SensitivitySettings(**json.load(f))
+    base_assessments = load_base_assessments(base_assessment_cache_path(RESULTS_DIRECTORY, ANALYSIS_NAME))
+    settings = PlanSettings()  # type: ignore
+
+    plan = plan_sensitivity_run(base_assessments, config, load_latency_history(), BATCH_SIZE, settings)
+    logging.info(format_run_plan(plan))
+    enforce_plan_limits(plan, settings)
@@ -0,0 +1,32 @@
+import json
+import logging
+import os
+
+from src.gem.incremental_runs import replay_failed_assessments
+from src.helpers.failure_archive import failure_archive_path
+from src.helpers.write_to_excel_template import write_results_to_template_excel_file
+from src.models.gem_assessments import SensitivityResults
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("replay_failures.log", mode="w"),
+    ],
+)
+
+ANALYSIS_NAME = "emea"
+RESULTS_DIRECTORY = "results"
+
+if __name__ == "__main__":
+    results_file = os.path.join(RESULTS_DIRECTORY, f"{ANALYSIS_NAME}_results.json")
+    with open(results_file, encoding="utf-8") as f:
+        sensitivity_results = SensitivityResults(**json.load(f))
+
+    sensitivity_results = replay_failed_assessments(sensitivity_results, failure_archive_path(ANALYSIS_NAME))
+
+    with open(results_file, "w") as f:
+        f.write(sensitivity_results.model_dump_json(indent=2))
+    write_results_to_template_excel_file(sensitivity_results, os.path.join(RESULTS_DIRECTORY, f"{ANALYSIS_NAME}.xlsx"))
+
+    logging.info("Replay of failed assessments complete")
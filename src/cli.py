@@ -0,0 +1,327 @@
+import argparse
+import json
+import logging
+import os
+import time
+from collections.abc import Callable, Sequence
+from typing import TYPE_CHECKING
+
+# Only the standard library is imported here, each command imports what it needs so offline commands start quickly
+if TYPE_CHECKING:
+    from src.models.enums.sensitivities import ScenarioComponents
+    from src.models.results_store import ResultsStore
+    from src.models.settings import SensitivitySettings
+
+logger = logging.getLogger(__name__)
+
+RESULTS_DIRECTORY = "results"
+DESIGN_FILE = "designs/design_options.json"
+SOLARMAX_CSV_DIRECTORY = "designs"
+BATCH_SIZE = 50000
+
+
+def _load_config(file_path: str) -> "SensitivitySettings":
+    from src.models.settings import SensitivitySettings
+
+    with open(file_path, encoding="utf-8") as f:
+        return SensitivitySettings(**json.load(f))
+
+
+def _cache_path(args: argparse.Namespace) -> str:
+    from src.helpers.base_assessment_cache import base_assessment_cache_path
+
+    return base_assessment_cache_path(args.results_directory, args.name)
+
+
+def fetch(args: argparse.Namespace) -> None:
+    from src.gem.gem_service import get_base_gem_assessments
+    from src.helpers.base_assessment_cache import save_base_assessments
+
+    save_base_assessments(get_base_gem_assessments(_load_config(args.config)), _cache_path(args))
+
+
+def build(args: argparse.Namespace) -> None:
+    from src.gem.design_variants import iter_design_base_assessments
+    from src.helpers.base_assessment_cache import save_base_assessments
+    from src.helpers.solarmax_designs import load_design_file
+    from src.models.gem_assessments import BaseAssessments
+
+    project_and_assessment_ids, designs = load_design_file(
+        args.designs, args.solarmax_directory, args.drop_duplicate_designs, args.pareto_designs
+    )
+    base_assessments = BaseAssessments(
+        assessments=list(iter_design_base_assessments(project_and_assessment_ids, designs))
+    )
+    save_base_assessments(base_assessments, _cache_path(args))
+
+
+def _write_results(sensitivity_results: "ResultsStore", name: str, args: argparse.Namespace) -> None:
+    from src.helpers.run_profiler import profile_stage
+    from src.helpers.write_to_excel_template import write_results_to_template_excel_file
+
+    os.makedirs(args.results_directory, exist_ok=True)
+    results_file = os.path.join(args.results_directory, f"{name}_results.json")
+    with profile_stage("sink"):
+        sensitivity_results.write_json(results_file)
+    if not args.no_excel:
+        write_results_to_template_excel_file(sensitivity_results, os.path.join(args.results_directory, f"{name}.xlsx"))
+    logging.info(f"Sensitivity analysis {name} complete")
+
+
+def run(args: argparse.Namespace) -> None:
+    from src.gem.incremental_runs import run_sensitivity
+    from src.helpers.base_assessment_cache import load_base_assessments
+    from src.helpers.failure_archive import failure_archive_path
+    from src.helpers.run_history import record_run_history
+    from src.helpers.run_status import run_status
+    from src.models.gem_assessments import SensitivityResults
+
+    config = _load_config(args.config)
+    base_assessments = load_base_assessments(_cache_path(args))
+    previous_results = None
+    if args.previous_results is not None:
+        with open(args.previous_results, encoding="utf-8") as f:
+            previous_results = SensitivityResults(**json.load(f))
+    # Progress is written to results/<name>_status.json, and served over HTTP when GEM_STATUS_PORT is set
+    start_time = time.time()
+    with run_status(args.name, args.results_directory):
+        sensitivity_results = run_sensitivity(
+            base_assessments,
+            config,
+            previous_results,
+            batch_size=args.batch_size,
+            failure_archive_file=failure_archive_path(args.name),
+        )
+    duration_seconds = time.time() - start_time
+    _write_results(sensitivity_results, args.name, args)
+    record_run_history(args.name, sensitivity_results, config, duration_seconds)
+
+
+def run_many(args: argparse.Namespace) -> None:
+    from src.gem.gem_service import get_base_gem_assessments
+    from src.gem.multi_analysis import Analysis, run_analyses
+    from src.helpers.base_assessment_cache import (
+        base_assessment_cache_path,
+        load_base_assessments,
+        save_base_assessments,
+    )
+    from src.helpers.run_history import record_run_history
+    from src.helpers.run_status import run_status
+    from src.models.settings import MultiAnalysisSettings
+
+    with open(args.analyses, encoding="utf-8") as f:
+        settings = MultiAnalysisSettings(**json.load(f))
+    analyses = []
+    configs = {}
+    for analysis_settings in settings.analyses:
+        config = configs[analysis_settings.name] = _load_config(analysis_settings.config)
+        cache_path = base_assessment_cache_path(args.results_directory, analysis_settings.name)
+        if args.refresh or not os.path.exists(cache_path):
+            save_base_assessments(get_base_gem_assessments(config), cache_path)
+        analyses.append(
+            Analysis(analysis_settings.name, config, load_base_assessments(cache_path), analysis_settings.weight)
+        )
+
+    name = args.name or os.path.splitext(os.path.basename(args.analyses))[0]
+    start_time = time.time()
+    with run_status(name, args.results_directory):
+        completed = run_analyses(analyses, batch_size=args.batch_size)
+    duration_seconds = time.time() - start_time
+    for analysis_name, sensitivity_results in completed.items():
+        _write_results(sensitivity_results, analysis_name, args)
+        record_run_history(analysis_name, sensitivity_results, configs[analysis_name], duration_seconds)
+    failed = [analysis.name for analysis in analyses if analysis.name not in completed]
+    if failed:
+        raise SystemExit(f"Analyses failed: {', '.join(failed)}")
+
+
+def export(args: argparse.Namespace) -> None:
+    from src.helpers.results_loader import iter_results_file
+    from src.helpers.write_to_excel_template import write_results_to_template_excel_file, write_sharded_excel_files
+    from src.models.enums.export_shards import ExportShardBy
+
+    file_path = os.path.join(args.results_directory, f"{args.name}_results.json")
+    logging.info(f"Streaming results from {file_path}")
+    results = iter_results_file(
+        file_path,
+        scenarios=set(args.scenario) if args.scenario else None,
+        project_ids=set(args.project_id) if args.project_id else None,
+    )
+    if args.shard_by is not None:
+        shard_by = ExportShardBy(args.shard_by)
+        write_sharded_excel_files(
+            results, os.path.join(args.results_directory, f"{args.name}_{shard_by.value}"), args.name, shard_by
+        )
+    else:
+        write_results_to_template_excel_file(results, os.path.join(args.results_directory, f"{args.name}.xlsx"))
+
+
+def plan(args: argparse.Namespace) -> None:
+    from src.helpers.base_assessment_cache import load_base_assessments
+    from src.helpers.latency_history import load_latency_history
+    from src.helpers.run_planner import PlanSettings, enforce_plan_limits, format_run_plan, plan_sensitivity_run
+
+    config = _load_config(args.config)
+    base_assessments = load_base_assessments(_cache_path(args))
+    settings = PlanSettings()  # type: ignore
+
+    run_plan = plan_sensitivity_run(base_assessments, config, load_latency_history(), args.batch_size, settings)
+    logging.info(format_run_plan(run_plan))
+    enforce_plan_limits(run_plan, settings)
+
+
+def ingest(args: argparse.Namespace) -> None:
+    from src.helpers.results_loader import iter_results_file, read_results_metadata
+    from src.helpers.run_history import HistorySettings, RunHistory, config_hash
+
+    settings = HistorySettings()  # type: ignore
+    file_path = os.path.join(args.results_directory, f"{args.name}_results.json")
+    RunHistory(settings.file).record_run(
+        args.name,
+        iter_results_file(file_path),
+        read_results_metadata(file_path),
+        config_hash(_load_config(args.config)) if args.config else None,
+    )
+
+
+def history(args: argparse.Namespace) -> None:
+    from src.helpers.run_history import HistorySettings, RunHistory, format_runs
+
+    settings = HistorySettings()  # type: ignore
+    logging.info(format_runs(RunHistory(settings.file).runs(args.name, args.last)))
+
+
+def trend(args: argparse.Namespace) -> None:
+    from src.helpers.run_history import HistorySettings, RunHistory, format_trend, write_trend_csv
+
+    settings = HistorySettings()  # type: ignore
+    points = RunHistory(settings.file).trend(
+        args.project_id, args.kpi, args.scenario, dict(args.component or []), args.name, args.last
+    )
+    logging.info(format_trend(points, args.kpi))
+    if args.output:
+        write_trend_csv(points, args.output, args.kpi)
+
+
+def _component_value(text: str) -> tuple["ScenarioComponents", float]:
+    from src.models.enums.sensitivities import ScenarioComponents
+
+    component, separator, value = text.partition("=")
+    try:
+        return ScenarioComponents(component), float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected <component>=<value>, e.g. power_prices=-0.1, got {text}") from None
+
+
+def _add_analysis_arguments(parser: argparse.ArgumentParser, config: bool = True) -> None:
+    parser.add_argument("--name", required=True, help="Analysis name, used for the cache and results file names")
+    parser.add_argument("--results-directory", default=RESULTS_DIRECTORY)
+    if config:
+        parser.add_argument("--config", required=True, help="Sensitivity JSON, e.g. examples/solarmax_scenario.json")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="GEM sensitivity analysis")
+    parser.add_argument("--log-file", help="Write the log to this file instead of the console")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands_and_help: list[tuple[str, Callable[[argparse.Namespace], None], str]] = [
+        (
+            "fetch",
+            fetch,
+            "Fetch the live assessments of the configured folder and cache them as base assessments",
+        ),
+        ("build", build, "Fetch the design file's projects and cache one base assessment per design"),
+        ("run", run, "Calculate every scenario for the cached base assessments and write the results"),
+        (
+            "run-many",
+            run_many,
+            "Run several analyses at once, sharing the engine capacity between them by weight",
+        ),
+        ("export", export, "Write an existing results JSON to Excel (offline)"),
+        ("plan", plan, "Estimate engine calls, memory and wall time for the cached base assessments (offline)"),
+        ("ingest", ingest, "Add an existing results JSON to the run history"),
+        ("history", history, "List the runs in the run history"),
+        ("trend", trend, "Show how a project's KPI moved across the runs in the run history"),
+    ]
+    subparsers = {}
+    for name, handler, help_text in commands_and_help:
+        subparsers[name] = commands.add_parser(name, help=help_text, description=help_text)
+        subparsers[name].set_defaults(handler=handler)
+
+    _add_analysis_arguments(subparsers["fetch"])
+
+    _add_analysis_arguments(subparsers["build"], config=False)
+    subparsers["build"].add_argument("--designs", default=DESIGN_FILE)
+    subparsers["build"].add_argument("--solarmax-directory", default=SOLARMAX_CSV_DIRECTORY)
+    subparsers["build"].add_argument("--drop-duplicate-designs", action="store_true")
+    subparsers["build"].add_argument(
+        "--pareto-designs",
+        action="store_true",
+        help="Only keep designs for which no other design has at least as much capacity and yield on no more land",
+    )
+
+    _add_analysis_arguments(subparsers["run"])
+    subparsers["run"].add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    subparsers["run"].add_argument(
+        "--previous-results", help="Previous *_results.json, only missing assessments are calculated"
+    )
+    subparsers["run"].add_argument("--no-excel", action="store_true")
+
+    subparsers["run-many"].add_argument(
+        "--analyses", required=True, help="Analyses JSON, e.g. examples/multi_analysis.json"
+    )
+    subparsers["run-many"].add_argument("--name", help="Name of the combined status file, defaults to the file name")
+    subparsers["run-many"].add_argument("--results-directory", default=RESULTS_DIRECTORY)
+    subparsers["run-many"].add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    subparsers["run-many"].add_argument(
+        "--refresh", action="store_true", help="Fetch base assessments even when a cached copy exists"
+    )
+    subparsers["run-many"].add_argument("--no-excel", action="store_true")
+
+    _add_analysis_arguments(subparsers["export"], config=False)
+    subparsers["export"].add_argument("--scenario", action="append", help="Only export this scenario, repeatable")
+    subparsers["export"].add_argument("--project-id", action="append", help="Only export this project, repeatable")
+    subparsers["export"].add_argument("--shard-by", choices=["scenario", "portfolio"])
+
+    _add_analysis_arguments(subparsers["plan"])
+    subparsers["plan"].add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    _add_analysis_arguments(subparsers["ingest"], config=False)
+    subparsers["ingest"].add_argument("--config", help="Sensitivity JSON the results were run with, for its hash")
+
+    subparsers["history"].add_argument("--name", help="Only list runs of this analysis")
+    subparsers["history"].add_argument("--last", type=int, help="Only list the most recent runs")
+
+    subparsers["trend"].add_argument("--project-id", required=True)
+    subparsers["trend"].add_argument(
+        "--kpi", default="development_fee", help="Result field or GEM_ADDITIONAL_KPIS name"
+    )
+    subparsers["trend"].add_argument("--scenario")
+    subparsers["trend"].add_argument(
+        "--component",
+        action="append",
+        type=_component_value,
+        help="Only combinations with this component value, e.g. power_prices=-0.1, repeatable",
+    )
+    subparsers["trend"].add_argument("--name", help="Only runs of this analysis")
+    subparsers["trend"].add_argument("--last", type=int, help="Only the most recent runs")
+    subparsers["trend"].add_argument("--output", help="Also write the trend to this CSV file")
+    return parser
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    args = build_parser().parse_args(argv)
+    handler: logging.Handler = (
+        logging.FileHandler(args.log_file, mode="a") if args.log_file else logging.StreamHandler()
+    )
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        handlers=[handler],
+    )
+    from src.helpers.run_profiler import run_profile
+
+    # GEM_PROFILE=true writes stage timings, stack samples and memory snapshots to profiles/<run_id>/
+    with run_profile(args.command):
+        args.handler(args)
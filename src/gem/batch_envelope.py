@@ -0,0 +1,109 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from copy import deepcopy
+from typing import Any
+
+from pydantic import BaseModel
+
+from src.models.gem_assessments import IndividualSensitivityInput, project_key
+
+Path = list[str | int]
+
+
+class EngineInputDelta(BaseModel):
+    path: Path
+    value: Any = None
+    remove: bool = False
+    truncate: int | None = None
+
+
+class BatchEnvelope(BaseModel):
+    base: dict[str, Any]
+    assessments: list[list[EngineInputDelta]]
+
+
+def diff_engine_inputs(base: Any, other: Any, path: Path | None = None) -> list[EngineInputDelta]:
+    path = path or []
+    if isinstance(base, dict) and isinstance(other, dict):
+        deltas = [EngineInputDelta(path=[*path, key], remove=True) for key in base if key not in other]
+        for key, value in other.items():
+            if key in base:
+                deltas.extend(diff_engine_inputs(base[key], value, [*path, key]))
+            else:
+                deltas.append(EngineInputDelta(path=[*path, key], value=value))
+        return deltas
+    if isinstance(base, list) and isinstance(other, list):
+        # Modifiers mostly append to lists, so compare the common prefix and send only the tail
+        deltas = []
+        for index, (base_item, other_item) in enumerate(zip(base, other)):
+            deltas.extend(diff_engine_inputs(base_item, other_item, [*path, index]))
+        if len(other) < len(base):
+            deltas.append(EngineInputDelta(path=path, truncate=len(other)))
+        for index in range(len(base), len(other)):
+            deltas.append(EngineInputDelta(path=[*path, index], value=other[index]))
+        return deltas
+    # Types are compared too so that an int replaced by an equal float is still sent
+    if type(base) is type(other) and base == other:
+        return []
+    return [EngineInputDelta(path=path, value=other)]
+
+
+def apply_engine_input_deltas(base: dict[str, Any], deltas: list[EngineInputDelta]) -> dict[str, Any]:
+    engine_input = deepcopy(base)
+    for delta in deltas:
+        if not delta.path:
+            engine_input = deepcopy(delta.value)
+            continue
+        parent: Any = engine_input
+        for key in delta.path[:-1]:
+            parent = parent[key]
+        last = delta.path[-1]
+        if delta.truncate is not None:
+            del parent[last][delta.truncate :]
+        elif delta.remove:
+            del parent[last]
+        elif isinstance(parent, list) and last == len(parent):
+            parent.append(deepcopy(delta.value))
+        else:
+            parent[last] = deepcopy(delta.value)
+    return engine_input
+
+
+def pack_batch_envelope(engine_inputs: list[dict[str, Any]]) -> BatchEnvelope:
+    base = engine_inputs[0]
+    return BatchEnvelope(
+        base=base, assessments=[diff_engine_inputs(base, engine_input) for engine_input in engine_inputs]
+    )
+
+
+def unpack_batch_envelope(envelope: BatchEnvelope) -> list[dict[str, Any]]:
+    return [apply_engine_input_deltas(envelope.base, deltas) for deltas in envelope.assessments]
+
+
+def group_into_envelopes(assessments: list[IndividualSensitivityInput], envelope_size: int) -> list[list[int]]:
+    # Only inputs for the same project share enough structure to be worth packing together
+    groups: dict[str, list[int]] = {}
+    for index, assessment in enumerate(assessments):
+        if assessment.engine_input_json is not None:
+            groups.setdefault(project_key(assessment), []).append(index)
+    return [
+        indices[start : start + envelope_size]
+        for indices in groups.values()
+        for start in range(0, len(indices), envelope_size)
+    ]
+
+
+async def evaluate_batch_envelope_locally(
+    envelope: BatchEnvelope, calculate: Callable[[dict[str, Any]], Awaitable[tuple[dict, float]]]
+) -> list[dict[str, Any]]:
+    # Stand-in for an engine batch endpoint, it unpacks the envelope and calculates each assessment individually.
+    # The items run concurrently, so each one carries its own latency rather than a share of the envelope's
+    results = await asyncio.gather(
+        *(calculate(engine_input) for engine_input in unpack_batch_envelope(envelope)), return_exceptions=True
+    )
+    return [
+        {"error": str(result)}
+        if isinstance(result, BaseException)
+        else {"result": result[0], "latency_seconds": result[1]}
+        for result in results
+    ]
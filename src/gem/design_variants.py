@@ -0,0 +1,54 @@
+import logging
+import time
+from collections.abc import Generator
+from typing import Any
+
+from src.gem.gem_service import get_project_assessments
+from src.helpers.format_time_taken import format_time_taken
+from src.models.designs import DesignOption, ProjectAndAssessmentIds
+from src.models.gem_assessments import BaseAssessment
+
+logger = logging.getLogger(__name__)
+
+
+def design_engine_input(engine_input: dict[str, Any], design: DesignOption) -> dict[str, Any]:
+    # Same overrides as the energy yield, DC/AC capacity and land area modifiers, but only the dicts that change are
+    # copied. Every other sub-tree is shared with the base input, build_sensitivity_input deep-copies before adjusting.
+    adjusted_input = dict(engine_input)
+    energy_yield_information = dict(adjusted_input["energy_yield_information"])
+    energy_yield_information.pop("monthly_profile", None)
+    energy_yield_information["energy_yield_per_year_MWh"] = design.energy_yield
+    adjusted_input["energy_yield_information"] = energy_yield_information
+    adjusted_input["total_module_rated_power_mw"] = design.installed_capacity_dc
+    if design.installed_capacity_ac is not None:
+        adjusted_input["installed_ac_capacity"] = design.installed_capacity_ac
+    if design.land_area is not None:
+        adjusted_input["project_land_area"] = design.land_area
+    return adjusted_input
+
+
+def create_design_assessment(base_assessment: BaseAssessment, design: DesignOption) -> BaseAssessment:
+    if base_assessment.engine_input_json is None:
+        raise ValueError("Base assessment has no engine input")
+    return BaseAssessment(
+        project_id=base_assessment.project_id,
+        project_name=f"{base_assessment.project_name} - Design: {design.name}",
+        technology=base_assessment.technology,
+        phase=base_assessment.phase,
+        country=base_assessment.country,
+        currency=base_assessment.currency,
+        engine_input_json=design_engine_input(base_assessment.engine_input_json, design),
+    )
+
+
+def iter_design_base_assessments(
+    project_and_assessment_ids: list[ProjectAndAssessmentIds], designs: dict[int, list[DesignOption]]
+) -> Generator[BaseAssessment]:
+    # Projects are fetched concurrently, each project's variants are built as soon as its assessment arrives
+    start_time = time.time()
+    built = 0
+    for ids, base_assessment in zip(project_and_assessment_ids, get_project_assessments(project_and_assessment_ids)):
+        for design in designs[ids.project_id]:
+            yield create_design_assessment(base_assessment, design)
+            built += 1
+    logging.info(f"Built {built} design assessments in {format_time_taken(time.time() - start_time)}")
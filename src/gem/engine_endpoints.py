@@ -0,0 +1,268 @@
+import asyncio
+import importlib.util
+import logging
+import ssl
+import statistics
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+import certifi
+import httpx
+
+from src.gem.fair_share import FairShareScheduler, current_share
+from src.helpers.format_time_taken import format_time_taken
+from src.helpers.traffic_recorder import TrafficNotRecordedError, TrafficTransport, get_traffic_recorder
+from src.models.env_variables_config import EngineEndpointSettings, EnvironmentVariableSettings
+
+logger = logging.getLogger(__name__)
+
+FAILURE_THRESHOLD = 5
+EJECTION_SECONDS = 60.0
+MAX_EJECTION_SECONDS = 15 * 60.0
+HEALTH_CHECK_TIMEOUT_SECONDS = 30
+MAX_LATENCY_SAMPLES = 10_000
+REQUEST_TIMEOUT_SECONDS = 360
+
+# Shared by every engine client so the CA bundle is loaded once and TLS sessions are reused across connections
+_SSL_CONTEXT = ssl.create_default_context(cafile=certifi.where())
+
+
+def _p95(samples: list[float]) -> float:
+    if len(samples) < 2:
+        return samples[0] if samples else 0.0
+    return statistics.quantiles(samples, n=20, method="inclusive")[-1]
+
+
+def _is_endpoint_failure(error: Exception) -> bool:
+    # Rejected inputs are the caller's fault, only throttling, server and transport errors count against an endpoint
+    if isinstance(error, TrafficNotRecordedError):
+        return False
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return True
+
+
+class EngineEndpoint:
+    def __init__(self, name: str, settings: EngineEndpointSettings) -> None:
+        self.name = name
+        self.url = settings.url
+        self.key = settings.key
+        self.weight = settings.weight
+        self.max_concurrency = settings.max_concurrency
+        self.batch_url = settings.batch_url
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.ejection_seconds = EJECTION_SECONDS
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+        self.latencies: list[float] = []
+        self.pool_waits: list[float] = []
+
+    def is_available(self, now: float) -> bool:
+        return self.ejected_until <= now and self.outstanding < self.max_concurrency
+
+    def load(self) -> float:
+        return (self.outstanding + 1) / self.weight
+
+    def record_success(self, latency: float) -> None:
+        self.requests += 1
+        self.consecutive_failures = 0
+        self.ejection_seconds = EJECTION_SECONDS
+        if len(self.latencies) < MAX_LATENCY_SAMPLES:
+            self.latencies.append(latency)
+
+    def record_failure(self) -> None:
+        self.requests += 1
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= FAILURE_THRESHOLD:
+            self.eject()
+
+    def eject(self) -> None:
+        self.ejected_until = time.time() + self.ejection_seconds
+        self.ejections += 1
+        logging.warning(
+            f"Ejecting engine endpoint {self.name} for {format_time_taken(self.ejection_seconds)} "
+            f"after {self.consecutive_failures} consecutive failures"
+        )
+        # Back off further if the endpoint fails again as soon as it is readmitted
+        self.ejection_seconds = min(self.ejection_seconds * 2, MAX_EJECTION_SECONDS)
+        self.consecutive_failures = FAILURE_THRESHOLD - 1
+
+    def reset_metrics(self) -> None:
+        self.requests = 0
+        self.failures = 0
+        self.latencies = []
+        self.pool_waits = []
+
+    def record_pool_wait(self, wait: float) -> None:
+        if len(self.pool_waits) < MAX_LATENCY_SAMPLES:
+            self.pool_waits.append(wait)
+
+    def metrics_text(self) -> str:
+        mean_latency = statistics.fmean(self.latencies) if self.latencies else 0.0
+        mean_pool_wait = statistics.fmean(self.pool_waits) if self.pool_waits else 0.0
+        return (
+            f"Endpoint {self.name}: {self.requests} requests | {self.failures} failures | "
+            f"{self.ejections} ejections | Mean server latency: {format_time_taken(mean_latency)} | "
+            f"P95 server latency: {format_time_taken(_p95(self.latencies))} | "
+            f"Mean pool wait: {format_time_taken(mean_pool_wait)} | "
+            f"P95 pool wait: {format_time_taken(_p95(self.pool_waits))}"
+        )
+
+
+class EnginePool:
+    def __init__(self, endpoint_settings: list[EngineEndpointSettings]) -> None:
+        if not endpoint_settings:
+            raise ValueError("At least one calculation engine endpoint is required")
+        self.endpoints = [
+            EngineEndpoint(f"{i} ({httpx.URL(settings.url).host})", settings)
+            for i, settings in enumerate(endpoint_settings, start=1)
+        ]
+        self._condition = asyncio.Condition()
+        self._condition_loop: asyncio.AbstractEventLoop | None = None
+        # Shares the pool's slots between concurrent analyses, requests outside an analysis are not scheduled
+        self.scheduler: FairShareScheduler | None = None
+
+    @property
+    def max_concurrency(self) -> int:
+        return sum(endpoint.max_concurrency for endpoint in self.endpoints)
+
+    def available_capacity(self) -> int:
+        # Slots on endpoints that are not ejected, which is all the pool can serve right now
+        now = time.time()
+        return sum(endpoint.max_concurrency for endpoint in self.endpoints if endpoint.ejected_until <= now)
+
+    @property
+    def supports_batching(self) -> bool:
+        return all(endpoint.batch_url for endpoint in self.endpoints)
+
+    def _get_condition(self) -> asyncio.Condition:
+        # A pool can outlive the event loop of one batch group, nothing is outstanding between loops so a fresh
+        # condition is safe
+        loop = asyncio.get_running_loop()
+        if self._condition_loop is not loop:
+            self._condition = asyncio.Condition()
+            self._condition_loop = loop
+        return self._condition
+
+    def _select(self, now: float) -> EngineEndpoint | None:
+        available = [endpoint for endpoint in self.endpoints if endpoint.is_available(now)]
+        if not available:
+            return None
+        return min(available, key=lambda endpoint: endpoint.load())
+
+    def _seconds_until_readmission(self, now: float) -> float | None:
+        ejected = [endpoint.ejected_until - now for endpoint in self.endpoints if endpoint.ejected_until > now]
+        # Only wake on a timer when every endpoint is ejected, otherwise a release will notify us
+        if len(ejected) < len(self.endpoints):
+            return None
+        return max(min(ejected), 0.0)
+
+    async def acquire(self) -> EngineEndpoint:
+        condition = self._get_condition()
+        async with condition:
+            while True:
+                now = time.time()
+                endpoint = self._select(now)
+                if endpoint is not None:
+                    endpoint.outstanding += 1
+                    return endpoint
+                timeout = self._seconds_until_readmission(now)
+                try:
+                    await asyncio.wait_for(condition.wait(), timeout)
+                except TimeoutError:
+                    continue
+
+    async def release(self, endpoint: EngineEndpoint) -> None:
+        condition = self._get_condition()
+        async with condition:
+            endpoint.outstanding -= 1
+            condition.notify()
+
+    @asynccontextmanager
+    async def endpoint(self) -> AsyncIterator[EngineEndpoint]:
+        # Time spent waiting for a free slot is kept apart from the engine's own latency
+        wait_start_time = time.time()
+        share = current_share.get() if self.scheduler is not None else None
+        if self.scheduler is not None and share is not None:
+            await self.scheduler.acquire(share)
+        try:
+            endpoint = await self.acquire()
+        except BaseException:
+            if self.scheduler is not None and share is not None:
+                self.scheduler.release()
+            raise
+        start_time = time.time()
+        endpoint.record_pool_wait(start_time - wait_start_time)
+        try:
+            yield endpoint
+        except Exception as e:
+            if _is_endpoint_failure(e):
+                endpoint.record_failure()
+            else:
+                endpoint.record_success(time.time() - start_time)
+            raise
+        else:
+            endpoint.record_success(time.time() - start_time)
+        finally:
+            await self.release(endpoint)
+            if self.scheduler is not None and share is not None:
+                self.scheduler.release()
+
+    async def check_health(self, client: httpx.AsyncClient) -> None:
+        async def _check(endpoint: EngineEndpoint) -> None:
+            try:
+                response = await client.get(
+                    endpoint.url, headers={"x-functions-key": endpoint.key}, timeout=HEALTH_CHECK_TIMEOUT_SECONDS
+                )
+            except httpx.HTTPError as e:
+                logging.warning(f"Health check failed for engine endpoint {endpoint.name}: {e}")
+                endpoint.consecutive_failures = FAILURE_THRESHOLD
+                endpoint.eject()
+                return
+            # The function only accepts POST, so anything other than a server error means it is reachable
+            if response.status_code >= 500:
+                logging.warning(f"Health check failed for engine endpoint {endpoint.name}: {response.status_code}")
+                endpoint.consecutive_failures = FAILURE_THRESHOLD
+                endpoint.eject()
+
+        await asyncio.gather(*(_check(endpoint) for endpoint in self.endpoints))
+
+    def reset_metrics(self) -> None:
+        for endpoint in self.endpoints:
+            endpoint.reset_metrics()
+
+    def log_metrics(self) -> None:
+        for endpoint in self.endpoints:
+            logging.info(endpoint.metrics_text())
+
+
+def build_engine_http_client(pool: EnginePool, settings: EnvironmentVariableSettings) -> httpx.AsyncClient:
+    # Connections are sized to the endpoint caps, so requests queue in the pool rather than inside httpx
+    max_connections = settings.gem_http_max_connections or pool.max_concurrency
+    http2 = settings.gem_http2
+    if http2 and importlib.util.find_spec("h2") is None:
+        logging.warning("GEM_HTTP2 is enabled but the h2 package is not installed. Falling back to HTTP/1.1")
+        http2 = False
+    logging.info(f"Engine HTTP client: {max_connections} connections, HTTP/2 {'on' if http2 else 'off'}")
+    transport: httpx.AsyncBaseTransport = httpx.AsyncHTTPTransport(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=settings.gem_http_keepalive_expiry,
+        ),
+        http2=http2,
+        verify=_SSL_CONTEXT,
+    )
+    # GEM_TRAFFIC_MODE records engine responses, or serves them back without touching the network
+    recorder = get_traffic_recorder()
+    if recorder is not None:
+        transport = TrafficTransport(transport, recorder)
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(REQUEST_TIMEOUT_SECONDS, pool=settings.gem_http_pool_timeout),
+        transport=transport,
+    )
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from collections.abc import Callable
+from contextvars import ContextVar
+
+from src.helpers.format_time_taken import format_time_taken
+
+logger = logging.getLogger(__name__)
+
+# While requests wait, capacity is re-checked this often so an endpoint readmitted after ejection is used again
+CAPACITY_POLL_SECONDS = 1.0
+
+# Name of the analysis the current task calculates for, tasks created inside an analysis inherit it
+current_share: ContextVar[str | None] = ContextVar("current_share", default=None)
+
+
+class Share:
+    def __init__(self, name: str, weight: float) -> None:
+        if weight <= 0:
+            raise ValueError(f"Weight of {name} must be positive, got {weight}")
+        self.name = name
+        self.weight = weight
+        self.finish_tag = 0.0
+        self.waiters: deque[asyncio.Future[None]] = deque()
+        self.granted = 0
+        self.wait_seconds = 0.0
+
+
+# Weighted fair queueing of the engine slots between analyses. Each grant advances the analysis' virtual finish tag
+# by 1 / weight and a free slot goes to the waiting analysis with the smallest tag, so analyses with work queued get
+# slots in proportion to their weights. An analysis that becomes busy again starts from the current virtual time
+# rather than claiming the slots it did not use while idle. Capacity is read on every grant, so while endpoints are
+# ejected the excess requests wait here in weighted order rather than in the pool in arrival order.
+class FairShareScheduler:
+    def __init__(self, capacity: Callable[[], int]) -> None:
+        self.capacity = capacity
+        self.shares: dict[str, Share] = {}
+        self._in_use = 0
+        self._virtual_time = 0.0
+        self._poll: asyncio.TimerHandle | None = None
+
+    def add(self, name: str, weight: float = 1.0) -> None:
+        if name in self.shares:
+            raise ValueError(f"Share {name} is already registered")
+        self.shares[name] = Share(name, weight)
+
+    def _activate(self, share: Share) -> None:
+        if not share.waiters:
+            share.finish_tag = max(share.finish_tag, self._virtual_time)
+
+    def _grant(self, share: Share) -> None:
+        self._virtual_time = max(self._virtual_time, share.finish_tag)
+        share.finish_tag += 1 / share.weight
+        share.granted += 1
+        self._in_use += 1
+
+    def _waiting(self) -> list[Share]:
+        for share in self.shares.values():
+            # Waiters cancelled before their turn are dropped here
+            while share.waiters and share.waiters[0].done():
+                share.waiters.popleft()
+        return [share for share in self.shares.values() if share.waiters]
+
+    def _dispatch(self) -> None:
+        while waiting := self._waiting():
+            if self._in_use >= self.capacity():
+                # Releases dispatch again, the poll covers readmissions while nothing is released
+                if self._poll is None:
+                    self._poll = asyncio.get_running_loop().call_later(CAPACITY_POLL_SECONDS, self._poll_capacity)
+                return
+            share = min(waiting, key=lambda share: share.finish_tag + 1 / share.weight)
+            self._grant(share)
+            share.waiters.popleft().set_result(None)
+
+    def _poll_capacity(self) -> None:
+        self._poll = None
+        self._dispatch()
+
+    async def acquire(self, name: str) -> None:
+        share = self.shares[name]
+        self._activate(share)
+        if not self._waiting() and self._in_use < self.capacity():
+            self._grant(share)
+            return
+        wait_start_time = time.time()
+        future = asyncio.get_running_loop().create_future()
+        share.waiters.append(future)
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                if future in share.waiters:
+                    share.waiters.remove(future)
+            else:
+                # The slot was granted just before the cancellation, so hand it on
+                self.release()
+            raise
+        finally:
+            share.wait_seconds += time.time() - wait_start_time
+
+    def release(self) -> None:
+        self._in_use -= 1
+        self._dispatch()
+
+    def log_metrics(self) -> None:
+        total_granted = sum(share.granted for share in self.shares.values())
+        total_weight = sum(share.weight for share in self.shares.values())
+        for share in self.shares.values():
+            logging.info(
+                f"Analysis {share.name}: weight {share.weight:g} ({share.weight / total_weight:.0%} fair share), "
+                f"{share.granted} engine requests ({share.granted / max(total_granted, 1):.0%}), "
+                f"mean slot wait {format_time_taken(share.wait_seconds / max(share.granted, 1))}"
+            )
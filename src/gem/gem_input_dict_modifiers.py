@@ -7,6 +7,7 @@ from typing import Any, Literal
 
 from dateutil import relativedelta
 
+from src.models.engine_input_index import EngineInputIndex
 from src.models.enums.sensitivities import ScenarioComponents, SensitivityTypes
 from src.models.settings import SensitivitySettings
 
@@ -114,7 +115,7 @@ def apply_energy_yield_sensitivity(
         return input_json
 
     def _override(input_json: dict, energy_yield_adjustment: float) -> dict:
-        input_json["energy_yield_information"].pop("monthly_profile")
+        input_json["energy_yield_information"].pop("monthly_profile", None)
         input_json["energy_yield_information"]["energy_yield_per_year_MWh"] = energy_yield_adjustment
         return input_json
 
@@ -247,7 +248,11 @@ def apply_capex_sensitivity(
 
 
 def apply_opex_adjustment(
-    engine_input_json: dict, opex_adjustment: float, sensitivity_type: SensitivityTypes, config: SensitivitySettings
+    engine_input_json: dict,
+    opex_adjustment: float,
+    sensitivity_type: SensitivityTypes,
+    config: SensitivitySettings,
+    index: EngineInputIndex | None = None,
 ) -> dict:
     def _adjustment(input_dict: dict, opex_adjustment: float) -> dict:
         opex_calculators = {"GENERIC_OPEX", "LAND_OPEX"}
@@ -283,8 +288,22 @@ def apply_opex_adjustment(
 
         return input_dict
 
+    def _indexed_adjustment(input_dict: dict, opex_adjustment: float, index: EngineInputIndex) -> dict:
+        risk_factor = 1 + opex_adjustment
+        calculators = input_dict.get("calculators", [])
+        for calculator_position, item_position in index.opex_items:
+            calculators[calculator_position]["items"][item_position]["risk_factor"] = risk_factor
+
+        turbine_groups = input_dict.get("turbine_groups") or []
+        for group_position, key in index.o_and_m_tables:
+            costs = turbine_groups[group_position]["turbine_o_and_m"][key]
+            costs.update(zip(costs, [cost * risk_factor for cost in costs.values()]))
+        return input_dict
+
     input_json = deepcopy(engine_input_json)
     if sensitivity_type is SensitivityTypes.PERCENTAGE_ADJUSTMENT:
+        if index is not None and index.opex_indexed:
+            return _indexed_adjustment(input_json, opex_adjustment, index)
         return _adjustment(input_json, opex_adjustment)
     else:
         raise ValueError("Opex adjustment must be a percentage adjustment")
@@ -327,7 +346,11 @@ def apply_inflation_sensitivity(
 
 
 def apply_lifetime_sensitivity(
-    engine_input_json: dict, lifetime_adjustment: int, sensitivity_type: SensitivityTypes, config: SensitivitySettings
+    engine_input_json: dict,
+    lifetime_adjustment: int,
+    sensitivity_type: SensitivityTypes,
+    config: SensitivitySettings,
+    index: EngineInputIndex | None = None,
 ) -> dict:
     def _adjustment(input_json: dict, lifetime_adjustment: int) -> dict:
         input_json["operational_lifetime_years"] = int(input_json["operational_lifetime_years"] + lifetime_adjustment)
@@ -344,9 +367,27 @@ def apply_lifetime_sensitivity(
                 )
         return input_json
 
+    def _indexed_adjustment(input_json: dict, lifetime_adjustment: int, index: EngineInputIndex) -> dict:
+        input_json["operational_lifetime_years"] = int(input_json["operational_lifetime_years"] + lifetime_adjustment)
+        calculators = input_json["calculators"]
+        for position in index.lifetime_calculators:
+            calculator = calculators[position]
+            calculator["operational_lifetime_years"] = int(
+                calculator["operational_lifetime_years"] + lifetime_adjustment
+            )
+        energy_loss_calculators = input_json["energy_yield_information"].get("energy_loss_calculators", [])
+        for position in index.lifetime_energy_loss_calculators:
+            calculator = energy_loss_calculators[position]
+            calculator["operational_lifetime_years"] = int(
+                calculator["operational_lifetime_years"] + lifetime_adjustment
+            )
+        return input_json
+
     input_json = deepcopy(engine_input_json)
 
     if sensitivity_type is SensitivityTypes.GENERIC_ADDER:
+        if index is not None and index.lifetime_indexed:
+            return _indexed_adjustment(input_json, lifetime_adjustment, index)
         return _adjustment(input_json, lifetime_adjustment)
     else:
         raise ValueError("Lifetime adjustment must be a generic adder")
@@ -386,4 +427,12 @@ ADJUSTMENT_FUNCS: dict[ScenarioComponents, Callable[[dict, Any, SensitivityTypes
     ScenarioComponents.FINANCIAL_CLOSE_DATE: apply_financial_close_date_sensitivity,
 }
 
+# Modifiers that can use the base assessment's precomputed EngineInputIndex
+INDEXED_ADJUSTMENT_FUNCS: dict[
+    ScenarioComponents, Callable[[dict, Any, SensitivityTypes, SensitivitySettings, EngineInputIndex | None], dict]
+] = {
+    ScenarioComponents.ALL_OPEX: apply_opex_adjustment,
+    ScenarioComponents.OPERATIONAL_LIFETIME: apply_lifetime_sensitivity,
+}
+
 logger.debug(f"Adjustment functions loaded: {ADJUSTMENT_FUNCS}")
@@ -1,20 +1,34 @@
 import asyncio
+import json
 import logging
-import os
 import time
-import uuid
-from collections.abc import Generator
+from collections.abc import Awaitable, Generator
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from datetime import date, datetime
+from functools import lru_cache, partial
+from typing import TypeVar
 
 import httpx
 from resgem import GemApiClient, GemApiClientException
 from resgem.models import AssessmentModel
-from tenacity import before_sleep_log, retry, stop_after_attempt, wait_exponential
-
+from tenacity import before_sleep_log, retry, retry_if_not_exception_type, stop_after_attempt, wait_exponential
+
+from src.gem.batch_envelope import evaluate_batch_envelope_locally, group_into_envelopes, pack_batch_envelope
+from src.gem.engine_endpoints import EnginePool, build_engine_http_client
+from src.gem.preflight_validation import log_rejection_summary, preflight_rejection
+from src.gem.result_extraction import GEM_RESULT_KPIS, ResultExtractor
+from src.gem.warm_up import save_warm_up_statistics, select_warm_up_input, warm_up_engine
+from src.helpers.failure_archive import FAILURE_ARCHIVE_FILE, FailureArchive
 from src.helpers.format_time_taken import format_time_taken
+from src.helpers.latency_history import LatencyHistory, load_latency_history, save_latency_history
+from src.helpers.run_profiler import profile_snapshot, profile_stage
+from src.helpers.run_status import status_dispatch, status_eta_seconds, status_fail, status_finish
+from src.helpers.task_ordering import longest_expected_first_order
+from src.helpers.traffic_recorder import RecordedResponse, TrafficNotRecordedError, get_traffic_recorder
+from src.models.designs import ProjectAndAssessmentIds
 from src.models.enums.error_reasons import ErrorReasons
-from src.models.env_variables_config import environment_variables
+from src.models.env_variables_config import get_environment_variables
 from src.models.gem_assessments import (
     BaseAssessment,
     BaseAssessments,
@@ -22,17 +36,30 @@ from src.models.gem_assessments import (
     IndividualSensitivityResult,
 )
 from src.models.gem_results import GemResult
+from src.models.results_store import PROJECT_FIELDS
 from src.models.settings import SensitivitySettings
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("urllib3").setLevel(logging.WARNING)
 
 TODAY = datetime.now().isoformat()
 
+# Only the first run in a process starts from a cold Function App
+_engine_warmed_up = False
+
+
+# Compiled once on first use, GEM_ADDITIONAL_KPIS adds KPIs on top of the GemResult fields
+@lru_cache(maxsize=1)
+def _get_result_extractor() -> ResultExtractor:
+    return ResultExtractor([*GEM_RESULT_KPIS, *get_environment_variables().gem_additional_kpis])
+
 
 def _get_gem_api_client() -> GemApiClient:
+    environment_variables = get_environment_variables()
     return GemApiClient(
         api_base_url=environment_variables.gem_api_base_url,
         client_id=environment_variables.gem_client_id,
@@ -68,13 +95,15 @@ def _engine_input_validation(
     return True, None
 
 
-def get_project_assessment(project_id: int, assessment_id: str) -> BaseAssessment:
-    with _get_gem_api_client() as gem:
+def _fetch_project_assessment(gem: GemApiClient, project_id: int, assessment_id: str) -> BaseAssessment:
+    with profile_stage("base_fetch"):
         error_message, status_code, assessment = gem.get_assessment(
             parent_id=str(project_id), assessment_id=assessment_id
         )
         if error_message:
-            logging.error(f"Error getting assessment {assessment_id} for {project_id}: {status_code}: {error_message}")
+            logging.error(
+                f"Error getting assessment {assessment_id} for {project_id}: {status_code}: {error_message}"
+            )
             raise GemApiClientException(status_code=status_code, reason=error_message)
         error_message, status_code, project = gem.get_project(project_id=str(project_id))
         if error_message:
@@ -97,11 +126,37 @@ def get_project_assessment(project_id: int, assessment_id: str) -> BaseAssessmen
         )
 
 
+def get_project_assessment(project_id: int, assessment_id: str) -> BaseAssessment:
+    with _get_gem_api_client() as gem:
+        return _fetch_project_assessment(gem, project_id, assessment_id)
+
+
+def get_project_assessments(
+    project_and_assessment_ids: list[ProjectAndAssessmentIds],
+    max_workers: int | None = None,
+) -> Generator[BaseAssessment]:
+    # One authenticated client is shared by every fetch, results are yielded in input order as they arrive
+    start_time = time.time()
+    if max_workers is None:
+        max_workers = get_environment_variables().gem_fetch_concurrency
+    with _get_gem_api_client() as gem, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(_fetch_project_assessment, gem, ids.project_id, ids.assessment_id)
+            for ids in project_and_assessment_ids
+        ]
+        for future in futures:
+            yield future.result()
+    logging.info(
+        f"Fetched {len(project_and_assessment_ids)} project assessments "
+        f"in {format_time_taken(time.time() - start_time)}"
+    )
+
+
 def get_base_gem_assessments(config: SensitivitySettings) -> BaseAssessments:
     gem_assessments = BaseAssessments(assessments=[])
     valid_technologies = {tech.value.lower() for tech in config.technologies}
     start_time = time.time()
-    with _get_gem_api_client() as gem:
+    with profile_stage("base_fetch"), _get_gem_api_client() as gem:
         for project, live_assessment in gem.get_projects_with_live_assessment(parent_id=config.folder, recursive=True):
             if project.technology.lower() not in valid_technologies:
                 continue
@@ -147,14 +202,31 @@ def _get_gem_calculation_engine_input(
     client: GemApiClient,
 ) -> dict:
     payload = {**assessment.data_dict, "results": None}
+    url = client._api_base_url + "/calculation/validate"
+
+    def _send() -> RecordedResponse:
+        request_start_time = time.time()
+        resp = client._get_session().post(url, json=payload)
+        return RecordedResponse(
+            status_code=resp.status_code,
+            content_type=resp.headers.get("content-type"),
+            body=resp.content,
+            latency_seconds=time.time() - request_start_time,
+        )
 
-    resp = client._get_session().post(client._api_base_url + "/calculation/validate", json=payload)
+    recorder = get_traffic_recorder()
+    if recorder is None:
+        resp = _send()
+    else:
+        # Keyed on the canonical payload, so the same assessment replays the same engine input
+        resp = recorder.exchange("POST", url, json.dumps(payload, sort_keys=True, default=str).encode(), _send)
 
     if resp.status_code != 200:
         raise GemApiClientException(
-            status_code=resp.status_code, reason=f"Error getting calculation engine input: {resp.text}"
+            status_code=resp.status_code,
+            reason=f"Error getting calculation engine input: {resp.body.decode(errors='replace')}",
         )
-    engine_input = resp.json()
+    engine_input = json.loads(resp.body)
     if engine_input.get("errors"):
         raise GemApiClientException(
             status_code=resp.status_code, reason=f"Error getting calculation engine input: {engine_input['errors']}"
@@ -177,27 +249,21 @@ def _parse_gem_result(result: dict | None) -> GemResult | None:
     except ValueError:
         raise ValueError()
 
-    return GemResult(
-        development_fee=dev_fee,
-        total_capex=next(
-            iter([x.get("total") for x in result.get("input_components", {}) if x.get("name") == "TOTAL_CAPEX"]), None
-        ),
-        total_merchant_revenue=next(
-            iter([x.get("total") for x in result.get("input_components", {}) if x.get("name") == "MERCHANT_REVENUE"]),
-            None,
-        ),
-        irr=result.get("development_fee_irr"),
-        bep=result.get("bep"),
-        discount_rate=result.get("target_project_discount_rate"),
-        installed_capacity=result.get("rated_power_mw"),
-        project_sale_date=result.get("project_sale_date"),
-        total_opex=next(
-            iter([x.get("total") for x in result.get("input_components", {}) if x.get("name") == "TOTAL_OPEX"]), None
-        ),
-        fid=result.get("financial_close"),
-        cod=result.get("commercial_operation"),
-        energy_yield=result.get("first_year_yield_mwh"),
-        lifetime=result.get("operational_lifetime"),
+    values = _get_result_extractor().extract(result)
+    additional_kpis = {kpi.name: values.pop(kpi.name) for kpi in get_environment_variables().gem_additional_kpis}
+    return GemResult(development_fee=dev_fee, **values, additional_kpis=additional_kpis)
+
+
+def _to_sensitivity_result(
+    assessment: IndividualSensitivityInput, results: GemResult | None, reason: ErrorReasons | None
+) -> IndividualSensitivityResult:
+    # The input was validated when it was built, dumping and revalidating it per row is a large share of run time
+    return IndividualSensitivityResult.model_construct(
+        **{field: getattr(assessment, field) for field in PROJECT_FIELDS},
+        reason_for_no_assessment=reason,
+        results=results,
+        combination=assessment.combination,
+        scenario=assessment.scenario,
     )
 
 
@@ -225,6 +291,10 @@ def _get_log_text(
     remaining_time = (
         avg_total_assessment_time * (total_assessments - completed_assessments) if completed_assessments > 0 else 0
     )
+    # The run status ETA is smoothed over recent throughput and covers the whole run, not just this call
+    smoothed_remaining_time = status_eta_seconds()
+    if smoothed_remaining_time is not None:
+        remaining_time = smoothed_remaining_time
     avg_batch_time = elapsed_time / batch_number if batch_number > 0 else 0
 
     return (
@@ -243,21 +313,29 @@ def _get_log_text(
 @retry(
     stop=stop_after_attempt(3),
     wait=wait_exponential(multiplier=1, min=120, max=6000),
+    # A replay without a recording fails the same way every time
+    retry=retry_if_not_exception_type(TrafficNotRecordedError),
     before_sleep=before_sleep_log(logger, logging.WARNING),
 )
 async def async_calculate_gem_assessment(
-    client: httpx.AsyncClient, assessment: IndividualSensitivityInput
+    client: httpx.AsyncClient,
+    pool: EnginePool,
+    assessment: IndividualSensitivityInput,
+    latency_history: LatencyHistory | None = None,
 ) -> dict | None:
     engine_input = deepcopy(assessment.engine_input_json)
     if engine_input is None:
         return None
-    response = await client.post(
-        environment_variables.gem_calculation_function_url,
-        json=engine_input,
-        headers={"x-functions-key": environment_variables.gem_calculation_function_key},
-        timeout=360,
-    )
-    response.raise_for_status()
+    async with pool.endpoint() as endpoint:
+        request_start_time = time.time()
+        response = await client.post(
+            endpoint.url,
+            json=engine_input,
+            headers={"x-functions-key": endpoint.key},
+        )
+        response.raise_for_status()
+    if latency_history is not None:
+        latency_history.record(assessment.project_id, time.time() - request_start_time)
     logging.debug(
         f"Calculated assessment for {assessment.project_name}"
         f"({assessment.project_id}) for combination [{assessment.combination}]"
@@ -265,8 +343,154 @@ async def async_calculate_gem_assessment(
     return response.json()
 
 
+class EngineBatchItemError(Exception):
+    pass
+
+
+class EngineBatchSizeError(Exception):
+    pass
+
+
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=1, min=120, max=6000),
+    # A replay without a recording fails the same way every time
+    retry=retry_if_not_exception_type(TrafficNotRecordedError),
+    before_sleep=before_sleep_log(logger, logging.WARNING),
+)
+async def _post_engine_input(client: httpx.AsyncClient, pool: EnginePool, engine_input: dict) -> tuple[dict, float]:
+    # Returns the result with the request's latency, excluding the wait for an endpoint slot
+    async with pool.endpoint() as endpoint:
+        request_start_time = time.time()
+        response = await client.post(endpoint.url, json=engine_input, headers={"x-functions-key": endpoint.key})
+        response.raise_for_status()
+    return response.json(), time.time() - request_start_time
+
+
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=1, min=120, max=6000),
+    # A replay without a recording fails the same way every time
+    retry=retry_if_not_exception_type(TrafficNotRecordedError),
+    before_sleep=before_sleep_log(logger, logging.WARNING),
+)
+async def async_calculate_gem_envelope(
+    client: httpx.AsyncClient,
+    pool: EnginePool,
+    assessments: list[IndividualSensitivityInput],
+    latency_history: LatencyHistory | None = None,
+) -> list[dict | BaseException]:
+    envelope = pack_batch_envelope([assessment.engine_input_json or {} for assessment in assessments])
+    request_start_time = time.time()
+    if pool.supports_batching:
+        async with pool.endpoint() as endpoint:
+            response = await client.post(
+                endpoint.batch_url or endpoint.url,
+                json=envelope.model_dump(mode="json", exclude_defaults=True),
+                headers={"x-functions-key": endpoint.key},
+            )
+            response.raise_for_status()
+        items = response.json()["results"]
+    else:
+        items = await evaluate_batch_envelope_locally(envelope, partial(_post_engine_input, client, pool))
+    if len(items) != len(assessments):
+        raise EngineBatchSizeError(
+            f"Envelope of {len(assessments)} assessments for {assessments[0].project_name} "
+            f"returned {len(items)} results"
+        )
+    if latency_history is not None:
+        # A batch endpoint only reports the envelope's wall time, which is shared out between its assessments
+        per_assessment_time = (time.time() - request_start_time) / len(assessments)
+        for assessment, item in zip(assessments, items):
+            if "result" in item:
+                latency_history.record(assessment.project_id, item.get("latency_seconds", per_assessment_time))
+    logging.debug(f"Calculated envelope of {len(assessments)} assessments for {assessments[0].project_name}")
+    return [item["result"] if "result" in item else EngineBatchItemError(item.get("error")) for item in items]
+
+
+async def _tracked(assessments: list[IndividualSensitivityInput], calculation: Awaitable[T]) -> T:
+    # Progress is counted as each request finishes rather than when its whole batch does
+    try:
+        return await calculation
+    finally:
+        for assessment in assessments:
+            status_finish(assessment.scenario)
+
+
+async def _calculate_batch_in_envelopes(
+    client: httpx.AsyncClient,
+    pool: EnginePool,
+    batch: list[IndividualSensitivityInput],
+    envelope_size: int,
+    latency_history: LatencyHistory | None = None,
+) -> list[dict | BaseException | None]:
+    batch_results: list[dict | BaseException | None] = [None] * len(batch)
+    # Assessments without an engine input are not packed into an envelope, so they finish here
+    for assessment in batch:
+        if assessment.engine_input_json is None:
+            status_finish(assessment.scenario)
+    groups = group_into_envelopes(batch, envelope_size)
+    envelope_results = await asyncio.gather(
+        *(
+            _tracked(
+                [batch[i] for i in indices],
+                async_calculate_gem_envelope(client, pool, [batch[i] for i in indices], latency_history),
+            )
+            for indices in groups
+        ),
+        return_exceptions=True,
+    )
+    for indices, results in zip(groups, envelope_results):
+        for position, i in enumerate(indices):
+            batch_results[i] = results if isinstance(results, BaseException) else results[position]
+    return batch_results
+
+
+async def calculate_batch(
+    client: httpx.AsyncClient,
+    pool: EnginePool,
+    batch: list[IndividualSensitivityInput],
+    envelope_size: int,
+    failure_archive: FailureArchive,
+    latency_history: LatencyHistory | None = None,
+) -> list[IndividualSensitivityResult]:
+    batch_results: list[dict | BaseException | None]
+    status_dispatch(len(batch))
+    with profile_stage("dispatch"):
+        if envelope_size > 1:
+            batch_results = await _calculate_batch_in_envelopes(client, pool, batch, envelope_size, latency_history)
+        else:
+            tasks = [
+                _tracked([assessment], async_calculate_gem_assessment(client, pool, assessment, latency_history))
+                for assessment in batch
+            ]
+            batch_results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    scenario_results: list[IndividualSensitivityResult] = []
+    with profile_stage("parse"):
+        for i, result in enumerate(batch_results):
+            if isinstance(result, dict) or result is None:
+                scenario_results.append(
+                    _to_sensitivity_result(batch[i], _parse_gem_result(result), batch[i].reason_for_no_assessment)
+                )
+            else:
+                logging.error(
+                    f"Error in calculation for {batch[i].project_name} ({batch[i].project_id})"
+                    f"[{batch[i].combination}]: {result}"
+                )
+                failure_archive.submit(batch[i], result)
+                status_fail(batch[i].scenario)
+                scenario_results.append(_to_sensitivity_result(batch[i], None, ErrorReasons.CALCULATION_ERROR))
+    return scenario_results
+
+
 async def run_async_batches(
-    assessments: list[IndividualSensitivityInput], batch_size: int
+    assessments: list[IndividualSensitivityInput],
+    batch_size: int,
+    latency_history: LatencyHistory | None = None,
+    warm_up: bool = False,
+    failure_archive_file: str = FAILURE_ARCHIVE_FILE,
+    pool: EnginePool | None = None,
 ) -> list[IndividualSensitivityResult]:
     start_time = time.time()
     scenario_results: list[IndividualSensitivityResult] = []
@@ -276,52 +500,53 @@ async def run_async_batches(
     total_assessments = len(assessments)
     completed_assessments = 0
 
-    async with httpx.AsyncClient() as client:
-        for batch_number, batch in enumerate(batches, start=1):
-            batch_start_time = time.time()
-            logging.info(f"Running batch {batch_number} of {total_batches}. Size: {len(batch)}")
-
-            tasks = [async_calculate_gem_assessment(client, assessment) for assessment in batch]
-
-            batch_results = await asyncio.gather(*tasks, return_exceptions=True)
-
-            for i, result in enumerate(batch_results):
-                completed_assessments += 1
-                if isinstance(result, dict) or result is None:
-                    scenario_results.append(
-                        IndividualSensitivityResult(
-                            **batch[i].model_dump(exclude={"engine_input_json"}),
-                            results=_parse_gem_result(result),
-                        )
+    environment_variables = get_environment_variables()
+    if pool is None:
+        pool = EnginePool(environment_variables.get_calculation_endpoints())
+    with FailureArchive(failure_archive_file) as failure_archive:
+        async with build_engine_http_client(pool, environment_variables) as client:
+            if len(pool.endpoints) > 1:
+                await pool.check_health(client)
+            warm_up_input = select_warm_up_input(assessments) if warm_up else None
+            if warm_up_input is not None:
+                save_warm_up_statistics(
+                    await warm_up_engine(
+                        client,
+                        pool,
+                        warm_up_input,
+                        pool.max_concurrency,
+                        environment_variables.gem_warm_up_tolerance,
                     )
-                else:
-                    logging.error(
-                        f"Error in calculation for {batch[i].project_name} ({batch[i].project_id})"
-                        f"[{batch[i].combination}]: {result}"
+                )
+                # Cold start requests are kept out of the endpoint metrics and the ETA, which reflect steady state
+                pool.reset_metrics()
+                start_time = time.time()
+            for batch_number, batch in enumerate(batches, start=1):
+                batch_start_time = time.time()
+                logging.info(f"Running batch {batch_number} of {total_batches}. Size: {len(batch)}")
+                scenario_results.extend(
+                    await calculate_batch(
+                        client,
+                        pool,
+                        batch,
+                        environment_variables.gem_batch_envelope_size,
+                        failure_archive,
+                        latency_history,
                     )
-                    os.makedirs("error_logs", exist_ok=True)
-                    random_id = uuid.uuid4().hex
-                    file_name = f"{batch[i].project_id}_{random_id}.json"
-                    with open(f"error_logs/{file_name}", "w") as f:
-                        f.write(batch[i].model_dump_json(indent=2))
-                    scenario_results.append(
-                        IndividualSensitivityResult(
-                            **batch[i].model_dump(exclude={"engine_input_json", "reason_for_no_assessment"}),
-                            results=None,
-                            reason_for_no_assessment=ErrorReasons.CALCULATION_ERROR,
-                        )
+                )
+                completed_assessments += len(batch)
+                profile_snapshot(f"dispatch_batch_{batch_number}")
+
+                logging.info(
+                    _get_log_text(
+                        start_time,
+                        batch_start_time,
+                        completed_assessments,
+                        total_assessments,
+                        batch_number,
+                        len(batch),
                     )
-
-            logging.info(
-                _get_log_text(
-                    start_time,
-                    batch_start_time,
-                    completed_assessments,
-                    total_assessments,
-                    batch_number,
-                    len(batch),
                 )
-            )
     logging.info(
         f"Completed GEM Sensitivity Analysis. "
         f"{total_assessments} assessments in {format_time_taken(time.time() - start_time)}"
@@ -329,5 +554,62 @@ async def run_async_batches(
     return scenario_results
 
 
-def run_gem_assessments_asyncio(assessments: list[IndividualSensitivityInput]) -> list[IndividualSensitivityResult]:
-    return asyncio.run(run_async_batches(assessments, batch_size=environment_variables.gem_batch_size))
+def prepare_assessments(
+    assessments: list[IndividualSensitivityInput], latency_history: LatencyHistory
+) -> tuple[list[IndividualSensitivityResult | None], list[int]]:
+    # Returns the pre-flight rejections by position and the positions left to dispatch, in dispatch order
+    environment_variables = get_environment_variables()
+    results: list[IndividualSensitivityResult | None] = [None] * len(assessments)
+
+    # Reject inputs that would fail in the engine before spending engine capacity and retries on them
+    valid_positions: list[int] = []
+    for position, assessment in enumerate(assessments):
+        rejected = preflight_rejection(assessment) if environment_variables.gem_preflight_validation else None
+        if rejected is None:
+            valid_positions.append(position)
+        else:
+            results[position] = rejected
+            status_finish(assessment.scenario, dispatched=False)
+            status_fail(assessment.scenario)
+    log_rejection_summary([result for result in results if result is not None], len(assessments))
+
+    # Dispatch the slowest projects first so they do not make up the tail of the run
+    if environment_variables.gem_latency_aware_ordering:
+        dispatch_order = longest_expected_first_order(
+            [assessments[position] for position in valid_positions], latency_history
+        )
+        return results, [valid_positions[i] for i in dispatch_order]
+    return results, valid_positions
+
+
+def run_gem_assessments_asyncio(
+    assessments: list[IndividualSensitivityInput],
+    failure_archive_file: str = FAILURE_ARCHIVE_FILE,
+    pool: EnginePool | None = None,
+) -> list[IndividualSensitivityResult]:
+    global _engine_warmed_up
+    environment_variables = get_environment_variables()
+    # A run of several batch groups passes one pool and logs its endpoint metrics once at the end
+    run_pool = pool if pool is not None else EnginePool(environment_variables.get_calculation_endpoints())
+    warm_up = environment_variables.gem_warm_up and not _engine_warmed_up
+    _engine_warmed_up = True
+
+    latency_history = load_latency_history()
+    results, dispatch_positions = prepare_assessments(assessments, latency_history)
+    dispatched_results = asyncio.run(
+        run_async_batches(
+            [assessments[position] for position in dispatch_positions],
+            batch_size=environment_variables.gem_batch_size,
+            latency_history=latency_history,
+            warm_up=warm_up,
+            failure_archive_file=failure_archive_file,
+            pool=run_pool,
+        )
+    )
+    save_latency_history(latency_history)
+    if pool is None:
+        run_pool.log_metrics()
+    # Restore the input order
+    for position, result in zip(dispatch_positions, dispatched_results):
+        results[position] = result
+    return [result for result in results if result is not None]
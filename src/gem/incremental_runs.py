@@ -0,0 +1,197 @@
+import hashlib
+import json
+import logging
+import time
+
+from src.gem.engine_endpoints import EnginePool
+from src.gem.gem_service import run_gem_assessments_asyncio
+from src.helpers.failure_archive import FAILURE_ARCHIVE_FILE, FailureArchive
+from src.helpers.format_time_taken import format_time_taken
+from src.helpers.run_profiler import profile_stage
+from src.helpers.run_status import status_reuse
+from src.helpers.scenario_builder import scenario_builder
+from src.models.enums.error_reasons import ErrorReasons
+from src.models.env_variables_config import get_environment_variables
+from src.models.gem_assessments import (
+    BaseAssessment,
+    BaseAssessments,
+    IndividualSensitivityInput,
+    IndividualSensitivityResult,
+    RunMetadata,
+    SensitivityKey,
+    SensitivityResults,
+    project_key,
+    sensitivity_key,
+)
+from src.models.results_store import ResultsStore
+from src.models.sensitivity import ScenarioSensitivity
+from src.models.settings import SensitivitySettings
+
+logger = logging.getLogger(__name__)
+
+
+def assessment_revision(base_assessment: BaseAssessment) -> str:
+    engine_input = json.dumps(base_assessment.engine_input_json, sort_keys=True, default=str)
+    return hashlib.sha256(engine_input.encode("utf-8")).hexdigest()
+
+
+def scenario_revision(scenario: ScenarioSensitivity) -> str:
+    # The values are left out, so extending a sweep keeps the combinations it already had reusable
+    sweeps = [(sweep.component.value, sweep.type.value) for sweep in scenario.element_wise_parameter_sweep.values()]
+    return hashlib.sha256(json.dumps(sweeps).encode("utf-8")).hexdigest()
+
+
+def build_run_metadata(base_assessments: BaseAssessments, config: SensitivitySettings) -> RunMetadata:
+    return RunMetadata(
+        engine_version=get_environment_variables().gem_engine_version,
+        assessment_revisions={
+            project_key(assessment): assessment_revision(assessment) for assessment in base_assessments.assessments
+        },
+        scenario_revisions={name: scenario_revision(scenario) for name, scenario in config.sensitivities.items()},
+    )
+
+
+def get_reusable_results(
+    previous_results: SensitivityResults, metadata: RunMetadata
+) -> dict[SensitivityKey, IndividualSensitivityResult]:
+    if previous_results.metadata is None:
+        logging.warning("Previous results have no run metadata. Recalculating all assessments")
+        return {}
+    if previous_results.metadata.engine_version != metadata.engine_version:
+        logging.warning(
+            f"Previous results used engine version {previous_results.metadata.engine_version}, "
+            f"current version is {metadata.engine_version}. Recalculating all assessments"
+        )
+        return {}
+
+    previous_revisions = previous_results.metadata.assessment_revisions
+    stale_projects = {
+        project
+        for project, revision in metadata.assessment_revisions.items()
+        if project in previous_revisions and previous_revisions[project] != revision
+    }
+    for project in sorted(stale_projects):
+        logging.warning(f"Assessment for {project} has changed since the previous run. Recalculating")
+
+    previous_scenario_revisions = previous_results.metadata.scenario_revisions
+    stale_scenarios = {
+        scenario
+        for scenario, revision in metadata.scenario_revisions.items()
+        if previous_scenario_revisions.get(scenario) != revision
+    }
+    for scenario in sorted(stale_scenarios):
+        logging.warning(f"Scenario {scenario} has a different or unknown sweep definition. Recalculating")
+
+    reusable: dict[SensitivityKey, IndividualSensitivityResult] = {}
+    for result in previous_results.assessments:
+        key = project_key(result)
+        if key in stale_projects or key not in previous_revisions or result.scenario in stale_scenarios:
+            continue
+        if result.reason_for_no_assessment is ErrorReasons.CALCULATION_ERROR:
+            continue
+        reusable[sensitivity_key(result)] = result
+    return reusable
+
+
+def run_incremental_sensitivity(
+    base_assessments: BaseAssessments,
+    config: SensitivitySettings,
+    previous_results: SensitivityResults,
+    batch_size: int = 5000,
+    failure_archive_file: str = FAILURE_ARCHIVE_FILE,
+) -> ResultsStore:
+    start_time = time.time()
+    metadata = build_run_metadata(base_assessments, config)
+    reusable = get_reusable_results(previous_results, metadata)
+    logging.info(f"Found {len(reusable)} reusable results from previous run")
+
+    sensitivity_results = ResultsStore(metadata=metadata)
+    pool = EnginePool(get_environment_variables().get_calculation_endpoints())
+    reused = 0
+    calculated = 0
+    for batch_of_assessments in scenario_builder(base_assessments, config, batch_size=batch_size):
+        missing: list[IndividualSensitivityInput] = []
+        for assessment in batch_of_assessments:
+            previous_result = reusable.get(sensitivity_key(assessment))
+            if previous_result is None:
+                missing.append(assessment)
+            else:
+                sensitivity_results.add(previous_result)
+                status_reuse(assessment.scenario)
+                reused += 1
+        if missing:
+            batch_results = run_gem_assessments_asyncio(missing, failure_archive_file, pool)
+            with profile_stage("sink"):
+                sensitivity_results.extend(batch_results)
+            calculated += len(missing)
+
+    logging.info(
+        f"Incremental run complete. Reused {reused} results and calculated {calculated} assessments "
+        f"in {format_time_taken(time.time() - start_time)}"
+    )
+    pool.log_metrics()
+    return sensitivity_results
+
+
+def run_sensitivity(
+    base_assessments: BaseAssessments,
+    config: SensitivitySettings,
+    previous_results: SensitivityResults | None = None,
+    batch_size: int = 5000,
+    failure_archive_file: str = FAILURE_ARCHIVE_FILE,
+) -> ResultsStore:
+    # Pass failure_archive_path(name) so a replay of this run's failures only merges into this run's results
+    if previous_results is not None:
+        return run_incremental_sensitivity(
+            base_assessments, config, previous_results, batch_size=batch_size, failure_archive_file=failure_archive_file
+        )
+    sensitivity_results = ResultsStore(metadata=build_run_metadata(base_assessments, config))
+    # One pool for every batch group, so its endpoint summary covers the whole run
+    pool = EnginePool(get_environment_variables().get_calculation_endpoints())
+    for batch_of_assessments in scenario_builder(base_assessments, config, batch_size=batch_size):
+        batch_results = run_gem_assessments_asyncio(batch_of_assessments, failure_archive_file, pool)
+        with profile_stage("sink"):
+            sensitivity_results.extend(batch_results)
+    pool.log_metrics()
+    return sensitivity_results
+
+
+def merge_sensitivity_results(
+    sensitivity_results: SensitivityResults, replacements: list[IndividualSensitivityResult]
+) -> SensitivityResults:
+    replacement_by_key = {sensitivity_key(result): result for result in replacements}
+    merged = SensitivityResults(assessments=[], metadata=sensitivity_results.metadata)
+    for result in sensitivity_results.assessments:
+        merged.add(replacement_by_key.pop(sensitivity_key(result), result))
+    # Replacements only ever replace, anything not in the results belongs to a different run and is dropped
+    if replacement_by_key:
+        logging.warning(f"Dropped {len(replacement_by_key)} replayed results that are not part of these results")
+    return merged
+
+
+def replay_failed_assessments(
+    sensitivity_results: SensitivityResults, archive_path: str = FAILURE_ARCHIVE_FILE
+) -> SensitivityResults:
+    archive = FailureArchive(archive_path)
+    result_keys = {sensitivity_key(result) for result in sensitivity_results.assessments}
+    failed = []
+    foreign = 0
+    for assessment in archive.iter_unreplayed():
+        if sensitivity_key(assessment) in result_keys:
+            failed.append(assessment)
+        else:
+            foreign += 1
+    if foreign:
+        # Left unreplayed, so they stay pending for the results they belong to
+        logging.warning(f"Skipping {foreign} archived failures in {archive_path} that are not part of these results")
+    if not failed:
+        logging.info(f"No failed assessments to replay in {archive_path}")
+        return sensitivity_results
+    logging.info(f"Replaying {len(failed)} failed assessments from {archive_path}")
+
+    replayed = run_gem_assessments_asyncio(failed, archive_path)
+    succeeded = [result for result in replayed if result.reason_for_no_assessment is not ErrorReasons.CALCULATION_ERROR]
+    # Assessments that fail again are archived by the replay itself and stay pending for the next replay
+    archive.mark_replayed(succeeded)
+    logging.info(f"Replay complete. {len(succeeded)} of {len(failed)} failed assessments now succeed")
+    return merge_sensitivity_results(sensitivity_results, replayed)
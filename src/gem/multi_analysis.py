@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import time
+from contextlib import ExitStack
+
+import httpx
+
+from src.gem.engine_endpoints import EnginePool, build_engine_http_client
+from src.gem.fair_share import FairShareScheduler, current_share
+from src.gem.gem_service import calculate_batch, prepare_assessments
+from src.gem.incremental_runs import build_run_metadata
+from src.gem.warm_up import save_warm_up_statistics, select_warm_up_input, warm_up_engine
+from src.helpers.failure_archive import FailureArchive, failure_archive_path
+from src.helpers.format_time_taken import format_time_taken
+from src.helpers.latency_history import LatencyHistory, load_latency_history, save_latency_history
+from src.helpers.run_profiler import profile_stage
+from src.helpers.scenario_builder import scenario_builder
+from src.models.env_variables_config import get_environment_variables
+from src.models.gem_assessments import BaseAssessments, IndividualSensitivityInput
+from src.models.results_store import ResultsStore
+from src.models.settings import SensitivitySettings
+
+logger = logging.getLogger(__name__)
+
+# The next chunk is queued while the last one drains, so an analysis always has requests waiting for its share
+CHUNKS_IN_FLIGHT = 2
+
+
+class Analysis:
+    def __init__(
+        self, name: str, config: SensitivitySettings, base_assessments: BaseAssessments, weight: float = 1.0
+    ) -> None:
+        self.name = name
+        self.config = config
+        self.base_assessments = base_assessments
+        self.weight = weight
+        self.results = ResultsStore(metadata=build_run_metadata(base_assessments, config))
+        # Failures are archived per analysis so a replay only merges into the results it belongs to
+        self.failure_archive = FailureArchive(failure_archive_path(name))
+
+
+class SharedEngine:
+    # One client, connection pool and set of engine slots for every analysis in the run
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        pool: EnginePool,
+        latency_history: LatencyHistory,
+        warm_up: bool,
+    ) -> None:
+        self.client = client
+        self.pool = pool
+        self.latency_history = latency_history
+        self._warm_up = warm_up
+        self._warm_up_lock = asyncio.Lock()
+
+    async def warm_up(self, assessments: list[IndividualSensitivityInput]) -> None:
+        # Only the first analysis to have inputs warms the engine, the others wait for it instead of cold starting
+        async with self._warm_up_lock:
+            if not self._warm_up:
+                return
+            self._warm_up = False
+            warm_up_input = select_warm_up_input(assessments)
+            if warm_up_input is None:
+                return
+            save_warm_up_statistics(
+                await warm_up_engine(
+                    self.client,
+                    self.pool,
+                    warm_up_input,
+                    self.pool.max_concurrency,
+                    get_environment_variables().gem_warm_up_tolerance,
+                )
+            )
+            self.pool.reset_metrics()
+
+
+async def _run_analysis(engine: SharedEngine, analysis: Analysis, batch_size: int) -> None:
+    # Set in this analysis' task, so every engine request it makes is scheduled against its share
+    current_share.set(analysis.name)
+    environment_variables = get_environment_variables()
+    start_time = time.time()
+    batches = scenario_builder(analysis.base_assessments, analysis.config, batch_size=batch_size)
+    # Inputs are built in a thread, so the other analyses keep the engine busy meanwhile
+    while (assessments := await asyncio.to_thread(next, batches, None)) is not None:
+        results, dispatch_positions = prepare_assessments(assessments, engine.latency_history)
+        await engine.warm_up(assessments)
+        window = asyncio.Semaphore(CHUNKS_IN_FLIGHT)
+
+        async def _calculate_chunk(positions: list[int]) -> None:
+            async with window:
+                batch_results = await calculate_batch(
+                    engine.client,
+                    engine.pool,
+                    [assessments[position] for position in positions],
+                    environment_variables.gem_batch_envelope_size,
+                    analysis.failure_archive,
+                    engine.latency_history,
+                )
+            for position, result in zip(positions, batch_results):
+                results[position] = result
+
+        chunk_size = environment_variables.gem_batch_size
+        await asyncio.gather(
+            *(
+                _calculate_chunk(dispatch_positions[start : start + chunk_size])
+                for start in range(0, len(dispatch_positions), chunk_size)
+            )
+        )
+        with profile_stage("sink"):
+            analysis.results.extend(result for result in results if result is not None)
+        logging.info(
+            f"Analysis {analysis.name}: {len(analysis.results)} assessments complete after "
+            f"{format_time_taken(time.time() - start_time)}"
+        )
+    logging.info(
+        f"Completed analysis {analysis.name}. "
+        f"{len(analysis.results)} assessments in {format_time_taken(time.time() - start_time)}"
+    )
+
+
+async def _run_analyses(
+    analyses: list[Analysis], batch_size: int, latency_history: LatencyHistory
+) -> list[BaseException | None]:
+    environment_variables = get_environment_variables()
+    pool = EnginePool(environment_variables.get_calculation_endpoints())
+    scheduler = FairShareScheduler(pool.available_capacity)
+    for analysis in analyses:
+        scheduler.add(analysis.name, analysis.weight)
+    pool.scheduler = scheduler
+
+    with ExitStack() as stack:
+        for analysis in analyses:
+            stack.enter_context(analysis.failure_archive)
+        async with build_engine_http_client(pool, environment_variables) as client:
+            if len(pool.endpoints) > 1:
+                await pool.check_health(client)
+            engine = SharedEngine(client, pool, latency_history, environment_variables.gem_warm_up)
+            outcomes = await asyncio.gather(
+                *(_run_analysis(engine, analysis, batch_size) for analysis in analyses), return_exceptions=True
+            )
+    pool.log_metrics()
+    scheduler.log_metrics()
+    return [outcome if isinstance(outcome, BaseException) else None for outcome in outcomes]
+
+
+def run_analyses(analyses: list[Analysis], batch_size: int = 5000) -> dict[str, ResultsStore]:
+    # A failed analysis is logged and left out, so it does not cost the others their results
+    start_time = time.time()
+    logging.info(
+        f"Running {len(analyses)} analyses: "
+        + ", ".join(f"{analysis.name} (weight {analysis.weight:g})" for analysis in analyses)
+    )
+    latency_history = load_latency_history()
+    errors = asyncio.run(_run_analyses(analyses, batch_size, latency_history))
+    save_latency_history(latency_history)
+
+    completed: dict[str, ResultsStore] = {}
+    for analysis, error in zip(analyses, errors):
+        if error is None:
+            completed[analysis.name] = analysis.results
+        else:
+            logging.error(f"Analysis {analysis.name} failed: {error!r}")
+    logging.info(
+        f"Completed {len(completed)} of {len(analyses)} analyses in {format_time_taken(time.time() - start_time)}"
+    )
+    return completed
@@ -0,0 +1,132 @@
+import logging
+import math
+from collections import Counter
+from datetime import date
+from typing import Any, TypeGuard
+
+from src.models.enums.error_reasons import ErrorReasons
+from src.models.gem_assessments import IndividualSensitivityInput, IndividualSensitivityResult
+
+logger = logging.getLogger(__name__)
+
+MAX_OPERATIONAL_LIFETIME_YEARS = 60
+SALE_DATE_KEYS = ("date_of_project_sale", "project_sale_date")
+
+
+def _is_number(value: Any) -> TypeGuard[int | float]:
+    return isinstance(value, int | float) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _year_month(value: Any) -> date | None:
+    if isinstance(value, dict) and _is_number(value.get("year")) and _is_number(value.get("month")):
+        return date(int(value["year"]), int(value["month"]), 1)
+    if isinstance(value, str) and len(value) >= 7:
+        try:
+            return date(int(value[:4]), int(value[5:7]), 1)
+        except ValueError:
+            return None
+    return None
+
+
+def _check_lifetime(engine_input: dict) -> str | None:
+    lifetime = engine_input.get("operational_lifetime_years")
+    if not _is_number(lifetime) or not 0 < lifetime <= MAX_OPERATIONAL_LIFETIME_YEARS:
+        return f"operational_lifetime_years is {lifetime}"
+    calculators = [
+        *(engine_input.get("calculators") or []),
+        *((engine_input.get("energy_yield_information") or {}).get("energy_loss_calculators") or []),
+    ]
+    for calculator in calculators:
+        if "operational_lifetime_years" in calculator:
+            calculator_lifetime = calculator["operational_lifetime_years"]
+            if not _is_number(calculator_lifetime) or calculator_lifetime <= 0:
+                return f"{calculator.get('name')} operational_lifetime_years is {calculator_lifetime}"
+    return None
+
+
+def _check_energy_yield(engine_input: dict) -> str | None:
+    energy_yield_information = engine_input.get("energy_yield_information")
+    if not isinstance(energy_yield_information, dict):
+        return "energy_yield_information is missing"
+    if energy_yield_information.get("monthly_profile"):
+        return None
+    energy_yield = energy_yield_information.get("energy_yield_per_year_MWh")
+    if not _is_number(energy_yield) or energy_yield <= 0:
+        return f"no monthly_profile and energy_yield_per_year_MWh is {energy_yield}"
+    return None
+
+
+def _check_financial_close(engine_input: dict) -> str | None:
+    financial_close = _year_month(engine_input.get("date_of_financial_close"))
+    sale_date = next(
+        (_year_month(engine_input[key]) for key in SALE_DATE_KEYS if engine_input.get(key) is not None), None
+    )
+    if financial_close is None or sale_date is None:
+        return None
+    if financial_close < sale_date:
+        return f"financial close {financial_close:%Y-%m} is before sale date {sale_date:%Y-%m}"
+    return None
+
+
+def _check_rates(engine_input: dict) -> str | None:
+    discount_rate = engine_input.get("discount_rate")
+    if discount_rate is not None and (not _is_number(discount_rate) or not -1 < discount_rate < 1):
+        return f"discount_rate is {discount_rate}"
+    for inflation in engine_input.get("inflation_rate") or []:
+        rate = inflation.get("rate")
+        if not _is_number(rate) or rate <= -1:
+            return f"inflation rate is {rate}"
+    for currency, rates in (engine_input.get("currencies") or {}).items():
+        for year, rate in rates.items():
+            if not _is_number(rate) or rate <= 0:
+                return f"{currency} FX rate for {year} is {rate}"
+    risk_factor = (engine_input.get("electricity_price") or {}).get("risk_factor")
+    if risk_factor is not None and (not _is_number(risk_factor) or risk_factor < 0):
+        return f"electricity price risk_factor is {risk_factor}"
+    return None
+
+
+CHECKS = [
+    (_check_lifetime, ErrorReasons.INVALID_OPERATIONAL_LIFETIME),
+    (_check_energy_yield, ErrorReasons.MISSING_ENERGY_YIELD),
+    (_check_financial_close, ErrorReasons.FINANCIAL_CLOSE_DATE_BEFORE_SALE_DATE),
+    (_check_rates, ErrorReasons.INVALID_ENGINE_INPUT),
+]
+
+
+def preflight_validation(assessment: IndividualSensitivityInput) -> tuple[bool, ErrorReasons | None]:
+    engine_input = assessment.engine_input_json
+    if engine_input is None:
+        return True, None
+    forecast = (engine_input.get("electricity_price") or {}).get("forecast")
+    if not forecast:
+        logging.debug(f"No electricity price forecast for {assessment.project_name} ({assessment.project_id})")
+        return False, ErrorReasons.NO_ELECTRICITY_PRICES
+    for check, reason in CHECKS:
+        problem = check(engine_input)
+        if problem is not None:
+            logging.debug(
+                f"Rejected {assessment.project_name} ({assessment.project_id}) [{assessment.combination}] "
+                f"before calculation: {problem}"
+            )
+            return False, reason
+    return True, None
+
+
+def preflight_rejection(assessment: IndividualSensitivityInput) -> IndividualSensitivityResult | None:
+    valid, reason = preflight_validation(assessment)
+    if valid:
+        return None
+    return IndividualSensitivityResult(
+        **assessment.model_dump(exclude={"engine_input_json", "reason_for_no_assessment"}),
+        results=None,
+        reason_for_no_assessment=reason,
+    )
+
+
+def log_rejection_summary(rejected: list[IndividualSensitivityResult], total: int) -> None:
+    if not rejected:
+        return
+    reasons = Counter(result.reason_for_no_assessment for result in rejected)
+    summary = ", ".join(f"{reason.value if reason else None}: {count}" for reason, count in reasons.items())
+    logging.warning(f"Pre-flight validation rejected {len(rejected)} of {total} assessments ({summary})")
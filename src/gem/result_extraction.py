@@ -0,0 +1,53 @@
+from typing import Any
+
+from src.models.gem_results import KpiSpec
+
+GEM_RESULT_KPIS = [
+    KpiSpec(name="total_capex", component="TOTAL_CAPEX"),
+    KpiSpec(name="total_merchant_revenue", component="MERCHANT_REVENUE"),
+    KpiSpec(name="irr", path=["development_fee_irr"]),
+    KpiSpec(name="bep", path=["bep"]),
+    KpiSpec(name="discount_rate", path=["target_project_discount_rate"]),
+    KpiSpec(name="installed_capacity", path=["rated_power_mw"]),
+    KpiSpec(name="project_sale_date", path=["project_sale_date"]),
+    KpiSpec(name="total_opex", component="TOTAL_OPEX"),
+    KpiSpec(name="fid", path=["financial_close"]),
+    KpiSpec(name="cod", path=["commercial_operation"]),
+    KpiSpec(name="energy_yield", path=["first_year_yield_mwh"]),
+    KpiSpec(name="lifetime", path=["operational_lifetime"]),
+]
+
+
+class ResultExtractor:
+    def __init__(self, specs: list[KpiSpec]) -> None:
+        names = [spec.name for spec in specs]
+        duplicates = {name for name in names if names.count(name) > 1}
+        if duplicates:
+            raise ValueError(f"KPIs extracted more than once: {', '.join(sorted(duplicates))}")
+        self.names = names
+        self._paths = [(spec.name, tuple(spec.path)) for spec in specs if spec.component is None]
+        # Component name -> (KPI name, field) pairs, so input_components is walked once for every KPI
+        self._components: dict[str, list[tuple[str, str]]] = {}
+        for spec in specs:
+            if spec.component is not None:
+                self._components.setdefault(spec.component, []).append((spec.name, spec.component_field))
+
+    def extract(self, result: dict[str, Any]) -> dict[str, Any]:
+        values: dict[str, Any] = dict.fromkeys(self.names)
+        for name, path in self._paths:
+            value: Any = result
+            for key in path:
+                value = value.get(key) if isinstance(value, dict) else None
+            values[name] = value
+
+        pending = dict(self._components)
+        if pending:
+            for component in result.get("input_components", {}):
+                fields = pending.pop(component.get("name"), None)
+                if fields is None:
+                    continue
+                for name, field in fields:
+                    values[name] = component.get(field)
+                if not pending:
+                    break
+        return values
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import os
+import statistics
+import time
+
+import httpx
+from pydantic import BaseModel, Field
+
+from src.gem.engine_endpoints import EnginePool
+from src.helpers.format_time_taken import format_time_taken
+from src.helpers.task_ordering import estimate_input_cost
+from src.models.gem_assessments import IndividualSensitivityInput
+
+logger = logging.getLogger(__name__)
+
+WARM_UP_STATISTICS_FILE = os.path.join("results", "warm_up_statistics.json")
+WARM_UP_SAMPLE_SIZE = 100
+MIN_WARM_UP_STAGES = 3
+
+
+class WarmUpStage(BaseModel):
+    concurrency: int
+    failures: int
+    median_latency_seconds: float | None
+    max_latency_seconds: float | None
+
+
+class WarmUpStatistics(BaseModel):
+    stages: list[WarmUpStage] = Field(default_factory=list)
+    stabilised: bool = False
+    duration_seconds: float = 0.0
+
+    @property
+    def requests(self) -> int:
+        return sum(stage.concurrency for stage in self.stages)
+
+
+def select_warm_up_input(assessments: list[IndividualSensitivityInput]) -> IndividualSensitivityInput | None:
+    candidates = [a for a in assessments[:WARM_UP_SAMPLE_SIZE] if a.engine_input_json is not None]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda a: estimate_input_cost(a.engine_input_json or {}))
+
+
+async def _timed_request(client: httpx.AsyncClient, pool: EnginePool, engine_input: dict) -> float:
+    async with pool.endpoint() as endpoint:
+        start_time = time.time()
+        response = await client.post(endpoint.url, json=engine_input, headers={"x-functions-key": endpoint.key})
+        response.raise_for_status()
+        return time.time() - start_time
+
+
+def _is_stable(previous: WarmUpStage, current: WarmUpStage, tolerance: float) -> bool:
+    if previous.median_latency_seconds is None or current.median_latency_seconds is None or current.failures:
+        return False
+    return current.median_latency_seconds <= previous.median_latency_seconds * (1 + tolerance)
+
+
+async def warm_up_engine(
+    client: httpx.AsyncClient,
+    pool: EnginePool,
+    warm_up_input: IndividualSensitivityInput,
+    target_concurrency: int,
+    tolerance: float,
+) -> WarmUpStatistics:
+    start_time = time.time()
+    warm_up_statistics = WarmUpStatistics()
+    engine_input = warm_up_input.engine_input_json or {}
+    logging.info(
+        f"Warming up engine with {warm_up_input.project_name} ({warm_up_input.project_id}) "
+        f"up to {target_concurrency} concurrent requests"
+    )
+    concurrency = 1
+    # Double the concurrency each stage until latency stops rising as the Function App scales out
+    while True:
+        results = await asyncio.gather(
+            *(_timed_request(client, pool, engine_input) for _ in range(concurrency)), return_exceptions=True
+        )
+        latencies = [result for result in results if isinstance(result, float)]
+        stage = WarmUpStage(
+            concurrency=concurrency,
+            failures=len(results) - len(latencies),
+            median_latency_seconds=statistics.median(latencies) if latencies else None,
+            max_latency_seconds=max(latencies, default=None),
+        )
+        warm_up_statistics.stages.append(stage)
+        logging.info(
+            f"Warm up stage: {concurrency} requests | {stage.failures} failures | Median latency: "
+            f"{format_time_taken(stage.median_latency_seconds or 0)}"
+        )
+        stages = warm_up_statistics.stages
+        if len(stages) >= MIN_WARM_UP_STAGES and _is_stable(stages[-2], stage, tolerance):
+            warm_up_statistics.stabilised = True
+            break
+        if concurrency >= target_concurrency:
+            break
+        concurrency = min(concurrency * 2, target_concurrency)
+
+    warm_up_statistics.duration_seconds = time.time() - start_time
+    logging.info(
+        f"Engine warm up {'stabilised' if warm_up_statistics.stabilised else 'did not stabilise'} after "
+        f"{warm_up_statistics.requests} requests in {format_time_taken(warm_up_statistics.duration_seconds)}"
+    )
+    return warm_up_statistics
+
+
+def save_warm_up_statistics(warm_up_statistics: WarmUpStatistics, file_path: str = WARM_UP_STATISTICS_FILE) -> None:
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write(warm_up_statistics.model_dump_json(indent=2))
@@ -0,0 +1,359 @@
+import hashlib
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from pydantic import BaseModel
+
+from src.gem.engine_endpoints import EnginePool
+from src.gem.gem_service import run_gem_assessments_asyncio
+from src.helpers.failure_archive import FAILURE_ARCHIVE_FILE
+from src.helpers.format_time_taken import format_time_taken
+from src.helpers.scenario_builder import scenario_builder
+from src.models.enums.error_reasons import ErrorReasons
+from src.models.env_variables_config import get_environment_variables
+from src.models.gem_assessments import (
+    BaseAssessments,
+    IndividualSensitivityInput,
+    IndividualSensitivityResult,
+    RunMetadata,
+    sensitivity_key,
+)
+from src.models.results_store import ResultsStore
+from src.models.settings import SensitivitySettings
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+LEASED = "leased"
+COMPLETED = "completed"
+FAILED = "failed"
+
+DEFAULT_LEASE_SECONDS = 30 * 60
+DEFAULT_MAX_ATTEMPTS = 3
+POLL_INTERVAL_SECONDS = 30
+# Long timeout as several hosts may be contending for the lock on a shared filesystem
+SQLITE_TIMEOUT_SECONDS = 120
+RUN_IDENTITY_KEY = "run_identity"
+ENQUEUE_COMPLETE_KEY = "enqueue_complete"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id INTEGER PRIMARY KEY,
+    task_key TEXT NOT NULL UNIQUE,
+    scenario TEXT NOT NULL,
+    project_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    lease_owner TEXT,
+    lease_expires_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    input BLOB NOT NULL,
+    result BLOB
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, lease_expires_at);
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class QueueStatus(BaseModel):
+    pending: int = 0
+    leased: int = 0
+    completed: int = 0
+    failed: int = 0
+    enqueue_complete: bool = False
+
+    @property
+    def total(self) -> int:
+        return self.pending + self.leased + self.completed + self.failed
+
+    @property
+    def is_complete(self) -> bool:
+        # An empty queue only means the run is over once the coordinator has enqueued every task
+        return self.enqueue_complete and self.pending == 0 and self.leased == 0
+
+
+def _compress(model: BaseModel) -> bytes:
+    return zlib.compress(model.model_dump_json().encode("utf-8"))
+
+
+def _decompress(blob: bytes) -> dict:
+    return json.loads(zlib.decompress(blob))
+
+
+def run_identity(config: SensitivitySettings, metadata: RunMetadata | None = None) -> str:
+    # Everything that decides the tasks and their results, but not when the run was started, so a restarted
+    # coordinator resumes its own queue
+    identity = {
+        "config": config.model_dump(mode="json"),
+        "engine_version": metadata.engine_version if metadata else None,
+        "assessment_revisions": metadata.assessment_revisions if metadata else None,
+    }
+    return hashlib.sha256(json.dumps(identity, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    def __init__(
+        self,
+        path: str,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ) -> None:
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # Explicit transactions only, so claims can take the write lock with BEGIN IMMEDIATE
+        connection = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT_SECONDS, isolation_level=None)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def bind_run(self, identity: str, reset: bool = False) -> None:
+        # A queue only ever holds one run, completed tasks of another run must not come back as this run's results
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute("SELECT value FROM metadata WHERE key = ?", (RUN_IDENTITY_KEY,)).fetchone()
+            has_tasks = connection.execute("SELECT 1 FROM tasks LIMIT 1").fetchone() is not None
+            stored_identity = row[0] if row else None
+            if stored_identity != identity and (stored_identity is not None or has_tasks):
+                if not reset:
+                    connection.execute("ROLLBACK")
+                    raise ValueError(
+                        f"{self.path} holds tasks of a different run. Use a new analysis name, delete the queue "
+                        "or reset it to start this run"
+                    )
+                logging.warning(f"Clearing the tasks of a different run from {self.path}")
+                connection.execute("DELETE FROM tasks")
+                connection.execute("DELETE FROM metadata")
+            connection.execute(
+                "INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)", (RUN_IDENTITY_KEY, identity)
+            )
+            connection.execute("COMMIT")
+
+    def mark_enqueue_complete(self) -> None:
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)", (ENQUEUE_COMPLETE_KEY, str(time.time()))
+            )
+
+    def set_metadata(self, metadata: RunMetadata) -> None:
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO metadata (key, value) VALUES ('run_metadata', ?)", (metadata.model_dump_json(),)
+            )
+
+    def get_metadata(self) -> RunMetadata | None:
+        with self._connect() as connection:
+            row = connection.execute("SELECT value FROM metadata WHERE key = 'run_metadata'").fetchone()
+        return RunMetadata.model_validate_json(row[0]) if row else None
+
+    def enqueue(self, assessments: list[IndividualSensitivityInput]) -> int:
+        rows = [
+            (
+                json.dumps(sensitivity_key(assessment)),
+                assessment.scenario,
+                assessment.project_id,
+                PENDING,
+                _compress(assessment),
+            )
+            for assessment in assessments
+        ]
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            before = connection.total_changes
+            # Ignoring existing keys lets a restarted coordinator re-enqueue without duplicating work
+            connection.executemany(
+                "INSERT OR IGNORE INTO tasks (task_key, scenario, project_id, status, input) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            added = connection.total_changes - before
+            connection.execute("COMMIT")
+        return added
+
+    def claim(self, worker_id: str, limit: int) -> list[tuple[int, IndividualSensitivityInput]]:
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            expired = connection.execute(
+                "UPDATE tasks SET status = ?, lease_owner = NULL, lease_expires_at = NULL "
+                "WHERE status = ? AND lease_expires_at < ? AND attempts >= ?",
+                (FAILED, LEASED, now, self.max_attempts),
+            ).rowcount
+            if expired:
+                logging.warning(f"Marked {expired} tasks as failed after {self.max_attempts} lost leases")
+            rows = connection.execute(
+                "SELECT task_id, input FROM tasks WHERE status = ? OR (status = ? AND lease_expires_at < ?) "
+                "ORDER BY task_id LIMIT ?",
+                (PENDING, LEASED, now, limit),
+            ).fetchall()
+            connection.executemany(
+                "UPDATE tasks SET status = ?, lease_owner = ?, lease_expires_at = ?, attempts = attempts + 1 "
+                "WHERE task_id = ?",
+                [(LEASED, worker_id, now + self.lease_seconds, task_id) for task_id, _ in rows],
+            )
+            connection.execute("COMMIT")
+        return [(task_id, IndividualSensitivityInput(**_decompress(blob))) for task_id, blob in rows]
+
+    def renew_leases(self, worker_id: str, task_ids: list[int]) -> None:
+        expires_at = time.time() + self.lease_seconds
+        with self._connect() as connection:
+            connection.executemany(
+                "UPDATE tasks SET lease_expires_at = ? WHERE task_id = ? AND status = ? AND lease_owner = ?",
+                [(expires_at, task_id, LEASED, worker_id) for task_id in task_ids],
+            )
+
+    def complete(self, results: list[tuple[int, IndividualSensitivityResult]]) -> None:
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            # A task whose lease was lost may be finished twice, the results are equivalent so the first one wins
+            connection.executemany(
+                "UPDATE tasks SET status = ?, lease_owner = NULL, lease_expires_at = NULL, result = ? "
+                "WHERE task_id = ? AND status != ?",
+                [(COMPLETED, _compress(result), task_id, COMPLETED) for task_id, result in results],
+            )
+            connection.execute("COMMIT")
+
+    def status(self) -> QueueStatus:
+        with self._connect() as connection:
+            counts = dict(connection.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall())
+            enqueue_complete = (
+                connection.execute("SELECT 1 FROM metadata WHERE key = ?", (ENQUEUE_COMPLETE_KEY,)).fetchone()
+                is not None
+            )
+        return QueueStatus(**counts, enqueue_complete=enqueue_complete)
+
+    def iter_results(self) -> Iterator[IndividualSensitivityResult]:
+        with self._connect() as connection:
+            for status, input_blob, result_blob in connection.execute(
+                "SELECT status, input, result FROM tasks WHERE status IN (?, ?) ORDER BY task_id", (COMPLETED, FAILED)
+            ):
+                if status == COMPLETED:
+                    yield IndividualSensitivityResult(**_decompress(result_blob))
+                else:
+                    yield IndividualSensitivityResult(
+                        **IndividualSensitivityInput(**_decompress(input_blob)).model_dump(
+                            exclude={"engine_input_json", "reason_for_no_assessment"}
+                        ),
+                        results=None,
+                        reason_for_no_assessment=ErrorReasons.CALCULATION_ERROR,
+                    )
+
+
+class _LeaseHeartbeat:
+    def __init__(self, queue: WorkQueue, worker_id: str, task_ids: list[int]) -> None:
+        self._queue = queue
+        self._worker_id = worker_id
+        self._task_ids = task_ids
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self._queue.lease_seconds / 3):
+            self._queue.renew_leases(self._worker_id, self._task_ids)
+
+    def __enter__(self) -> "_LeaseHeartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+
+def enqueue_sensitivity_tasks(
+    queue: WorkQueue,
+    base_assessments: BaseAssessments,
+    config: SensitivitySettings,
+    metadata: RunMetadata | None = None,
+    batch_size: int = 5000,
+    reset: bool = False,
+) -> int:
+    queue.bind_run(run_identity(config, metadata), reset=reset)
+    if metadata is not None:
+        queue.set_metadata(metadata)
+    enqueued = 0
+    for batch_of_assessments in scenario_builder(base_assessments, config, batch_size=batch_size):
+        enqueued += queue.enqueue(batch_of_assessments)
+    # Workers treat an empty queue as the end of the run only after this
+    queue.mark_enqueue_complete()
+    logging.info(f"Enqueued {enqueued} tasks in {queue.path}")
+    return enqueued
+
+
+def run_worker(
+    queue: WorkQueue,
+    claim_size: int,
+    worker_id: str | None = None,
+    failure_archive_file: str = FAILURE_ARCHIVE_FILE,
+) -> int:
+    worker_id = worker_id or default_worker_id()
+    start_time = time.time()
+    processed = 0
+    pool = EnginePool(get_environment_variables().get_calculation_endpoints())
+    logging.info(f"Worker {worker_id} started on {queue.path}")
+    while True:
+        claimed = queue.claim(worker_id, claim_size)
+        if not claimed:
+            status = queue.status()
+            if status.is_complete:
+                break
+            if not status.enqueue_complete:
+                # Started before the coordinator, or while it is still enqueueing
+                logging.info("No tasks to claim, waiting for the coordinator to enqueue")
+            else:
+                # Other workers hold leases, wait in case one of them is lost and needs picking up
+                logging.info(f"No tasks to claim, {status.leased} leased by other workers. Waiting")
+            time.sleep(POLL_INTERVAL_SECONDS)
+            continue
+
+        task_ids = [task_id for task_id, _ in claimed]
+        task_ids_by_key = {sensitivity_key(assessment): task_id for task_id, assessment in claimed}
+        logging.info(f"Worker {worker_id} claimed {len(claimed)} tasks")
+        with _LeaseHeartbeat(queue, worker_id, task_ids):
+            results = run_gem_assessments_asyncio([assessment for _, assessment in claimed], failure_archive_file, pool)
+        queue.complete([(task_ids_by_key[sensitivity_key(result)], result) for result in results])
+        processed += len(claimed)
+
+    pool.log_metrics()
+    logging.info(
+        f"Worker {worker_id} finished. Processed {processed} tasks in {format_time_taken(time.time() - start_time)}"
+    )
+    return processed
+
+
+def wait_for_completion(queue: WorkQueue, poll_interval: float = POLL_INTERVAL_SECONDS) -> QueueStatus:
+    while True:
+        status = queue.status()
+        logging.info(
+            f"Queue progress: {status.completed + status.failed}/{status.total} done "
+            f"({status.pending} pending, {status.leased} leased, {status.failed} failed)"
+        )
+        if status.is_complete:
+            return status
+        time.sleep(poll_interval)
+
+
+def collect_results(queue: WorkQueue) -> ResultsStore:
+    sensitivity_results = ResultsStore(metadata=queue.get_metadata())
+    sensitivity_results.extend(queue.iter_results())
+    return sensitivity_results
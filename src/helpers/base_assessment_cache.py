@@ -0,0 +1,25 @@
+import json
+import logging
+import os
+
+from src.models.gem_assessments import BaseAssessments
+
+logger = logging.getLogger(__name__)
+
+
+def base_assessment_cache_path(results_directory: str, analysis_name: str) -> str:
+    return os.path.join(results_directory, f"{analysis_name}_base_assessments.json")
+
+
+def save_base_assessments(base_assessments: BaseAssessments, file_path: str) -> None:
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write(base_assessments.model_dump_json())
+    logging.info(f"Cached {len(base_assessments.assessments)} base assessments to {file_path}")
+
+
+def load_base_assessments(file_path: str) -> BaseAssessments:
+    with open(file_path, encoding="utf-8") as f:
+        base_assessments = BaseAssessments(**json.load(f))
+    logging.info(f"Loaded {len(base_assessments.assessments)} cached base assessments from {file_path}")
+    return base_assessments
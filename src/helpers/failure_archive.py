@@ -0,0 +1,137 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from collections.abc import Iterator
+from types import TracebackType
+
+from src.models.gem_assessments import IndividualSensitivityInput, IndividualSensitivityResult, sensitivity_key
+
+logger = logging.getLogger(__name__)
+
+FAILURE_ARCHIVE_DIRECTORY = "error_logs"
+FAILURE_ARCHIVE_FILE = os.path.join(FAILURE_ARCHIVE_DIRECTORY, "failures.db")
+WRITE_BATCH_SIZE = 500
+WRITE_INTERVAL_SECONDS = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS failures (
+    failure_id INTEGER PRIMARY KEY,
+    task_key TEXT NOT NULL,
+    project_id TEXT NOT NULL,
+    project_name TEXT NOT NULL,
+    scenario TEXT NOT NULL,
+    error TEXT NOT NULL,
+    failed_at REAL NOT NULL,
+    replayed INTEGER NOT NULL DEFAULT 0,
+    input BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS failures_task_key ON failures (task_key);
+CREATE INDEX IF NOT EXISTS failures_project ON failures (project_id, scenario);
+CREATE INDEX IF NOT EXISTS failures_replayed ON failures (replayed);
+"""
+
+FailureRow = tuple[str, str, str, str, str, float, bytes]
+
+
+def failure_archive_path(analysis_name: str) -> str:
+    return os.path.join(FAILURE_ARCHIVE_DIRECTORY, f"{analysis_name}_failures.db")
+
+
+def _task_key(assessment: IndividualSensitivityInput | IndividualSensitivityResult) -> str:
+    return json.dumps(sensitivity_key(assessment), default=str)
+
+
+class FailureArchive:
+    def __init__(self, path: str = FAILURE_ARCHIVE_FILE) -> None:
+        self.path = path
+        self._queue: queue.Queue[tuple[IndividualSensitivityInput, str] | None] = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self.failures = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=60)
+
+    def __enter__(self) -> "FailureArchive":
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join()
+        if self.failures:
+            logging.warning(f"Archived {self.failures} failed assessments to {self.path}")
+
+    def submit(self, assessment: IndividualSensitivityInput, error: BaseException | str) -> None:
+        # Serialising and writing happens on the writer thread so the event loop is never blocked by disk
+        self.failures += 1
+        self._queue.put((assessment, str(error)))
+
+    def _write_loop(self) -> None:
+        connection = self._connect()
+        try:
+            stopped = False
+            while not stopped:
+                rows: list[FailureRow] = []
+                deadline = time.time() + WRITE_INTERVAL_SECONDS
+                while len(rows) < WRITE_BATCH_SIZE:
+                    try:
+                        item = self._queue.get(timeout=max(deadline - time.time(), 0.01))
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stopped = True
+                        break
+                    assessment, error = item
+                    rows.append(
+                        (
+                            _task_key(assessment),
+                            assessment.project_id,
+                            assessment.project_name,
+                            assessment.scenario,
+                            error,
+                            time.time(),
+                            zlib.compress(assessment.model_dump_json().encode("utf-8")),
+                        )
+                    )
+                if rows:
+                    with connection:
+                        connection.executemany(
+                            "INSERT INTO failures "
+                            "(task_key, project_id, project_name, scenario, error, failed_at, input) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            rows,
+                        )
+        finally:
+            connection.close()
+
+    def iter_unreplayed(self) -> Iterator[IndividualSensitivityInput]:
+        # A combination that failed several times is only replayed once, using its latest input
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT input FROM failures WHERE failure_id IN "
+                "(SELECT MAX(failure_id) FROM failures WHERE replayed = 0 GROUP BY task_key) ORDER BY failure_id"
+            ).fetchall()
+        for (blob,) in rows:
+            yield IndividualSensitivityInput(**json.loads(zlib.decompress(blob)))
+
+    def mark_replayed(self, assessments: list[IndividualSensitivityResult]) -> None:
+        with self._connect() as connection:
+            connection.executemany(
+                "UPDATE failures SET replayed = 1 WHERE task_key = ?",
+                [(_task_key(assessment),) for assessment in assessments],
+            )
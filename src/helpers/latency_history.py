@@ -0,0 +1,65 @@
+import json
+import logging
+import os
+import statistics
+
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+LATENCY_HISTORY_FILE = os.path.join("results", "latency_history.json")
+DEFAULT_ENGINE_LATENCY_SECONDS = 30.0
+MAX_RECENT_SAMPLES = 50
+
+
+class ProjectLatency(BaseModel):
+    count: int = 0
+    mean_seconds: float = 0.0
+    max_seconds: float = 0.0
+    recent_seconds: list[float] = Field(default_factory=list)
+
+    def record(self, seconds: float) -> None:
+        self.count += 1
+        self.mean_seconds += (seconds - self.mean_seconds) / self.count
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.recent_seconds.append(seconds)
+        if len(self.recent_seconds) > MAX_RECENT_SAMPLES:
+            self.recent_seconds = self.recent_seconds[-MAX_RECENT_SAMPLES:]
+
+
+class LatencyHistory(BaseModel):
+    projects: dict[str, ProjectLatency] = Field(default_factory=dict)
+
+    def record(self, project_id: str, seconds: float) -> None:
+        self.projects.setdefault(project_id, ProjectLatency()).record(seconds)
+
+    def mean_seconds(self, project_id: str) -> float | None:
+        latency = self.projects.get(project_id)
+        if latency is None or latency.count == 0:
+            return None
+        return latency.mean_seconds
+
+    def percentile_seconds(self, percentile: float) -> float | None:
+        samples = [sample for latency in self.projects.values() for sample in latency.recent_seconds]
+        if not samples:
+            return None
+        if len(samples) == 1:
+            return samples[0]
+        return statistics.quantiles(samples, n=100, method="inclusive")[min(max(int(percentile), 1), 99) - 1]
+
+
+def load_latency_history(file_path: str = LATENCY_HISTORY_FILE) -> LatencyHistory:
+    if not os.path.exists(file_path):
+        return LatencyHistory()
+    with open(file_path, encoding="utf-8") as f:
+        return LatencyHistory(**json.load(f))
+
+
+def save_latency_history(history: LatencyHistory, file_path: str = LATENCY_HISTORY_FILE) -> None:
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    # Write then rename so concurrent workers never leave a half written file behind
+    temporary_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        f.write(history.model_dump_json(indent=2))
+    os.replace(temporary_path, file_path)
+    logging.info(f"Saved latency history for {len(history.projects)} projects to {file_path}")
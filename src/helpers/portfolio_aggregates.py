@@ -0,0 +1,83 @@
+import math
+from typing import TYPE_CHECKING, Any
+
+from openpyxl import Workbook
+
+# pandas is only imported once summaries are computed, so commands that import the Excel export start quickly
+if TYPE_CHECKING:
+    import pandas as pd
+
+SCENARIO_COLUMNS = [
+    "Scenario Name",
+    "Discount Rate Adjustment",
+    "Capex Adjustment",
+    "Power Prices Adjustment",
+    "Opex Adjustment",
+    "Lifetime Adjustment",
+    "Financial Close Date Adjustment",
+    "Energy Yield Adjustment",
+]
+PORTFOLIO_COLUMNS = ["Portfolio", "Technology"]
+VALUE_COLUMNS = [
+    "Development Fee",
+    "IRR",
+    "Installed Capacity",
+    "Energy Yield",
+    "Projects with Positive Development Fee",
+]
+AGGREGATE_COLUMNS = [*SCENARIO_COLUMNS, *PORTFOLIO_COLUMNS, *VALUE_COLUMNS]
+PERCENTILES = [0.1, 0.5, 0.9]
+
+# Sheet name -> grouping columns
+SUMMARY_SHEETS = {
+    "Portfolio Summary": [*SCENARIO_COLUMNS, *PORTFOLIO_COLUMNS],
+    "Scenario Summary": SCENARIO_COLUMNS,
+}
+
+
+def compute_aggregates(results: "pd.DataFrame", group_columns: list[str]) -> "pd.DataFrame":
+    # Adjustments a scenario does not sweep are empty, so missing keys must still form groups
+    grouped = results.groupby(group_columns, dropna=False, sort=True)
+    aggregates = grouped.agg(
+        **{
+            "Projects": ("Development Fee", "size"),
+            "Projects with Positive Development Fee": ("Projects with Positive Development Fee", "sum"),
+            "Total Development Fee": ("Development Fee", "sum"),
+            "Mean Development Fee": ("Development Fee", "mean"),
+            "Mean IRR": ("IRR", "mean"),
+            "Total Installed Capacity": ("Installed Capacity", "sum"),
+            "Total Energy Yield": ("Energy Yield", "sum"),
+        }
+    )
+    # Assigned by position, index alignment would not match the empty adjustment keys
+    for percentile in PERCENTILES:
+        aggregates[f"P{round(percentile * 100)} Development Fee"] = (
+            grouped["Development Fee"].quantile(percentile).to_numpy()
+        )
+    return aggregates.reset_index()
+
+
+def compute_summary_sheets(rows: list[tuple[Any, ...]]) -> dict[str, "pd.DataFrame"]:
+    import pandas as pd
+
+    results = pd.DataFrame.from_records(rows, columns=AGGREGATE_COLUMNS)
+    for column in VALUE_COLUMNS:
+        results[column] = pd.to_numeric(results[column], errors="coerce")
+    return {sheet: compute_aggregates(results, group_columns) for sheet, group_columns in SUMMARY_SHEETS.items()}
+
+
+def _cell_value(value: Any) -> Any:
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+
+def write_summary_sheets(wb: Workbook, summaries: dict[str, "pd.DataFrame"]) -> None:
+    for sheet, aggregates in summaries.items():
+        if sheet in wb.sheetnames:
+            del wb[sheet]
+        ws = wb.create_sheet(sheet)
+        ws.append(list(aggregates.columns))
+        for row in aggregates.itertuples(index=False):
+            ws.append([_cell_value(value) for value in row])
+        ws.freeze_panes = "A2"
@@ -0,0 +1,129 @@
+import json
+import logging
+import re
+from collections.abc import Collection, Iterator
+from typing import Any, TextIO
+
+from src.models.gem_assessments import IndividualSensitivityResult, RunMetadata
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 1 << 20
+RESULTS_KEY = "assessments"
+METADATA_KEY = "metadata"
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = re.compile(r"\s*")
+
+
+class _JsonStream:
+    def __init__(self, f: TextIO) -> None:
+        self._f = f
+        self._buffer = ""
+        self._position = 0
+
+    def _fill(self) -> bool:
+        chunk = self._f.read(READ_CHUNK_SIZE)
+        if not chunk:
+            return False
+        self._buffer = self._buffer[self._position :] + chunk
+        self._position = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            self._position = _WHITESPACE.match(self._buffer, self._position).end()  # type: ignore[union-attr]
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if not self._fill():
+                raise ValueError("Unexpected end of results file")
+
+    def expect(self, character: str) -> None:
+        if self.peek() != character:
+            raise ValueError(f"Expected '{character}' in results file, found '{self.peek()}'")
+        self._position += 1
+
+    def skip(self, character: str) -> bool:
+        if self.peek() == character:
+            self._position += 1
+            return True
+        return False
+
+    def value(self) -> Any:
+        self.peek()
+        # A value may straddle the end of the buffer, so keep reading until it decodes
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            if end == len(self._buffer) and self._fill():
+                # Numbers at the end of the buffer may be truncated, decode again with more data
+                continue
+            self._position = end
+            return value
+
+    def skip_value(self) -> None:
+        # Arrays are skipped one element at a time, so the results list is never held in memory
+        if not self.skip("["):
+            self.value()
+            return
+        if self.skip("]"):
+            return
+        while True:
+            self.value()
+            if self.skip("]"):
+                return
+            self.expect(",")
+
+
+def iter_results_file(
+    file_path: str,
+    scenarios: Collection[str] | None = None,
+    project_ids: Collection[str] | None = None,
+) -> Iterator[IndividualSensitivityResult]:
+    with open(file_path, encoding="utf-8") as f:
+        stream = _JsonStream(f)
+        stream.expect("{")
+        while True:
+            key = stream.value()
+            stream.expect(":")
+            if key == RESULTS_KEY:
+                break
+            stream.value()
+            if not stream.skip(","):
+                raise ValueError(f"No '{RESULTS_KEY}' in {file_path}")
+
+        stream.expect("[")
+        if stream.skip("]"):
+            return
+        while True:
+            data = stream.value()
+            # Filter on the raw dict so skipped rows are never validated
+            if (scenarios is None or data.get("scenario") in scenarios) and (
+                project_ids is None or data.get("project_id") in project_ids
+            ):
+                yield IndividualSensitivityResult.model_validate(data)
+            if stream.skip("]"):
+                return
+            stream.expect(",")
+
+
+def read_results_metadata(file_path: str) -> RunMetadata | None:
+    # The metadata is written after the results, so the results are streamed past without validating them
+    with open(file_path, encoding="utf-8") as f:
+        stream = _JsonStream(f)
+        stream.expect("{")
+        if stream.skip("}"):
+            return None
+        while True:
+            key = stream.value()
+            stream.expect(":")
+            if key == METADATA_KEY:
+                metadata = stream.value()
+                return RunMetadata.model_validate(metadata) if metadata is not None else None
+            stream.skip_value()
+            if not stream.skip(","):
+                return None
@@ -0,0 +1,389 @@
+import csv
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any
+
+from pydantic import BaseModel, Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+from src.helpers.format_time_taken import format_time_taken
+from src.models.enums.error_reasons import ErrorReasons
+from src.models.enums.sensitivities import ScenarioComponents
+from src.models.gem_assessments import IndividualSensitivityResult, RunMetadata
+from src.models.results_store import (
+    COMPONENTS,
+    DATE_RESULT_FIELDS,
+    FLOAT_RESULT_FIELDS,
+    PROJECT_FIELDS,
+    ROW_FIELDS,
+    ResultsStore,
+    result_row,
+)
+from src.models.settings import SensitivitySettings
+
+logger = logging.getLogger(__name__)
+
+INSERT_BATCH_SIZE = 10_000
+ANALYSIS_LIMIT = 1000
+NUMERIC_KPIS = (*FLOAT_RESULT_FIELDS, "lifetime")
+# Prefixed, as some components share their name with a KPI, e.g. discount_rate
+COMPONENT_VALUES = tuple(component.value for component in COMPONENTS)
+COMPONENT_COLUMNS = tuple(f"component_{component}" for component in COMPONENT_VALUES)
+# In ROW_FIELDS order, with the component columns prefixed
+RESULT_COLUMNS = (
+    "run_id",
+    *PROJECT_FIELDS,
+    "scenario",
+    "reason_for_no_assessment",
+    *COMPONENT_COLUMNS,
+    *FLOAT_RESULT_FIELDS,
+    *DATE_RESULT_FIELDS,
+    "lifetime",
+    "additional_kpis",
+)
+
+RESULT_COLUMN_DEFINITIONS = ",\n    ".join(
+    [
+        "result_id INTEGER PRIMARY KEY",
+        "run_id INTEGER NOT NULL",
+        "project_id TEXT NOT NULL",
+        "project_name TEXT NOT NULL",
+        "technology TEXT",
+        "phase INTEGER",
+        "country TEXT",
+        "currency TEXT",
+        "scenario TEXT NOT NULL",
+        "reason_for_no_assessment TEXT",
+        *(f"{column} REAL" for column in COMPONENT_COLUMNS),
+        *(f"{field} REAL" for field in FLOAT_RESULT_FIELDS),
+        *(f"{field} TEXT" for field in DATE_RESULT_FIELDS),
+        "lifetime INTEGER",
+        "additional_kpis TEXT",
+    ]
+)
+# A partial index per component only holds the rows whose combination varies it, so ingesting a row pays for the
+# components it uses rather than all of them
+COMPONENT_INDEXES = "\n".join(
+    f"CREATE INDEX IF NOT EXISTS results_{column} ON results ({column}, scenario) WHERE {column} IS NOT NULL;"
+    for column in COMPONENT_COLUMNS
+)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    recorded_at TEXT NOT NULL,
+    config_hash TEXT,
+    engine_version TEXT,
+    duration_seconds REAL,
+    assessments INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS runs_name ON runs (name, run_id);
+CREATE TABLE IF NOT EXISTS run_revisions (
+    run_id INTEGER NOT NULL,
+    project_key TEXT NOT NULL,
+    revision TEXT NOT NULL,
+    PRIMARY KEY (run_id, project_key)
+) WITHOUT ROWID;
+-- One column per scenario component, NULL when the combination does not vary it
+CREATE TABLE IF NOT EXISTS results (
+    {RESULT_COLUMN_DEFINITIONS}
+);
+CREATE INDEX IF NOT EXISTS results_project ON results (project_id, scenario, run_id);
+CREATE INDEX IF NOT EXISTS results_scenario ON results (scenario, run_id);
+CREATE INDEX IF NOT EXISTS results_run ON results (run_id);
+{COMPONENT_INDEXES}
+"""
+
+
+class HistorySettings(BaseSettings):
+    model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
+    enabled: bool = Field(True, alias="GEM_RUN_HISTORY")
+    file: str = Field(os.path.join("results", "run_history.db"), alias="GEM_RUN_HISTORY_FILE")
+
+
+class RunRecord(BaseModel):
+    run_id: int
+    name: str
+    created_at: datetime
+    recorded_at: datetime
+    config_hash: str | None
+    engine_version: str | None
+    duration_seconds: float | None
+    assessments: int
+    failures: int
+
+
+class TrendPoint(BaseModel):
+    run_id: int
+    name: str
+    created_at: datetime
+    engine_version: str | None
+    project_id: str
+    project_name: str
+    scenario: str
+    combination: dict[str, float]
+    reason_for_no_assessment: str | None
+    # Changes when the project's live assessment changed between runs
+    revision: str | None
+    value: float | None
+
+
+def config_hash(config: SensitivitySettings) -> str:
+    return hashlib.sha256(config.model_dump_json().encode("utf-8")).hexdigest()
+
+
+REASON_POSITION = ROW_FIELDS.index("reason_for_no_assessment")
+DATE_POSITIONS = tuple(ROW_FIELDS.index(field) for field in DATE_RESULT_FIELDS)
+
+
+def _sql_row(run_id: int, row: tuple[Any, ...]) -> tuple[Any, ...]:
+    values = list(row)
+    reason = values[REASON_POSITION]
+    values[REASON_POSITION] = reason.value if reason is not None else None
+    for position in DATE_POSITIONS:
+        if values[position] is not None:
+            values[position] = values[position].isoformat()
+    if values[-1] is not None:
+        values[-1] = json.dumps(values[-1], default=str)
+    return (run_id, *values)
+
+
+def _kpi_expression(kpi: str) -> tuple[str, tuple[Any, ...]]:
+    # Column names cannot be bound, so only known KPIs are put in the SQL and GEM_ADDITIONAL_KPIS go through JSON
+    if kpi in NUMERIC_KPIS:
+        return f"r.{kpi}", ()
+    return "json_extract(r.additional_kpis, ?)", (f'$."{kpi}"',)
+
+
+class RunHistory:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        connection = sqlite3.connect(self.path, timeout=60)
+        connection.execute("PRAGMA journal_mode = WAL")
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def record_run(
+        self,
+        name: str,
+        results: Iterable[IndividualSensitivityResult],
+        metadata: RunMetadata | None = None,
+        config_hash: str | None = None,
+        duration_seconds: float | None = None,
+    ) -> int:
+        start_time = time.time()
+        with self._connect() as connection, connection:
+            (run_id,) = connection.execute(
+                "INSERT INTO runs (name, created_at, recorded_at, config_hash, engine_version, duration_seconds) "
+                "VALUES (?, ?, ?, ?, ?, ?) RETURNING run_id",
+                (
+                    name,
+                    (metadata.created_at if metadata is not None else datetime.now()).isoformat(),
+                    datetime.now().isoformat(),
+                    config_hash,
+                    metadata.engine_version if metadata is not None else None,
+                    duration_seconds,
+                ),
+            ).fetchone()
+            if metadata is not None:
+                connection.executemany(
+                    "INSERT INTO run_revisions (run_id, project_key, revision) VALUES (?, ?, ?)",
+                    [(run_id, project, revision) for project, revision in metadata.assessment_revisions.items()],
+                )
+
+            insert = (
+                f"INSERT INTO results ({', '.join(RESULT_COLUMNS)}) VALUES ({', '.join('?' * len(RESULT_COLUMNS))})"
+            )
+            assessments = 0
+            failures = 0
+            rows: list[tuple[Any, ...]] = []
+            # A ResultsStore hands over its columns directly, which is several times faster than rebuilding models
+            flat_rows = results.iter_rows() if isinstance(results, ResultsStore) else map(result_row, results)
+            for row in flat_rows:
+                rows.append(_sql_row(run_id, row))
+                assessments += 1
+                failures += row[REASON_POSITION] is ErrorReasons.CALCULATION_ERROR
+                if len(rows) >= INSERT_BATCH_SIZE:
+                    connection.executemany(insert, rows)
+                    rows = []
+            connection.executemany(insert, rows)
+            connection.execute(
+                "UPDATE runs SET assessments = ?, failures = ? WHERE run_id = ?", (assessments, failures, run_id)
+            )
+            # Sampled statistics let the planner pick the most selective index, e.g. project rather than component
+            connection.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+            connection.execute("ANALYZE")
+        logging.info(
+            f"Recorded run {run_id} ({name}) with {assessments} assessments to {self.path} "
+            f"in {format_time_taken(time.time() - start_time)}"
+        )
+        return run_id
+
+    def runs(self, name: str | None = None, last_runs: int | None = None) -> list[RunRecord]:
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT run_id, name, created_at, recorded_at, config_hash, engine_version, duration_seconds, "
+                "assessments, failures FROM runs WHERE (? IS NULL OR name = ?) ORDER BY run_id DESC LIMIT ?",
+                (name, name, last_runs if last_runs is not None else -1),
+            ).fetchall()
+        return [RunRecord(**dict(zip(RunRecord.model_fields, row))) for row in reversed(rows)]
+
+    def trend(
+        self,
+        project_id: str,
+        kpi: str = "development_fee",
+        scenario: str | None = None,
+        combination: dict[ScenarioComponents, float] | None = None,
+        name: str | None = None,
+        last_runs: int | None = None,
+    ) -> list[TrendPoint]:
+        # Components not in the combination are left unconstrained
+        kpi_expression, kpi_parameters = _kpi_expression(kpi)
+        conditions = ["r.project_id = ?"]
+        parameters: list[Any] = [project_id]
+        if scenario is not None:
+            conditions.append("r.scenario = ?")
+            parameters.append(scenario)
+        for component, value in (combination or {}).items():
+            conditions.append(f"r.component_{component.value} = ?")
+            parameters.append(value)
+        if name is not None or last_runs is not None:
+            conditions.append(
+                "r.run_id IN (SELECT run_id FROM runs WHERE (? IS NULL OR name = ?) ORDER BY run_id DESC LIMIT ?)"
+            )
+            parameters.extend([name, name, last_runs if last_runs is not None else -1])
+
+        query = (
+            f"SELECT r.run_id, runs.name, runs.created_at, runs.engine_version, r.project_id, r.project_name, "
+            f"r.scenario, {', '.join(f'r.{column}' for column in COMPONENT_COLUMNS)}, r.reason_for_no_assessment, "
+            f"rev.revision, {kpi_expression} "
+            "FROM results r JOIN runs ON runs.run_id = r.run_id "
+            "LEFT JOIN run_revisions rev ON rev.run_id = r.run_id "
+            "AND rev.project_key = r.project_id || '/' || r.project_name "
+            f"WHERE {' AND '.join(conditions)} ORDER BY r.run_id, r.scenario, r.result_id"
+        )
+        with self._connect() as connection:
+            rows = connection.execute(query, (*kpi_parameters, *parameters)).fetchall()
+
+        points = []
+        for row in rows:
+            run_id, run_name, created_at, engine_version, row_project_id, project_name, row_scenario = row[:7]
+            components = row[7 : 7 + len(COMPONENT_COLUMNS)]
+            reason, revision, value = row[7 + len(COMPONENT_COLUMNS) :]
+            points.append(
+                TrendPoint(
+                    run_id=run_id,
+                    name=run_name,
+                    created_at=created_at,
+                    engine_version=engine_version,
+                    project_id=row_project_id,
+                    project_name=project_name,
+                    scenario=row_scenario,
+                    combination={
+                        component.value: value for component, value in zip(COMPONENTS, components) if value is not None
+                    },
+                    reason_for_no_assessment=reason,
+                    revision=revision,
+                    value=value,
+                )
+            )
+        return points
+
+
+def record_run_history(
+    name: str,
+    sensitivity_results: ResultsStore,
+    config: SensitivitySettings,
+    duration_seconds: float,
+    settings: HistorySettings | None = None,
+) -> None:
+    settings = settings if settings is not None else HistorySettings()  # type: ignore
+    if not settings.enabled:
+        return
+    # The results are already written, so a history that cannot be updated should not fail the run
+    try:
+        RunHistory(settings.file).record_run(
+            name, sensitivity_results, sensitivity_results.metadata, config_hash(config), duration_seconds
+        )
+    except sqlite3.Error as e:
+        logging.warning(f"Could not record {name} in the run history {settings.file}: {e}")
+
+
+def format_runs(runs: list[RunRecord]) -> str:
+    lines = [
+        f"{'run':>6}  {'name':<24}{'created':<21}{'engine':<12}{'assessments':>12}{'failures':>10}{'duration':>12}"
+    ]
+    for run in runs:
+        duration = format_time_taken(run.duration_seconds) if run.duration_seconds is not None else "-"
+        lines.append(
+            f"{run.run_id:>6}  {run.name:<24}{run.created_at:%Y-%m-%d %H:%M:%S}  {run.engine_version or '-':<12}"
+            f"{run.assessments:>12}{run.failures:>10}{duration:>12}"
+        )
+    return "\n" + "\n".join(lines)
+
+
+def format_trend(points: list[TrendPoint], kpi: str) -> str:
+    lines = [f"{'run':>6}  {'name':<24}{'created':<21}{'scenario':<24}{kpi:>18}  combination"]
+    for point in points:
+        value = f"{point.value:.6g}" if point.value is not None else point.reason_for_no_assessment or "-"
+        lines.append(
+            f"{point.run_id:>6}  {point.name:<24}{point.created_at:%Y-%m-%d %H:%M:%S}  {point.scenario:<24}"
+            f"{value:>18}  {point.combination}"
+        )
+    return "\n" + "\n".join(lines)
+
+
+def write_trend_csv(points: list[TrendPoint], file_path: str, kpi: str) -> None:
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    with open(file_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            [
+                "run_id",
+                "name",
+                "created_at",
+                "engine_version",
+                "project_id",
+                "project_name",
+                "scenario",
+                *COMPONENT_VALUES,
+                "reason_for_no_assessment",
+                "revision",
+                kpi,
+            ]
+        )
+        for point in points:
+            writer.writerow(
+                [
+                    point.run_id,
+                    point.name,
+                    point.created_at.isoformat(),
+                    point.engine_version,
+                    point.project_id,
+                    point.project_name,
+                    point.scenario,
+                    *(point.combination.get(component) for component in COMPONENT_VALUES),
+                    point.reason_for_no_assessment,
+                    point.revision,
+                    point.value,
+                ]
+            )
+    logging.info(f"Wrote {len(points)} trend points to {file_path}")
@@ -0,0 +1,198 @@
+import json
+import logging
+import math
+from itertools import product
+from typing import Any
+
+from pydantic import BaseModel, Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+from src.helpers.format_time_taken import format_time_taken
+from src.helpers.latency_history import DEFAULT_ENGINE_LATENCY_SECONDS, LatencyHistory
+from src.models.gem_assessments import BaseAssessments
+from src.models.sensitivity import ScenarioSensitivity
+from src.models.settings import SensitivitySettings
+
+logger = logging.getLogger(__name__)
+
+# In-memory python dicts are several times larger than the serialised engine input JSON
+PYTHON_OBJECT_OVERHEAD_FACTOR = 6
+RESULT_BYTES_PER_ASSESSMENT = 4_000
+WALL_TIME_LATENCY_PERCENTILE = 95
+
+SweepSignature = tuple[tuple[str, str], ...]
+
+
+class PlanSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
+    concurrency: int = Field(120, alias="GEM_CHUNK_SIZE")
+    max_engine_calls: int | None = Field(1_000_000, alias="GEM_PLAN_MAX_ENGINE_CALLS")
+    max_peak_memory_gb: float | None = Field(16.0, alias="GEM_PLAN_MAX_PEAK_MEMORY_GB")
+    max_wall_time_hours: float | None = Field(24.0, alias="GEM_PLAN_MAX_WALL_TIME_HOURS")
+    refuse_when_exceeded: bool = Field(False, alias="GEM_PLAN_REFUSE_WHEN_EXCEEDED")
+
+
+class ScenarioPlan(BaseModel):
+    scenario: str
+    combinations: int
+    unique_combinations: int
+    assessments: int
+
+
+class RunPlan(BaseModel):
+    projects: int
+    projects_with_engine_input: int
+    scenarios: list[ScenarioPlan]
+    total_assessments: int
+    dispatched_engine_calls: int
+    engine_calls: int
+    batch_size: int
+    concurrency: int
+    estimated_peak_memory_bytes: int
+    latency_seconds: float
+    latency_from_history: bool
+    estimated_wall_time_seconds: float
+    limit_violations: list[str] = Field(default_factory=list)
+
+
+class PlanLimitExceededError(ValueError):
+    pass
+
+
+def _sweep_signature(sensitivity: ScenarioSensitivity) -> SweepSignature:
+    sweeps = sensitivity.element_wise_parameter_sweep.values()
+    return tuple((sweep.component.value, sweep.type.value) for sweep in sweeps)
+
+
+def _effective_value_lists(sensitivity: ScenarioSensitivity) -> dict[str, list[float]]:
+    # generate_combinations keys on component, so a repeated component only keeps its last sweep's values
+    value_lists: dict[str, list[float]] = {}
+    for sweep in sensitivity.element_wise_parameter_sweep.values():
+        value_lists[sweep.component.value] = sweep.values
+    return value_lists
+
+
+def _count_unique_combinations(sensitivity: ScenarioSensitivity) -> int:
+    return math.prod(len(set(values)) for values in _effective_value_lists(sensitivity).values())
+
+
+def _count_unique_across_scenarios(sensitivities: list[ScenarioSensitivity]) -> int:
+    if len(sensitivities) == 1:
+        return _count_unique_combinations(sensitivities[0])
+    unique: set[tuple[Any, ...]] = set()
+    for sensitivity in sensitivities:
+        unique.update(product(*(sorted(set(values)) for values in _effective_value_lists(sensitivity).values())))
+    return len(unique)
+
+
+def _estimate_input_bytes(base_assessments: BaseAssessments) -> int:
+    sizes = [
+        len(json.dumps(assessment.engine_input_json))
+        for assessment in base_assessments.assessments
+        if assessment.engine_input_json is not None
+    ]
+    return max(sizes, default=0)
+
+
+def _check_limits(plan: RunPlan, settings: PlanSettings) -> list[str]:
+    violations = []
+    if settings.max_engine_calls is not None and plan.dispatched_engine_calls > settings.max_engine_calls:
+        violations.append(f"Engine calls {plan.dispatched_engine_calls} exceed limit of {settings.max_engine_calls}")
+    peak_memory_gb = plan.estimated_peak_memory_bytes / 1024**3
+    if settings.max_peak_memory_gb is not None and peak_memory_gb > settings.max_peak_memory_gb:
+        violations.append(f"Peak memory {peak_memory_gb:.2f} GB exceeds limit of {settings.max_peak_memory_gb} GB")
+    wall_time_hours = plan.estimated_wall_time_seconds / 3600
+    if settings.max_wall_time_hours is not None and wall_time_hours > settings.max_wall_time_hours:
+        violations.append(
+            f"Wall time {wall_time_hours:.2f} hours exceeds limit of {settings.max_wall_time_hours} hours"
+        )
+    return violations
+
+
+def plan_sensitivity_run(
+    base_assessments: BaseAssessments,
+    config: SensitivitySettings,
+    latency_history: LatencyHistory,
+    batch_size: int,
+    settings: PlanSettings,
+) -> RunPlan:
+    projects = len(base_assessments.assessments)
+    projects_with_input = sum(1 for a in base_assessments.assessments if a.engine_input_json is not None)
+
+    scenario_plans = []
+    scenarios_by_signature: dict[SweepSignature, list[ScenarioSensitivity]] = {}
+    for scenario_name, sensitivity in config.sensitivities.items():
+        combinations = len(sensitivity.generate_combinations())
+        scenario_plans.append(
+            ScenarioPlan(
+                scenario=scenario_name,
+                combinations=combinations,
+                unique_combinations=_count_unique_combinations(sensitivity),
+                assessments=combinations * projects,
+            )
+        )
+        scenarios_by_signature.setdefault(_sweep_signature(sensitivity), []).append(sensitivity)
+
+    unique_combinations = sum(_count_unique_across_scenarios(group) for group in scenarios_by_signature.values())
+    engine_calls = unique_combinations * projects_with_input
+    total_assessments = sum(scenario.assessments for scenario in scenario_plans)
+    dispatched_engine_calls = sum(scenario.combinations for scenario in scenario_plans) * projects_with_input
+
+    input_bytes = _estimate_input_bytes(base_assessments) * PYTHON_OBJECT_OVERHEAD_FACTOR
+    in_flight = min(settings.concurrency, batch_size)
+    estimated_peak_memory = (
+        batch_size * input_bytes + in_flight * input_bytes + total_assessments * RESULT_BYTES_PER_ASSESSMENT
+    )
+
+    history_latency = latency_history.percentile_seconds(WALL_TIME_LATENCY_PERCENTILE)
+    latency = history_latency if history_latency is not None else DEFAULT_ENGINE_LATENCY_SECONDS
+    # run_async_batches waits for every request in a chunk, so each chunk costs roughly its slowest request
+    estimated_wall_time = math.ceil(dispatched_engine_calls / max(settings.concurrency, 1)) * latency
+
+    plan = RunPlan(
+        projects=projects,
+        projects_with_engine_input=projects_with_input,
+        scenarios=scenario_plans,
+        total_assessments=total_assessments,
+        dispatched_engine_calls=dispatched_engine_calls,
+        engine_calls=engine_calls,
+        batch_size=batch_size,
+        concurrency=settings.concurrency,
+        estimated_peak_memory_bytes=estimated_peak_memory,
+        latency_seconds=latency,
+        latency_from_history=history_latency is not None,
+        estimated_wall_time_seconds=estimated_wall_time,
+    )
+    plan.limit_violations = _check_limits(plan, settings)
+    return plan
+
+
+def format_run_plan(plan: RunPlan) -> str:
+    scenario_lines = "\n".join(
+        f"  {s.scenario}: {s.combinations} combinations ({s.unique_combinations} unique), {s.assessments} assessments"
+        for s in plan.scenarios
+    )
+    latency_source = "previous runs" if plan.latency_from_history else "default, no history"
+    violations = "\n".join(f"  {violation}" for violation in plan.limit_violations) or "  None"
+    return (
+        "\n"
+        f"Projects: {plan.projects} ({plan.projects_with_engine_input} with engine input)\n"
+        f"Scenarios:\n{scenario_lines}\n"
+        f"Total assessments: {plan.total_assessments} | Engine calls: {plan.dispatched_engine_calls} "
+        f"({plan.engine_calls} after deduplication)\n"
+        f"Estimated peak memory (batch size {plan.batch_size}): "
+        f"{plan.estimated_peak_memory_bytes / 1024**3:.2f} GB\n"
+        f"Latency per chunk: {format_time_taken(plan.latency_seconds)} ({latency_source}) | "
+        f"Concurrency: {plan.concurrency}\n"
+        f"Projected wall time: {format_time_taken(plan.estimated_wall_time_seconds)}\n"
+        f"Limit violations:\n{violations}"
+    )
+
+
+def enforce_plan_limits(plan: RunPlan, settings: PlanSettings) -> None:
+    if not plan.limit_violations:
+        return
+    if settings.refuse_when_exceeded:
+        raise PlanLimitExceededError("; ".join(plan.limit_violations))
+    for violation in plan.limit_violations:
+        logging.warning(violation)
@@ -0,0 +1,206 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from datetime import datetime
+from types import FrameType
+
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+logger = logging.getLogger(__name__)
+
+STAGES_FILE = "stages.json"
+SAMPLES_FILE = "samples.folded"
+SUMMARY_FILE = "summary.txt"
+TRACEMALLOC_DIRECTORY = "tracemalloc"
+MAX_STACK_DEPTH = 64
+
+
+class ProfileSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
+    enabled: bool = Field(False, alias="GEM_PROFILE")
+    directory: str = Field("profiles", alias="GEM_PROFILE_DIRECTORY")
+    sample_interval_ms: float = Field(10.0, alias="GEM_PROFILE_SAMPLE_INTERVAL_MS")
+    tracemalloc: bool = Field(False, alias="GEM_PROFILE_TRACEMALLOC")
+    top: int = Field(20, alias="GEM_PROFILE_TOP")
+
+
+class StageTotals:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class RunProfiler:
+    def __init__(self, run_directory: str, settings: ProfileSettings) -> None:
+        self.run_directory = run_directory
+        self.settings = settings
+        self.stages: dict[str, StageTotals] = {}
+        # Thread ID -> names of the stages that thread is currently in, innermost last
+        self._active: dict[int, list[str]] = {}
+        self._samples: Counter[tuple[str, ...]] = Counter()
+        self._snapshots = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_loop, name="run-profiler", daemon=True)
+
+    def start(self) -> None:
+        os.makedirs(self.run_directory, exist_ok=True)
+        if self.settings.tracemalloc:
+            os.makedirs(os.path.join(self.run_directory, TRACEMALLOC_DIRECTORY), exist_ok=True)
+            tracemalloc.start()
+        self._sampler.start()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        stack = self._active.setdefault(threading.get_ident(), [])
+        stack.append(name)
+        start_wall = time.perf_counter()
+        start_cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start_wall
+            cpu = time.thread_time() - start_cpu
+            stack.pop()
+            with self._lock:
+                totals = self.stages.setdefault(name, StageTotals())
+                totals.calls += 1
+                totals.wall_seconds += wall
+                totals.cpu_seconds += cpu
+
+    def _sample_loop(self) -> None:
+        # Stacks are sampled from outside the profiled threads, so the pipeline itself runs at full speed
+        interval = self.settings.sample_interval_ms / 1000
+        sampler_id = threading.get_ident()
+        while not self._stopped.wait(interval):
+            frames = sys._current_frames()
+            for thread_id, stages in list(self._active.items()):
+                if thread_id == sampler_id or not stages:
+                    continue
+                frame = frames.get(thread_id)
+                stack: list[str] = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                with self._lock:
+                    self._samples[(stages[-1], *reversed(stack))] += 1
+
+    def snapshot(self, label: str) -> None:
+        if not self.settings.tracemalloc or not tracemalloc.is_tracing():
+            return
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ]
+        )
+        current, peak = tracemalloc.get_traced_memory()
+        self._snapshots += 1
+        file_path = os.path.join(self.run_directory, TRACEMALLOC_DIRECTORY, f"{self._snapshots:05d}_{label}.txt")
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(f"{label}: current {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB\n")
+            for statistic in snapshot.statistics("lineno")[: self.settings.top]:
+                f.write(f"{statistic}\n")
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._sampler.join()
+        self.snapshot("end")
+        with open(os.path.join(self.run_directory, STAGES_FILE), "w", encoding="utf-8") as f:
+            json.dump({name: totals.__dict__ for name, totals in self.stages.items()}, f, indent=2)
+        with open(os.path.join(self.run_directory, SAMPLES_FILE), "w", encoding="utf-8") as f:
+            for stack, count in self._samples.most_common():
+                f.write(f"{';'.join(stack)} {count}\n")
+        with open(os.path.join(self.run_directory, SUMMARY_FILE), "w", encoding="utf-8") as f:
+            f.write(self.summary())
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        logging.info(f"Profile written to {self.run_directory}")
+
+    def summary(self) -> str:
+        top = self.settings.top
+        lines = [
+            "Stages (wall and CPU include nested stages)",
+            f"{'stage':<20}{'calls':>10}{'wall s':>12}{'cpu s':>12}",
+        ]
+        for name, totals in sorted(self.stages.items(), key=lambda item: item[1].wall_seconds, reverse=True):
+            lines.append(f"{name:<20}{totals.calls:>10}{totals.wall_seconds:>12.2f}{totals.cpu_seconds:>12.2f}")
+
+        total_samples = sum(self._samples.values())
+        if not total_samples:
+            return "\n".join(lines) + "\n"
+        own: Counter[str] = Counter()
+        inclusive: Counter[str] = Counter()
+        by_stage: dict[str, Counter[str]] = {}
+        for stack, count in self._samples.items():
+            stage, *frames = stack
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            by_stage.setdefault(stage, Counter())[frames[-1]] += count
+            for frame in set(frames):
+                inclusive[frame] += count
+
+        lines.append("")
+        lines.append(
+            f"Top functions by own samples ({total_samples} samples every {self.settings.sample_interval_ms} ms)"
+        )
+        lines.extend(f"{count / total_samples:>7.1%}  {frame}" for frame, count in own.most_common(top))
+        lines.append("")
+        lines.append("Top functions including callees")
+        lines.extend(f"{count / total_samples:>7.1%}  {frame}" for frame, count in inclusive.most_common(top))
+        for stage, counts in sorted(by_stage.items()):
+            stage_samples = sum(counts.values())
+            lines.append("")
+            lines.append(f"Stage {stage} ({stage_samples} samples)")
+            lines.extend(f"{count / stage_samples:>7.1%}  {frame}" for frame, count in counts.most_common(10))
+        return "\n".join(lines) + "\n"
+
+
+# Set while a profiled run is in progress, every hook is a no-op otherwise
+_profiler: RunProfiler | None = None
+
+
+@contextmanager
+def run_profile(name: str, settings: ProfileSettings | None = None) -> Iterator[RunProfiler | None]:
+    global _profiler
+    settings = settings if settings is not None else ProfileSettings()  # type: ignore
+    if not settings.enabled:
+        yield None
+        return
+    run_id = f"{datetime.now():%Y%m%d_%H%M%S}_{name}_{os.getpid()}"
+    profiler = RunProfiler(os.path.join(settings.directory, run_id), settings)
+    profiler.start()
+    _profiler = profiler
+    try:
+        yield profiler
+    finally:
+        _profiler = None
+        profiler.stop()
+
+
+_NO_STAGE = nullcontext()
+
+
+def profile_stage(name: str) -> AbstractContextManager[None]:
+    return _profiler.stage(name) if _profiler is not None else _NO_STAGE
+
+
+def profile_snapshot(label: str) -> None:
+    if _profiler is not None:
+        _profiler.snapshot(label)
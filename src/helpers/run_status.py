@@ -0,0 +1,243 @@
+import logging
+import math
+import os
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pydantic import BaseModel, Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+logger = logging.getLogger(__name__)
+
+
+class StatusSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
+    enabled: bool = Field(True, alias="GEM_STATUS")
+    # 0 disables the HTTP endpoint, the status file is always written
+    port: int = Field(0, alias="GEM_STATUS_PORT")
+    host: str = Field("127.0.0.1", alias="GEM_STATUS_HOST")
+    interval_seconds: float = Field(5.0, alias="GEM_STATUS_INTERVAL_SECONDS")
+    eta_half_life_seconds: float = Field(120.0, alias="GEM_STATUS_ETA_HALF_LIFE_SECONDS")
+
+
+class ScenarioProgress(BaseModel):
+    total: int = 0
+    completed: int = 0
+    reused: int = 0
+    failed: int = 0
+
+
+class RunStatus(BaseModel):
+    name: str
+    state: str = "running"
+    started_at: datetime
+    updated_at: datetime
+    elapsed_seconds: float = 0.0
+    total: int = 0
+    completed: int = 0
+    reused: int = 0
+    in_flight: int = 0
+    failed: int = 0
+    throughput_per_second: float | None = None
+    smoothed_throughput_per_second: float | None = None
+    eta_seconds: float | None = None
+    estimated_completion: datetime | None = None
+    scenarios: dict[str, ScenarioProgress] = Field(default_factory=dict)
+
+
+class RunStatusTracker:
+    def __init__(self, name: str, status_file: str, settings: StatusSettings) -> None:
+        self.status_file = status_file
+        self.settings = settings
+        now = datetime.now()
+        self.status = RunStatus(name=name, started_at=now, updated_at=now)
+        self._document = self.status.model_dump_json(indent=2).encode("utf-8")
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._start = time.monotonic()
+        self._last_tick = self._start
+        self._last_completed = 0
+        # Time constant of the exponential average, so the weight of a rate halves every half-life
+        self._tau = settings.eta_half_life_seconds / math.log(2)
+        self._writer = threading.Thread(target=self._write_loop, name="run-status", daemon=True)
+        self._server: ThreadingHTTPServer | None = None
+
+    def _scenario(self, scenario: str) -> ScenarioProgress:
+        return self.status.scenarios.setdefault(scenario, ScenarioProgress())
+
+    def plan(self, total: int, scenario_totals: dict[str, int]) -> None:
+        # Called once per scenario_builder, so runs split into several builders add up
+        with self._lock:
+            self.status.total += total
+            for scenario, scenario_total in scenario_totals.items():
+                self._scenario(scenario).total += scenario_total
+
+    def dispatch(self, count: int) -> None:
+        with self._lock:
+            self.status.in_flight += count
+
+    def finish(self, scenario: str, dispatched: bool = True) -> None:
+        with self._lock:
+            self.status.completed += 1
+            self._scenario(scenario).completed += 1
+            if dispatched:
+                self.status.in_flight -= 1
+
+    def fail(self, scenario: str) -> None:
+        with self._lock:
+            self.status.failed += 1
+            self._scenario(scenario).failed += 1
+
+    def reuse(self, scenario: str) -> None:
+        with self._lock:
+            self.status.reused += 1
+            self._scenario(scenario).reused += 1
+
+    def eta_seconds(self) -> float | None:
+        return self.status.eta_seconds
+
+    def _tick(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            status = self.status
+            interval = now - self._last_tick
+            if interval <= 0:
+                return
+            # Reused results are not calculated, so they count towards progress but not throughput
+            rate = (status.completed - self._last_completed) / interval
+            self._last_tick = now
+            self._last_completed = status.completed
+            status.throughput_per_second = rate
+            # Cold start and the tail of each batch only move the average a little, unlike a cumulative mean
+            if status.smoothed_throughput_per_second is None:
+                if status.completed:
+                    status.smoothed_throughput_per_second = rate
+            else:
+                alpha = 1 - math.exp(-interval / self._tau)
+                status.smoothed_throughput_per_second += alpha * (rate - status.smoothed_throughput_per_second)
+
+            remaining = max(status.total - status.completed - status.reused, 0)
+            if status.smoothed_throughput_per_second:
+                status.eta_seconds = remaining / status.smoothed_throughput_per_second
+                status.estimated_completion = datetime.now() + timedelta(seconds=status.eta_seconds)
+            status.elapsed_seconds = now - self._start
+            status.updated_at = datetime.now()
+            self._document = status.model_dump_json(indent=2).encode("utf-8")
+
+    def _write(self) -> None:
+        # Written to a temporary file and renamed, so readers never see a partial document
+        temporary_file = f"{self.status_file}.tmp"
+        with open(temporary_file, "wb") as f:
+            f.write(self._document)
+        os.replace(temporary_file, self.status_file)
+
+    def _write_loop(self) -> None:
+        while not self._stopped.wait(self.settings.interval_seconds):
+            self._tick()
+            try:
+                self._write()
+            except OSError as e:
+                logging.warning(f"Could not write run status to {self.status_file}: {e}")
+
+    def document(self) -> bytes:
+        return self._document
+
+    def start(self) -> None:
+        os.makedirs(os.path.dirname(self.status_file) or ".", exist_ok=True)
+        self._write()
+        self._writer.start()
+        if self.settings.port:
+            self._server = ThreadingHTTPServer((self.settings.host, self.settings.port), _status_handler(self))
+            threading.Thread(target=self._server.serve_forever, name="run-status-http", daemon=True).start()
+            logging.info(f"Serving run status on http://{self.settings.host}:{self.settings.port}/status")
+
+    def stop(self, state: str) -> None:
+        self._stopped.set()
+        self._writer.join()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        self.status.state = state
+        self._tick()
+        self._write()
+
+
+def _status_handler(tracker: RunStatusTracker) -> type[BaseHTTPRequestHandler]:
+    class StatusHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:  # noqa: N802
+            if self.path.rstrip("/") not in ("", "/status"):
+                self.send_error(404)
+                return
+            document = tracker.document()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(document)))
+            self.end_headers()
+            self.wfile.write(document)
+
+        def log_message(self, format: str, *args: object) -> None:
+            logging.debug(f"Run status request: {format % args}")
+
+    return StatusHandler
+
+
+def status_file_path(results_directory: str, name: str) -> str:
+    return os.path.join(results_directory, f"{name}_status.json")
+
+
+# Set while a tracked run is in progress, every hook is a no-op otherwise
+_tracker: RunStatusTracker | None = None
+
+
+@contextmanager
+def run_status(
+    name: str, results_directory: str, settings: StatusSettings | None = None
+) -> Iterator[RunStatusTracker | None]:
+    global _tracker
+    settings = settings if settings is not None else StatusSettings()  # type: ignore
+    if not settings.enabled:
+        yield None
+        return
+    tracker = RunStatusTracker(name, status_file_path(results_directory, name), settings)
+    tracker.start()
+    _tracker = tracker
+    state = "failed"
+    try:
+        yield tracker
+        state = "complete"
+    finally:
+        _tracker = None
+        tracker.stop(state)
+
+
+def status_plan(total: int, scenario_totals: dict[str, int]) -> None:
+    if _tracker is not None:
+        _tracker.plan(total, scenario_totals)
+
+
+def status_dispatch(count: int) -> None:
+    if _tracker is not None:
+        _tracker.dispatch(count)
+
+
+def status_finish(scenario: str, dispatched: bool = True) -> None:
+    if _tracker is not None:
+        _tracker.finish(scenario, dispatched)
+
+
+def status_fail(scenario: str) -> None:
+    if _tracker is not None:
+        _tracker.fail(scenario)
+
+
+def status_reuse(scenario: str) -> None:
+    if _tracker is not None:
+        _tracker.reuse(scenario)
+
+
+def status_eta_seconds() -> float | None:
+    return _tracker.eta_seconds() if _tracker is not None else None
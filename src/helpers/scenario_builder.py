@@ -1,78 +1,170 @@
+import bisect
 import logging
 import time
 from collections.abc import Generator
 from copy import deepcopy
+from itertools import accumulate
+from typing import Any, NamedTuple
 
-from src.gem.gem_input_dict_modifiers import ADJUSTMENT_FUNCS
+from src.gem.gem_input_dict_modifiers import ADJUSTMENT_FUNCS, INDEXED_ADJUSTMENT_FUNCS
 from src.helpers.format_time_taken import format_time_taken
-from src.models.gem_assessments import BaseAssessments, IndividualSensitivityInput
+from src.helpers.run_profiler import profile_snapshot, profile_stage
+from src.helpers.run_status import status_plan
+from src.models.enums.build_orders import BuildOrder
+from src.models.enums.sensitivities import ScenarioComponents
+from src.models.gem_assessments import BaseAssessment, BaseAssessments, IndividualSensitivityInput
+from src.models.sensitivity import Combinations
 from src.models.settings import SensitivitySettings
 
 logger = logging.getLogger(__name__)
 
 
+class SensitivityTask(NamedTuple):
+    scenario_name: str
+    combination: dict[ScenarioComponents, Any]
+    base_assessment: BaseAssessment
+
+
+class SensitivityTaskSpace:
+    def __init__(
+        self,
+        base_assessments: BaseAssessments,
+        config: SensitivitySettings,
+        order: BuildOrder = BuildOrder.COMBINATION_MAJOR,
+    ) -> None:
+        self.projects = base_assessments.assessments
+        self.order = order
+        self.scenario_names = list(config.sensitivities.keys())
+        self.combinations: list[Combinations] = [
+            sensitivity.generate_combinations() for sensitivity in config.sensitivities.values()
+        ]
+        # Offsets of each scenario's first combination when all scenarios are laid end to end
+        self._combination_offsets = [0, *accumulate(len(combinations) for combinations in self.combinations)]
+        self.total_combinations = self._combination_offsets[-1]
+
+    def __len__(self) -> int:
+        return self.total_combinations * len(self.projects)
+
+    def _locate_combination(self, combination_index: int) -> tuple[int, int]:
+        scenario_index = bisect.bisect_right(self._combination_offsets, combination_index) - 1
+        return scenario_index, combination_index - self._combination_offsets[scenario_index]
+
+    def __getitem__(self, index: int) -> SensitivityTask:
+        if not 0 <= index < len(self):
+            raise IndexError(f"Task index {index} out of range for {len(self)} tasks")
+        if self.order is BuildOrder.PROJECT_MAJOR:
+            project_index, combination_index = divmod(index, self.total_combinations)
+        else:
+            combination_index, project_index = divmod(index, len(self.projects))
+        scenario_index, local_index = self._locate_combination(combination_index)
+        return SensitivityTask(
+            self.scenario_names[scenario_index],
+            self.combinations[scenario_index][local_index],
+            self.projects[project_index],
+        )
+
+    def iter_tasks(self, shard_index: int = 0, shard_count: int = 1) -> Generator[SensitivityTask]:
+        if shard_count > 1:
+            for index in range(shard_index, len(self), shard_count):
+                yield self[index]
+            return
+        if self.order is BuildOrder.PROJECT_MAJOR:
+            for project in self.projects:
+                for scenario_name, combinations in zip(self.scenario_names, self.combinations):
+                    for combination in combinations:
+                        yield SensitivityTask(scenario_name, combination, project)
+        else:
+            for scenario_name, combinations in zip(self.scenario_names, self.combinations):
+                for combination in combinations:
+                    for project in self.projects:
+                        yield SensitivityTask(scenario_name, combination, project)
+
+
+def build_sensitivity_input(task: SensitivityTask, config: SensitivitySettings) -> IndividualSensitivityInput:
+    base_assessment = task.base_assessment
+    if base_assessment.engine_input_json is None:
+        logging.debug(f"No engine input for project {base_assessment.project_id}")
+        return IndividualSensitivityInput(
+            **base_assessment.model_dump(),
+            combination=task.combination,
+            scenario=task.scenario_name,
+        )
+
+    index = base_assessment.engine_input_index
+    adjusted_input = deepcopy(base_assessment.engine_input_json)
+    for sweep in config.sensitivities[task.scenario_name].element_wise_parameter_sweep.values():
+        component = sweep.component
+        adjustment_type = sweep.type
+        if component not in ADJUSTMENT_FUNCS:
+            raise ValueError(f"Adjustment function not found for {component}")
+
+        value = task.combination.get(component)
+        if value is None:
+            raise ValueError(f"Value not found for {component}")
+
+        if component in INDEXED_ADJUSTMENT_FUNCS:
+            adjusted_input = INDEXED_ADJUSTMENT_FUNCS[component](adjusted_input, value, adjustment_type, config, index)
+        else:
+            adjusted_input = ADJUSTMENT_FUNCS[component](adjusted_input, value, adjustment_type, config)
+    return IndividualSensitivityInput(
+        **base_assessment.model_dump(exclude={"engine_input_json"}),
+        engine_input_json=adjusted_input,
+        combination=task.combination,
+        scenario=task.scenario_name,
+    )
+
+
 def scenario_builder(
-    base_assessments: BaseAssessments, config: SensitivitySettings, batch_size: int = 5000
+    base_assessments: BaseAssessments,
+    config: SensitivitySettings,
+    batch_size: int = 5000,
+    order: BuildOrder = BuildOrder.COMBINATION_MAJOR,
+    shard_index: int = 0,
+    shard_count: int = 1,
 ) -> Generator[list[IndividualSensitivityInput]]:
     start_time = time.time()
     logging.info(f"Building scenarios for {len(base_assessments.assessments)} projects")
+    task_space = SensitivityTaskSpace(base_assessments, config, order)
+    for scenario_name, combinations in zip(task_space.scenario_names, task_space.combinations):
+        logging.info(f"Building {len(combinations)} combinations for scenario: {scenario_name}")
+
+    total_sens = len(range(shard_index, len(task_space), shard_count))
+    status_plan(
+        total_sens,
+        {
+            scenario_name: len(combinations) * len(task_space.projects)
+            for scenario_name, combinations in zip(task_space.scenario_names, task_space.combinations)
+        }
+        if shard_count == 1
+        else {},
+    )
+    if shard_count > 1:
+        logging.info(
+            f"Building shard {shard_index + 1} of {shard_count}: {total_sens} of {len(task_space)} assessments"
+        )
+    set_sens = 0
     current_batch: list[IndividualSensitivityInput] = []
 
-    for scenario_name, sensitivity in config.sensitivities.items():
-        set_sens = 0
-        combinations = sensitivity.generate_combinations()
-        total_sens = len(combinations) * len(base_assessments.assessments)
-        logging.info(f"Building {len(combinations)} combinations for scenario: {scenario_name}")
-        for combination in combinations:
-            logging.debug(f"Building combination: {combination} for scenario: {scenario_name}")
-
-            for base_assessment in base_assessments.assessments:
-                if base_assessment.engine_input_json is None:
-                    logging.debug(f"No engine input for project {base_assessment.project_id}")
-                    current_batch.append(
-                        IndividualSensitivityInput(
-                            **base_assessment.model_dump(),
-                            combination=combination,
-                            scenario=scenario_name,
-                        )
-                    )
-                else:
-                    adjusted_input = deepcopy(base_assessment.engine_input_json)
-
-                    for sweep in sensitivity.element_wise_parameter_sweep.values():
-                        component = sweep.component
-                        adjustment_type = sweep.type
-                        if component not in ADJUSTMENT_FUNCS:
-                            raise ValueError(f"Adjustment function not found for {component}")
-
-                        value = combination.get(component)
-                        if value is None:
-                            raise ValueError(f"Value not found for {component}")
-
-                        adjusted_input = ADJUSTMENT_FUNCS[component](adjusted_input, value, adjustment_type, config)
-                    current_batch.append(
-                        IndividualSensitivityInput(
-                            **base_assessment.model_dump(exclude={"engine_input_json"}),
-                            engine_input_json=adjusted_input,
-                            combination=combination,
-                            scenario=scenario_name,
-                        )
-                    )
-                set_sens += 1
-
-                logging.debug(
-                    f"Scenario: {scenario_name}, Project: {base_assessment.project_id}, Combination: {combination}"
-                )
-                if len(current_batch) >= batch_size:
-                    logging.info(
-                        f"Built batch of sensitivity assessemnts. Total built: {set_sens} of "
-                        f"{total_sens}"
-                        f" in {format_time_taken(time.time() - start_time)}\n"
-                        f"Expected time remaining:"
-                        f"{format_time_taken((time.time() - start_time) / set_sens* (total_sens - set_sens))}"
-                    )
-                    yield current_batch
-                    current_batch = []
+    for task in task_space.iter_tasks(shard_index, shard_count):
+        with profile_stage("scenario_build"):
+            current_batch.append(build_sensitivity_input(task, config))
+        set_sens += 1
+
+        logging.debug(
+            f"Scenario: {task.scenario_name}, Project: {task.base_assessment.project_id}, "
+            f"Combination: {task.combination}"
+        )
+        if len(current_batch) >= batch_size:
+            logging.info(
+                f"Built batch of sensitivity assessemnts. Total built: {set_sens} of "
+                f"{total_sens}"
+                f" in {format_time_taken(time.time() - start_time)}\n"
+                f"Expected time remaining:"
+                f"{format_time_taken((time.time() - start_time) / set_sens* (total_sens - set_sens))}"
+            )
+            profile_snapshot("scenario_build_batch")
+            yield current_batch
+            current_batch = []
     if current_batch:
         logging.info(
             f"Built batch of sensitivity assessemnts. Total built: {set_sens} of {total_sens}"
@@ -0,0 +1,126 @@
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.models.designs import DesignOption, ProjectAndAssessmentIds
+
+logger = logging.getLogger(__name__)
+
+LAND_AREA_TO_HECTARES = {
+    "acres": 0.404686,
+    "acre": 0.404686,
+    "hectares": 1.0,
+    "hectare": 1.0,
+    "ha": 1.0,
+    "m2": 0.0001,
+    "square_meters": 0.0001,
+    "km2": 100.0,
+}
+# Units assumed when a CSV has no land_area_units column
+DEFAULT_LAND_AREA_UNITS = "acres"
+KWH_TO_MWH = 0.001
+
+# SolarMAX column -> DesignOption field
+REQUIRED_COLUMNS = {"dc_mw": "installed_capacity_dc", "net_annual_yield_kwh": "energy_yield"}
+OPTIONAL_COLUMNS = {"ac_mw": "installed_capacity_ac", "total_land_area": "land_area"}
+DESIGN_FIELDS = ["installed_capacity_dc", "installed_capacity_ac", "land_area", "energy_yield"]
+
+# Pareto pruning keeps the designs for which no other design has at least as much capacity and yield on no more land
+PARETO_MAXIMIZE = ["installed_capacity_dc", "energy_yield"]
+PARETO_MINIMIZE = ["land_area"]
+
+
+def read_solarmax_csv(csv_file: str) -> pd.DataFrame:
+    wanted = {*REQUIRED_COLUMNS, *OPTIONAL_COLUMNS, "land_area_units"}
+    data = pd.read_csv(csv_file, usecols=lambda column: column.strip().lower() in wanted)
+    data.columns = [column.strip().lower() for column in data.columns]
+    missing = [column for column in REQUIRED_COLUMNS if column not in data.columns]
+    if missing:
+        raise ValueError(f"SolarMAX CSV {csv_file} is missing columns: {', '.join(missing)}")
+
+    designs = pd.DataFrame(index=data.index)
+    # Names are the CSV line numbers, as written by earlier versions of the design JSON
+    designs["name"] = (data.index + 2).astype(str)
+    designs["installed_capacity_dc"] = pd.to_numeric(data["dc_mw"], errors="raise")
+    designs["installed_capacity_ac"] = pd.to_numeric(data["ac_mw"], errors="raise") if "ac_mw" in data else np.nan
+    designs["energy_yield"] = pd.to_numeric(data["net_annual_yield_kwh"], errors="raise") * KWH_TO_MWH
+    designs["land_area"] = np.nan
+    if "total_land_area" in data:
+        units = (
+            data["land_area_units"].fillna(DEFAULT_LAND_AREA_UNITS)
+            if "land_area_units" in data
+            else pd.Series(DEFAULT_LAND_AREA_UNITS, index=data.index)
+        )
+        units = units.astype(str).str.strip().str.lower()
+        to_hectares = units.map(LAND_AREA_TO_HECTARES)
+        unknown = sorted(set(units[to_hectares.isna()]))
+        if unknown:
+            raise ValueError(f"Unknown land area units in {csv_file}: {', '.join(unknown)}")
+        designs["land_area"] = pd.to_numeric(data["total_land_area"], errors="raise") * to_hectares
+    return designs
+
+
+def drop_duplicate_designs(designs: pd.DataFrame) -> pd.DataFrame:
+    return designs.drop_duplicates(subset=DESIGN_FIELDS, keep="first")
+
+
+def pareto_designs(designs: pd.DataFrame) -> pd.DataFrame:
+    # Costs to minimise, missing values rank worst
+    costs = np.column_stack(
+        [np.nan_to_num(-designs[field].to_numpy(dtype=float), nan=np.inf) for field in PARETO_MAXIMIZE]
+        + [np.nan_to_num(designs[field].to_numpy(dtype=float), nan=np.inf) for field in PARETO_MINIMIZE]
+    )
+    # A design can only be dominated by one ahead of it in lexicographic order, so one pass against the front found
+    # so far is enough and each check is vectorised over the front
+    front = np.empty_like(costs)
+    front_size = 0
+    keep = np.zeros(len(designs), dtype=bool)
+    for position in np.lexsort(costs.T[::-1]):
+        cost = costs[position]
+        candidates = front[:front_size]
+        if np.any(np.all(candidates <= cost, axis=1) & np.any(candidates < cost, axis=1)):
+            continue
+        front[front_size] = cost
+        front_size += 1
+        keep[position] = True
+    return designs[keep]
+
+
+def load_solarmax_designs(
+    csv_file: str, drop_duplicates: bool = False, pareto: bool = False
+) -> list[DesignOption]:
+    designs = read_solarmax_csv(csv_file)
+    rows = len(designs)
+    if drop_duplicates:
+        designs = drop_duplicate_designs(designs)
+    if pareto:
+        designs = pareto_designs(designs)
+    if len(designs) < rows:
+        logging.info(f"Kept {len(designs)} of {rows} designs from {os.path.basename(csv_file)}")
+    designs = designs.astype(object).where(designs.notna(), None)
+    return [DesignOption(**design) for design in designs.to_dict("records")]
+
+
+def load_design_file(
+    file_path: str, csv_directory: str = "designs", drop_duplicates: bool = False, pareto: bool = False
+) -> tuple[list[ProjectAndAssessmentIds], dict[int, list[DesignOption]]]:
+    with open(file_path, encoding="utf-8") as f:
+        design_options = json.load(f)
+    project_and_assessment_ids = [
+        ProjectAndAssessmentIds(**project) for project in design_options["project_assessments"]
+    ]
+    designs = {
+        int(project_id): [DesignOption(**design) for design in project_designs]
+        for project_id, project_designs in design_options.get("designs", {}).items()
+    }
+    for project_and_assessment_id in project_and_assessment_ids:
+        if project_and_assessment_id.solarmax_run is not None:
+            designs[project_and_assessment_id.project_id] = load_solarmax_designs(
+                os.path.join(csv_directory, f"{project_and_assessment_id.solarmax_run}.csv"),
+                drop_duplicates=drop_duplicates,
+                pareto=pareto,
+            )
+    return project_and_assessment_ids, designs
@@ -0,0 +1,54 @@
+import json
+import logging
+import statistics
+
+from src.helpers.latency_history import LatencyHistory
+from src.models.gem_assessments import IndividualSensitivityInput
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OPERATIONAL_LIFETIME_YEARS = 30
+
+
+def estimate_input_cost(engine_input: dict) -> float:
+    # Engine time grows with the size of the input tables and the number of years the cashflow is run over
+    lifetime = engine_input.get("operational_lifetime_years") or DEFAULT_OPERATIONAL_LIFETIME_YEARS
+    turbine_groups = len(engine_input.get("turbine_groups") or [])
+    return len(json.dumps(engine_input)) * lifetime * (1 + turbine_groups)
+
+
+def expected_latencies(
+    assessments: list[IndividualSensitivityInput], latency_history: LatencyHistory
+) -> dict[str, float]:
+    # The input cost is only computed once per project, the adjusted inputs for a project are all similar in size
+    costs: dict[str, float] = {}
+    for assessment in assessments:
+        if assessment.project_id not in costs and assessment.engine_input_json is not None:
+            costs[assessment.project_id] = estimate_input_cost(assessment.engine_input_json)
+
+    known = {project_id: latency_history.mean_seconds(project_id) for project_id in costs}
+    seconds_per_cost = [
+        seconds / costs[project_id]
+        for project_id, seconds in known.items()
+        if seconds is not None and costs[project_id]
+    ]
+    # Projects without history are placed on the same scale using the typical seconds per unit of input cost
+    scale = statistics.median(seconds_per_cost) if seconds_per_cost else 1.0
+    return {
+        project_id: seconds if seconds is not None else costs[project_id] * scale
+        for project_id, seconds in known.items()
+    }
+
+
+def longest_expected_first_order(
+    assessments: list[IndividualSensitivityInput], latency_history: LatencyHistory
+) -> list[int]:
+    latencies = expected_latencies(assessments, latency_history)
+    logging.info(
+        f"Ordering {len(assessments)} assessments longest expected first using latency for {len(latencies)} projects"
+    )
+    return sorted(
+        range(len(assessments)),
+        key=lambda i: latencies.get(assessments[i].project_id, 0.0),
+        reverse=True,
+    )
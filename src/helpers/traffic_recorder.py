@@ -0,0 +1,216 @@
+import asyncio
+import atexit
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections.abc import Awaitable, Callable
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+import httpx
+from pydantic import BaseModel, Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+from src.models.enums.traffic_modes import TrafficMode
+
+logger = logging.getLogger(__name__)
+
+COMMIT_EVERY = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS exchanges (
+    request_key TEXT PRIMARY KEY,
+    method TEXT NOT NULL,
+    path TEXT NOT NULL,
+    status_code INTEGER NOT NULL,
+    content_type TEXT,
+    latency_seconds REAL NOT NULL,
+    recorded_at REAL NOT NULL,
+    body BLOB NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class TrafficSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
+    mode: TrafficMode = Field(TrafficMode.OFF, alias="GEM_TRAFFIC_MODE")
+    file: str = Field(os.path.join("results", "traffic.db"), alias="GEM_TRAFFIC_FILE")
+    # Replays at full speed unless the recorded latencies are wanted, e.g. to benchmark the scheduling
+    replay_latency: bool = Field(False, alias="GEM_TRAFFIC_REPLAY_LATENCY")
+
+
+class RecordedResponse(BaseModel):
+    status_code: int
+    content_type: str | None = None
+    body: bytes
+    latency_seconds: float = 0.0
+
+
+class TrafficNotRecordedError(httpx.TransportError):
+    pass
+
+
+def _path(url: str) -> str:
+    return urlsplit(url).path or "/"
+
+
+def traffic_key(method: str, url: str, body: bytes) -> str:
+    # The host is left out, so traffic recorded against one endpoint replays against any of them
+    digest = hashlib.sha256(f"{method.upper()} {_path(url)}\n".encode())
+    digest.update(body)
+    return digest.hexdigest()
+
+
+class TrafficRecorder:
+    def __init__(self, path: str, mode: TrafficMode, replay_latency: bool = False) -> None:
+        self.path = path
+        self.mode = mode
+        self.replay_latency = replay_latency
+        self.recorded = 0
+        self.replayed = 0
+        self.missing = 0
+        self._pending = 0
+        self._closed = False
+        # Shared by the event loop and the GEM API fetch threads
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+
+    def _get(self, key: str) -> RecordedResponse | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT status_code, content_type, latency_seconds, body FROM exchanges WHERE request_key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        status_code, content_type, latency_seconds, body = row
+        return RecordedResponse(
+            status_code=status_code,
+            content_type=content_type,
+            body=zlib.decompress(body),
+            latency_seconds=latency_seconds,
+        )
+
+    def _put(self, key: str, method: str, url: str, response: RecordedResponse) -> None:
+        row = (
+            key,
+            method.upper(),
+            _path(url),
+            response.status_code,
+            response.content_type,
+            response.latency_seconds,
+            time.time(),
+            zlib.compress(response.body),
+        )
+        with self._lock:
+            # The latest response wins, so re-recording refreshes the store rather than growing it
+            self._connection.execute("INSERT OR REPLACE INTO exchanges VALUES (?, ?, ?, ?, ?, ?, ?, ?)", row)
+            self.recorded += 1
+            self._pending += 1
+            if self._pending >= COMMIT_EVERY:
+                self._connection.commit()
+                self._pending = 0
+
+    def _replay(self, key: str, method: str, url: str) -> RecordedResponse:
+        response = self._get(key)
+        if response is None:
+            self.missing += 1
+            raise TrafficNotRecordedError(f"No recorded response for {method.upper()} {_path(url)} ({key})")
+        self.replayed += 1
+        return response
+
+    def exchange(self, method: str, url: str, body: bytes, send: Callable[[], RecordedResponse]) -> RecordedResponse:
+        key = traffic_key(method, url, body)
+        if self.mode == TrafficMode.REPLAY:
+            response = self._replay(key, method, url)
+            if self.replay_latency:
+                time.sleep(response.latency_seconds)
+            return response
+        response = send()
+        if self.mode == TrafficMode.RECORD:
+            self._put(key, method, url, response)
+        return response
+
+    async def exchange_async(
+        self, method: str, url: str, body: bytes, send: Callable[[], Awaitable[RecordedResponse]]
+    ) -> RecordedResponse:
+        key = traffic_key(method, url, body)
+        if self.mode == TrafficMode.REPLAY:
+            response = self._replay(key, method, url)
+            if self.replay_latency:
+                await asyncio.sleep(response.latency_seconds)
+            return response
+        response = await send()
+        if self.mode == TrafficMode.RECORD:
+            self._put(key, method, url, response)
+        return response
+
+    def flush(self) -> None:
+        with self._lock:
+            self._connection.commit()
+            self._pending = 0
+
+    def log_metrics(self) -> None:
+        if self.mode == TrafficMode.RECORD:
+            logging.info(f"Recorded {self.recorded} responses to {self.path}")
+        else:
+            logging.info(f"Replayed {self.replayed} responses from {self.path}, {self.missing} not recorded")
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self.flush()
+        with self._lock:
+            self._connection.close()
+            self._closed = True
+
+
+class TrafficTransport(httpx.AsyncBaseTransport):
+    # Records or replays every request made through an engine client. Only the status, content type and body are
+    # kept, so the function keys sent in the request headers never reach the store
+    def __init__(self, transport: httpx.AsyncBaseTransport, recorder: TrafficRecorder) -> None:
+        self._transport = transport
+        self._recorder = recorder
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        async def _send() -> RecordedResponse:
+            request_start_time = time.time()
+            response = await self._transport.handle_async_request(request)
+            try:
+                body = await response.aread()
+            finally:
+                await response.aclose()
+            return RecordedResponse(
+                status_code=response.status_code,
+                content_type=response.headers.get("content-type"),
+                body=body,
+                latency_seconds=time.time() - request_start_time,
+            )
+
+        body = await request.aread()
+        recorded = await self._recorder.exchange_async(request.method, str(request.url), body, _send)
+        headers = {"content-type": recorded.content_type} if recorded.content_type else {}
+        return httpx.Response(recorded.status_code, headers=headers, content=recorded.body, request=request)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+        self._recorder.flush()
+        self._recorder.log_metrics()
+
+
+@lru_cache(maxsize=1)
+def get_traffic_recorder() -> TrafficRecorder | None:
+    settings = TrafficSettings()  # type: ignore
+    if settings.mode == TrafficMode.OFF:
+        return None
+    logging.info(f"Engine and GEM API traffic mode: {settings.mode.value} ({settings.file})")
+    recorder = TrafficRecorder(settings.file, settings.mode, settings.replay_latency)
+    atexit.register(recorder.close)
+    return recorder
@@ -1,22 +1,31 @@
 import logging
 import os
+import re
 import time
-from collections.abc import Callable
+from collections.abc import Callable, Iterable
+from concurrent.futures import ProcessPoolExecutor
 from typing import Any
 
-from openpyxl import load_workbook
+from openpyxl import Workbook, load_workbook
 from openpyxl.utils import get_column_letter
 from openpyxl.worksheet.table import Table
 
 from src.helpers.format_time_taken import format_time_taken
+from src.helpers.portfolio_aggregates import AGGREGATE_COLUMNS, compute_summary_sheets, write_summary_sheets
+from src.helpers.run_profiler import profile_stage
+from src.models.enums.export_shards import ExportShardBy
 from src.models.enums.sensitivities import ScenarioComponents
 from src.models.gem_assessments import IndividualSensitivityResult, SensitivityResults
+from src.models.results_store import ResultsStore
 
 TEMPLATE_EXCEL = os.path.join("templates", "sensitivity_template_v1.xlsx")
 
 TABLE_NAME = "SensitivityResults"
 
 FieldAccessor = Callable[[IndividualSensitivityResult], Any]
+ResultRow = tuple[Any, ...]
+
+_SAFE_FILE_NAME = re.compile(r"[^A-Za-z0-9&._-]+")
 
 
 PORTFOLIO_MAPPER = {
@@ -81,8 +90,21 @@ FIELD_MAPPING: dict[str, FieldAccessor] = {
 }
 
 
-def write_results_to_template_excel_file(sensitivity_results: SensitivityResults, output_file: str) -> None:
-    start_time = time.time()
+def _valid_results(
+    sensitivity_results: SensitivityResults | ResultsStore | Iterable[IndividualSensitivityResult],
+) -> Iterable[IndividualSensitivityResult]:
+    if isinstance(sensitivity_results, ResultsStore):
+        return sensitivity_results.iter_valid()
+    if isinstance(sensitivity_results, SensitivityResults):
+        return (r for r in sensitivity_results.assessments if r.reason_for_no_assessment is None)
+    return (r for r in sensitivity_results if r.reason_for_no_assessment is None)
+
+
+def _result_row(result: IndividualSensitivityResult) -> ResultRow:
+    return tuple(func(result) for func in FIELD_MAPPING.values())
+
+
+def _write_rows_to_template(rows: Iterable[ResultRow], output_file: str, summaries: bool = True) -> int:
     wb = load_workbook(TEMPLATE_EXCEL)
     ws = wb.active
     if ws is None:
@@ -94,22 +116,103 @@ def write_results_to_template_excel_file(sensitivity_results: SensitivityResults
 
     header_row = int(table.ref.split(":")[0][1:])
     headers = {ws.cell(row=header_row, column=col).value: col for col in range(1, ws.max_column + 1)}
+    columns = [headers.get(header) for header in FIELD_MAPPING]
 
-    start_row = header_row + 1
+    # Only the fields the summaries group or aggregate on are kept, not whole rows
+    aggregate_positions = [list(FIELD_MAPPING).index(header) for header in AGGREGATE_COLUMNS]
+    aggregate_rows: list[ResultRow] = []
 
-    valid_results = [result for result in sensitivity_results.assessments if (result.reason_for_no_assessment is None)]
-    for i, result in enumerate(valid_results, start=start_row):
-        if result.reason_for_no_assessment is None:
-            for header, func in FIELD_MAPPING.items():
-                column = headers.get(header)
-                if column:
-                    value = func(result)
-                    ws.cell(row=i, column=column, value=value)
+    start_row = header_row + 1
+    end_row = start_row - 1
+    for i, row in enumerate(rows, start=start_row):
+        for column, value in zip(columns, row):
+            if column:
+                ws.cell(row=i, column=column, value=value)
+        if summaries:
+            aggregate_rows.append(tuple(row[position] for position in aggregate_positions))
+        end_row = i
 
-    end_row = start_row + len(valid_results) - 1
     end_column = get_column_letter(max(headers.values()))
     start_column = get_column_letter(min(headers.values()))
     table.ref = f"{start_column}{header_row}:{end_column}{end_row}"
 
+    if summaries:
+        write_summary_sheets(wb, compute_summary_sheets(aggregate_rows))
     wb.save(output_file)
+    return end_row - header_row
+
+
+def write_results_to_template_excel_file(
+    sensitivity_results: SensitivityResults | ResultsStore | Iterable[IndividualSensitivityResult],
+    output_file: str,
+    summaries: bool = True,
+) -> None:
+    start_time = time.time()
+    with profile_stage("export"):
+        _write_rows_to_template(
+            (_result_row(result) for result in _valid_results(sensitivity_results)), output_file, summaries
+        )
     logging.info(f"File saved as '{output_file}' in {format_time_taken(time.time() - start_time)}")
+
+
+def shard_name(result: IndividualSensitivityResult, shard_by: ExportShardBy) -> str:
+    if shard_by is ExportShardBy.SCENARIO:
+        return result.scenario
+    return PORTFOLIO_MAPPER[result.country]
+
+
+def _write_shard(shard: str, rows: list[ResultRow], output_file: str, summaries: bool) -> tuple[str, str, int]:
+    start_time = time.time()
+    row_count = _write_rows_to_template(rows, output_file, summaries)
+    logging.info(f"Shard '{shard}' saved as '{output_file}' in {format_time_taken(time.time() - start_time)}")
+    return shard, output_file, row_count
+
+
+def _write_shard_index(shards: list[tuple[str, str, int]], shard_by: ExportShardBy, output_file: str) -> None:
+    wb = Workbook()
+    ws = wb.active
+    if ws is None:
+        raise ValueError("No active worksheet in new workbook")
+    ws.title = "Shards"
+    ws.append([shard_by.value.title(), "File", "Rows"])
+    for shard, file_path, row_count in shards:
+        ws.append([shard, os.path.basename(file_path), row_count])
+    ws.append(["Total", None, sum(row_count for _, _, row_count in shards)])
+    wb.save(output_file)
+
+
+def write_sharded_excel_files(
+    sensitivity_results: SensitivityResults | ResultsStore | Iterable[IndividualSensitivityResult],
+    output_directory: str,
+    name: str,
+    shard_by: ExportShardBy,
+    max_workers: int | None = None,
+    summaries: bool = True,
+) -> list[str]:
+    start_time = time.time()
+    with profile_stage("export"):
+        # Rows are flattened here because the field accessors are lambdas, which cannot be sent to worker processes
+        shards: dict[str, list[ResultRow]] = {}
+        for result in _valid_results(sensitivity_results):
+            shards.setdefault(shard_name(result, shard_by), []).append(_result_row(result))
+
+        os.makedirs(output_directory, exist_ok=True)
+        shard_files = {
+            shard: os.path.join(output_directory, f"{name}_{_SAFE_FILE_NAME.sub('_', shard).strip('_')}.xlsx")
+            for shard in shards
+        }
+        logging.info(f"Writing {len(shards)} workbooks sharded by {shard_by.value}")
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(_write_shard, shard, rows, shard_files[shard], summaries)
+                for shard, rows in sorted(shards.items())
+            ]
+            written = [future.result() for future in futures]
+
+        index_file = os.path.join(output_directory, f"{name}_index.xlsx")
+        _write_shard_index(written, shard_by, index_file)
+    logging.info(
+        f"{len(written)} shards and index saved to '{output_directory}' "
+        f"in {format_time_taken(time.time() - start_time)}"
+    )
+    return [file_path for _, file_path, _ in written]
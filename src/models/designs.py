@@ -0,0 +1,16 @@
+from pydantic import BaseModel
+
+
+class DesignOption(BaseModel):
+    installed_capacity_dc: float
+    energy_yield: float
+    name: str
+    land_area: float | None = None
+    installed_capacity_ac: float | None = None
+
+
+class ProjectAndAssessmentIds(BaseModel):
+    project_id: int
+    assessment_id: str
+    # SolarMAX run whose results CSV holds the project's designs, used instead of listing them in the design file
+    solarmax_run: str | None = None
@@ -0,0 +1,59 @@
+from typing import Any, TypeGuard
+
+OPEX_CALCULATORS = {"GENERIC_OPEX", "LAND_OPEX"}
+O_AND_M_TABLES = ("o_and_m_cost_per_turbine", "o_and_m_cost_per_mwh")
+
+
+def _all_dicts(values: Any) -> TypeGuard[list[dict]]:
+    return isinstance(values, list) and all(isinstance(value, dict) for value in values)
+
+
+# Mutation sites of a base engine input, found once so the modifiers do not rescan every adjusted copy.
+# Modifiers only ever append calculators without these fields, so the positions hold for every input built from
+# the same base. Each `*_indexed` flag is False for shapes the indexed modifiers do not handle, which then scan.
+class EngineInputIndex:
+    def __init__(self, engine_input: dict[str, Any]) -> None:
+        calculators = engine_input.get("calculators")
+        calculators_list: list[dict] = calculators if _all_dicts(calculators) else []
+        energy_yield_information = engine_input.get("energy_yield_information")
+        energy_loss_calculators = (
+            energy_yield_information.get("energy_loss_calculators", [])
+            if isinstance(energy_yield_information, dict)
+            else None
+        )
+        energy_loss_list: list[dict] = energy_loss_calculators if _all_dicts(energy_loss_calculators) else []
+
+        # Opex: (calculator position, item position) of every risk-factored item
+        self.opex_indexed = _all_dicts(calculators) or "calculators" not in engine_input
+        self.opex_items = [
+            (calculator_position, item_position)
+            for calculator_position, calculator in enumerate(calculators_list)
+            if calculator.get("calculator") in OPEX_CALCULATORS and isinstance(calculator.get("items", []), list)
+            for item_position in range(len(calculator.get("items", [])))
+        ]
+        # Opex: (turbine group position, table key) of every O&M cost table
+        self.o_and_m_tables: list[tuple[int, str]] = []
+        for group_position, turbine in enumerate(engine_input.get("turbine_groups") or []):
+            if not isinstance(turbine, dict):
+                self.opex_indexed = False
+                continue
+            # Groups without O&M or with only one of the tables are common, only tables that exist are sites
+            o_and_m = turbine.get("turbine_o_and_m")
+            if not isinstance(o_and_m, dict):
+                continue
+            for key in O_AND_M_TABLES:
+                if key in o_and_m and isinstance(o_and_m[key], dict):
+                    self.o_and_m_tables.append((group_position, key))
+
+        # Lifetime: positions of calculators and energy loss calculators carrying their own operational lifetime
+        self.lifetime_indexed = _all_dicts(calculators) and _all_dicts(energy_loss_calculators)
+        self.lifetime_calculators = [
+            position
+            for position, calculator in enumerate(calculators_list)
+            if "operational_lifetime_years" in calculator
+        ]
+        self.lifetime_energy_loss_calculators = [
+            position
+            for position, calculator in enumerate(energy_loss_list)
+            if "operational_lifetime_years" in calculator
+        ]
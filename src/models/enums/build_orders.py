@@ -0,0 +1,6 @@
+from enum import Enum
+
+
+class BuildOrder(Enum):
+    COMBINATION_MAJOR = "combination_major"
+    PROJECT_MAJOR = "project_major"
@@ -8,3 +8,6 @@ class ErrorReasons(Enum):
     CALCULATION_ERROR = "Calculation error"
     NO_ELECTRICITY_PRICES = "No electricity prices"
     FINANCIAL_CLOSE_DATE_BEFORE_SALE_DATE = "Financial close date before sale date"
+    INVALID_OPERATIONAL_LIFETIME = "Invalid operational lifetime"
+    MISSING_ENERGY_YIELD = "Missing energy yield"
+    INVALID_ENGINE_INPUT = "Invalid engine input"
@@ -0,0 +1,6 @@
+from enum import Enum
+
+
+class ExportShardBy(Enum):
+    SCENARIO = "scenario"
+    PORTFOLIO = "portfolio"
@@ -0,0 +1,7 @@
+from enum import Enum
+
+
+class TrafficMode(Enum):
+    OFF = "off"
+    RECORD = "record"
+    REPLAY = "replay"
@@ -1,8 +1,19 @@
+from functools import lru_cache
 from typing import Any
 
-from pydantic import Field, ValidationError
+from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+from src.models.gem_results import KpiSpec
+
+
+class EngineEndpointSettings(BaseModel):
+    url: str
+    key: str
+    weight: float = 1.0
+    max_concurrency: int = 120
+    batch_url: str | None = None
+
 
 class EnvironmentVariableSettings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
@@ -13,6 +24,35 @@ class EnvironmentVariableSettings(BaseSettings):
     gem_calculation_function_url: str = Field(alias="GEM_CALCULATION_FUNCTION_URL")
     gem_batch_size: int = Field(120, alias="GEM_CHUNK_SIZE")
     gem_user_agent: str = Field("GEM_PROTOTYPE_SENSITIVITY/1.0", alias="GEM_USER_AGENT")
+    gem_engine_version: str = Field("unknown", alias="GEM_ENGINE_VERSION")
+    gem_preflight_validation: bool = Field(True, alias="GEM_PREFLIGHT_VALIDATION")
+    gem_latency_aware_ordering: bool = Field(True, alias="GEM_LATENCY_AWARE_ORDERING")
+    gem_calculation_endpoints: list[EngineEndpointSettings] = Field([], alias="GEM_CALCULATION_ENDPOINTS")
+    # 0 sizes the connection pool to the total endpoint concurrency
+    gem_http_max_connections: int = Field(0, alias="GEM_HTTP_MAX_CONNECTIONS")
+    gem_http2: bool = Field(False, alias="GEM_HTTP2")
+    gem_http_keepalive_expiry: float = Field(120.0, alias="GEM_HTTP_KEEPALIVE_EXPIRY")
+    gem_http_pool_timeout: float = Field(600.0, alias="GEM_HTTP_POOL_TIMEOUT")
+    gem_calculation_batch_url: str = Field("", alias="GEM_CALCULATION_BATCH_URL")
+    # Number of assessments packed into each engine request, 1 sends every assessment on its own
+    gem_batch_envelope_size: int = Field(1, alias="GEM_BATCH_ENVELOPE_SIZE")
+    gem_warm_up: bool = Field(False, alias="GEM_WARM_UP")
+    gem_warm_up_tolerance: float = Field(0.25, alias="GEM_WARM_UP_TOLERANCE")
+    # Concurrent assessment fetches from the GEM API, sharing one authenticated client
+    gem_fetch_concurrency: int = Field(8, alias="GEM_FETCH_CONCURRENCY")
+    gem_additional_kpis: list[KpiSpec] = Field([], alias="GEM_ADDITIONAL_KPIS")
+
+    def get_calculation_endpoints(self) -> list[EngineEndpointSettings]:
+        if self.gem_calculation_endpoints:
+            return self.gem_calculation_endpoints
+        return [
+            EngineEndpointSettings(
+                url=self.gem_calculation_function_url,
+                key=self.gem_calculation_function_key,
+                max_concurrency=self.gem_batch_size,
+                batch_url=self.gem_calculation_batch_url or None,
+            )
+        ]
 
     def model_post_init(self, _: Any) -> None:
         for field_name, value in self.__dict__.items():
@@ -20,9 +60,13 @@ class EnvironmentVariableSettings(BaseSettings):
                 raise ValueError(f"Environment variable {field_name} must not be empty")
 
 
-try:
-    environment_variables = EnvironmentVariableSettings()  # type: ignore
-except ValidationError as e:
-    print("Validation error:", e)
-except Exception as e:
-    print("Other error:", e)
+# Validated on first use rather than at import, so commands that never reach GEM need no credentials
+@lru_cache(maxsize=1)
+def get_environment_variables() -> EnvironmentVariableSettings:
+    return EnvironmentVariableSettings()  # type: ignore
+
+
+def __getattr__(name: str) -> Any:
+    if name == "environment_variables":
+        return get_environment_variables()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,8 +1,10 @@
+from datetime import datetime
 from typing import Any
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, PrivateAttr
 
 from src.models.base_models import AssessmentCollection
+from src.models.engine_input_index import EngineInputIndex
 from src.models.enums.error_reasons import ErrorReasons
 from src.models.enums.sensitivities import ScenarioComponents
 from src.models.gem_results import GemResult
@@ -20,6 +22,14 @@ class Project(BaseModel):
 
 class BaseAssessment(Project):
     engine_input_json: None | dict[str, Any]
+    _engine_input_index: EngineInputIndex | None = PrivateAttr(default=None)
+
+    @property
+    def engine_input_index(self) -> EngineInputIndex | None:
+        # Built on first use and shared by every sensitivity input derived from this assessment
+        if self.engine_input_json is not None and self._engine_input_index is None:
+            self._engine_input_index = EngineInputIndex(self.engine_input_json)
+        return self._engine_input_index
 
 
 class BaseAssessments(AssessmentCollection[BaseAssessment]):
@@ -38,5 +48,30 @@ class IndividualSensitivityResult(Project):
     scenario: str
 
 
+class RunMetadata(BaseModel):
+    engine_version: str
+    assessment_revisions: dict[str, str]
+    # Hash of each scenario's sweep components and types, results are only reused while it is unchanged
+    scenario_revisions: dict[str, str] = Field(default_factory=dict)
+    created_at: datetime = Field(default_factory=datetime.now)
+
+
 class SensitivityResults(AssessmentCollection[IndividualSensitivityResult]):
-    pass
+    metadata: RunMetadata | None = None
+
+
+CombinationKey = tuple[tuple[str, Any], ...]
+SensitivityKey = tuple[str, str, CombinationKey]
+
+
+def project_key(project: Project) -> str:
+    # Design runs share a project ID across designs, so the name is needed to tell them apart
+    return f"{project.project_id}/{project.project_name}"
+
+
+def combination_key(combination: dict[ScenarioComponents, Any]) -> CombinationKey:
+    return tuple(sorted((component.value, value) for component, value in combination.items()))
+
+
+def sensitivity_key(assessment: IndividualSensitivityInput | IndividualSensitivityResult) -> SensitivityKey:
+    return project_key(assessment), assessment.scenario, combination_key(assessment.combination)
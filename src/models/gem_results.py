@@ -1,6 +1,7 @@
 from datetime import date
+from typing import Any
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class GemResult(BaseModel):
@@ -17,3 +18,13 @@ class GemResult(BaseModel):
     cod: None | date
     energy_yield: None | float
     lifetime: None | int
+    additional_kpis: dict[str, Any] = Field(default_factory=dict)
+
+
+class KpiSpec(BaseModel):
+    name: str
+    # Keys from the root of the engine response, e.g. ["bep"], used when no component is given
+    path: list[str] = Field(default_factory=list)
+    # Name of an input_components entry, the first entry with this name is used
+    component: str | None = None
+    component_field: str = "total"
@@ -0,0 +1,217 @@
+import math
+from array import array
+from collections.abc import Iterable, Iterator
+from datetime import date
+from typing import Any
+
+from src.models.enums.error_reasons import ErrorReasons
+from src.models.enums.sensitivities import ScenarioComponents
+from src.models.gem_assessments import IndividualSensitivityResult, Project, RunMetadata, SensitivityResults
+from src.models.gem_results import GemResult
+
+PROJECT_FIELDS = ("project_id", "project_name", "technology", "phase", "country", "currency")
+FLOAT_RESULT_FIELDS = (
+    "development_fee",
+    "total_capex",
+    "total_merchant_revenue",
+    "irr",
+    "bep",
+    "discount_rate",
+    "installed_capacity",
+    "total_opex",
+    "energy_yield",
+)
+DATE_RESULT_FIELDS = ("project_sale_date", "fid", "cod")
+REASONS = list(ErrorReasons)
+REASON_INDEX = {reason: index for index, reason in enumerate(REASONS)}
+COMPONENTS = list(ScenarioComponents)
+# Sentinels for missing values in the integer columns, NaN is used in the float columns
+NO_DATE = 0
+NO_INDEX = -1
+ROW_CHUNK_SIZE = 10_000
+
+ProjectRow = tuple[Any, ...]
+ROW_FIELDS = (
+    *PROJECT_FIELDS,
+    "scenario",
+    "reason_for_no_assessment",
+    *(component.value for component in COMPONENTS),
+    *FLOAT_RESULT_FIELDS,
+    *DATE_RESULT_FIELDS,
+    "lifetime",
+    "additional_kpis",
+)
+
+
+def result_row(result: IndividualSensitivityResult) -> tuple[Any, ...]:
+    # The same flat row as ResultsStore.iter_rows, from a result model
+    results = result.results
+    return (
+        *(getattr(result, field) for field in PROJECT_FIELDS),
+        result.scenario,
+        result.reason_for_no_assessment,
+        *(result.combination.get(component) for component in COMPONENTS),
+        *(getattr(results, field) if results is not None else None for field in FLOAT_RESULT_FIELDS),
+        *(getattr(results, field) if results is not None else None for field in DATE_RESULT_FIELDS),
+        results.lifetime if results is not None else None,
+        (results.additional_kpis or None) if results is not None else None,
+    )
+
+
+class ResultsStore:
+    def __init__(self, metadata: RunMetadata | None = None) -> None:
+        self.metadata = metadata
+        # Project and scenario metadata are interned once and each row only holds an index into them
+        self._projects: list[ProjectRow] = []
+        self._project_index: dict[ProjectRow, int] = {}
+        self._scenarios: list[str] = []
+        self._scenario_index: dict[str, int] = {}
+        self._project_column = array("l")
+        self._scenario_column = array("l")
+        self._reason_column = array("b")
+        self._has_results_column = array("b")
+        self._combination_columns = {component: array("d") for component in COMPONENTS}
+        self._float_columns = {field: array("d") for field in FLOAT_RESULT_FIELDS}
+        self._date_columns = {field: array("l") for field in DATE_RESULT_FIELDS}
+        self._lifetime_column = array("l")
+        # Only rows with GEM_ADDITIONAL_KPIS have an entry, so runs without extra KPIs pay nothing for them
+        self._additional_kpis: dict[int, dict[str, Any]] = {}
+
+    def _intern_project(self, project: Project) -> int:
+        row = tuple(getattr(project, field) for field in PROJECT_FIELDS)
+        index = self._project_index.get(row)
+        if index is None:
+            index = self._project_index[row] = len(self._projects)
+            self._projects.append(row)
+        return index
+
+    def _intern_scenario(self, scenario: str) -> int:
+        index = self._scenario_index.get(scenario)
+        if index is None:
+            index = self._scenario_index[scenario] = len(self._scenarios)
+            self._scenarios.append(scenario)
+        return index
+
+    def append(
+        self,
+        project: Project,
+        scenario: str,
+        combination: dict[ScenarioComponents, Any],
+        results: GemResult | None,
+        reason_for_no_assessment: ErrorReasons | None,
+    ) -> None:
+        self._project_column.append(self._intern_project(project))
+        self._scenario_column.append(self._intern_scenario(scenario))
+        self._reason_column.append(
+            NO_INDEX if reason_for_no_assessment is None else REASON_INDEX[reason_for_no_assessment]
+        )
+        for component, column in self._combination_columns.items():
+            value = combination.get(component)
+            column.append(math.nan if value is None else float(value))
+        self._has_results_column.append(results is not None)
+        for field, float_column in self._float_columns.items():
+            value = getattr(results, field) if results is not None else None
+            float_column.append(math.nan if value is None else float(value))
+        for field, date_column in self._date_columns.items():
+            value = getattr(results, field) if results is not None else None
+            date_column.append(NO_DATE if value is None else value.toordinal())
+        lifetime = results.lifetime if results is not None else None
+        self._lifetime_column.append(NO_INDEX if lifetime is None else lifetime)
+        if results is not None and results.additional_kpis:
+            self._additional_kpis[len(self._lifetime_column) - 1] = results.additional_kpis
+
+    def add(self, result: IndividualSensitivityResult) -> None:
+        self.append(result, result.scenario, result.combination, result.results, result.reason_for_no_assessment)
+
+    def extend(self, results: Iterable[IndividualSensitivityResult]) -> None:
+        for result in results:
+            self.add(result)
+
+    def __len__(self) -> int:
+        return len(self._project_column)
+
+    def _float(self, field: str, index: int) -> float | None:
+        value = self._float_columns[field][index]
+        return None if math.isnan(value) else value
+
+    def _date(self, field: str, index: int) -> date | None:
+        value = self._date_columns[field][index]
+        return None if value == NO_DATE else date.fromordinal(value)
+
+    def __getitem__(self, index: int) -> IndividualSensitivityResult:
+        if index < 0:
+            index += len(self)
+        # Values were validated on the way in, so the models are rebuilt without validating them again
+        results = None
+        if self._has_results_column[index]:
+            lifetime = self._lifetime_column[index]
+            result_values: dict[str, Any] = {field: self._float(field, index) for field in FLOAT_RESULT_FIELDS}
+            result_values.update({field: self._date(field, index) for field in DATE_RESULT_FIELDS})
+            result_values["lifetime"] = None if lifetime == NO_INDEX else lifetime
+            result_values["additional_kpis"] = self._additional_kpis.get(index, {})
+            results = GemResult.model_construct(**result_values)
+        reason = self._reason_column[index]
+        return IndividualSensitivityResult.model_construct(
+            **dict(zip(PROJECT_FIELDS, self._projects[self._project_column[index]])),
+            reason_for_no_assessment=None if reason == NO_INDEX else REASONS[reason],
+            results=results,
+            combination={
+                component: column[index]
+                for component, column in self._combination_columns.items()
+                if not math.isnan(column[index])
+            },
+            scenario=self._scenarios[self._scenario_column[index]],
+        )
+
+    def __iter__(self) -> Iterator[IndividualSensitivityResult]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def iter_rows(self) -> Iterator[tuple[Any, ...]]:
+        # Flat rows in ROW_FIELDS order, for bulk writers that do not need the models. Columns are converted a chunk
+        # at a time, which is much faster than converting each row field by field
+        for start in range(0, len(self), ROW_CHUNK_SIZE):
+            rows = slice(start, start + ROW_CHUNK_SIZE)
+            projects = [self._projects[index] for index in self._project_column[rows]]
+            columns: list[Iterable[Any]] = [
+                *zip(*projects),
+                [self._scenarios[index] for index in self._scenario_column[rows]],
+                [None if reason == NO_INDEX else REASONS[reason] for reason in self._reason_column[rows]],
+                *(
+                    [None if math.isnan(value) else value for value in column[rows]]
+                    for column in (*self._combination_columns.values(), *self._float_columns.values())
+                ),
+                *(
+                    [None if value == NO_DATE else date.fromordinal(value) for value in column[rows]]
+                    for column in self._date_columns.values()
+                ),
+                [None if lifetime == NO_INDEX else lifetime for lifetime in self._lifetime_column[rows]],
+                [self._additional_kpis.get(index) for index in range(*rows.indices(len(self)))],
+            ]
+            yield from zip(*columns)
+
+    def iter_valid(self) -> Iterator[IndividualSensitivityResult]:
+        for index, reason in enumerate(self._reason_column):
+            if reason == NO_INDEX:
+                yield self[index]
+
+    def write_json(self, file_path: str) -> None:
+        # Writes the same document as SensitivityResults.model_dump_json, one row at a time
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write('{"assessments": [')
+            for index, result in enumerate(self):
+                if index:
+                    f.write(", ")
+                f.write(result.model_dump_json())
+            f.write('], "metadata": ')
+            f.write(self.metadata.model_dump_json() if self.metadata is not None else "null")
+            f.write("}")
+
+    def to_sensitivity_results(self) -> SensitivityResults:
+        return SensitivityResults(assessments=list(self), metadata=self.metadata)
+
+    @classmethod
+    def from_sensitivity_results(cls, sensitivity_results: SensitivityResults) -> "ResultsStore":
+        store = cls(metadata=sensitivity_results.metadata)
+        store.extend(sensitivity_results.assessments)
+        return store
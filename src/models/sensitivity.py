@@ -1,4 +1,7 @@
+import math
+from collections.abc import Iterator, Sequence
 from itertools import product
+from typing import overload
 
 from pydantic import BaseModel
 
@@ -11,10 +14,46 @@ class ParameterDetails(BaseModel):
     values: list[float]
 
 
+class Combinations(Sequence[dict[ScenarioComponents, float]]):
+    def __init__(self, components: list[ScenarioComponents], value_lists: list[list[float]]) -> None:
+        self._components = components
+        self._value_lists = value_lists
+        self._length = math.prod(len(values) for values in value_lists)
+
+    def __len__(self) -> int:
+        return self._length
+
+    @overload
+    def __getitem__(self, index: int) -> dict[ScenarioComponents, float]: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[dict[ScenarioComponents, float]]: ...
+
+    def __getitem__(
+        self, index: int | slice
+    ) -> dict[ScenarioComponents, float] | list[dict[ScenarioComponents, float]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError(f"Combination index {index} out of range for {self._length} combinations")
+        # Decode the index in the same mixed radix order as itertools.product, last sweep varying fastest
+        values: list[float] = []
+        for value_list in reversed(self._value_lists):
+            index, position = divmod(index, len(value_list))
+            values.append(value_list[position])
+        return dict(zip(self._components, reversed(values)))
+
+    def __iter__(self) -> Iterator[dict[ScenarioComponents, float]]:
+        for combination in product(*self._value_lists):
+            yield dict(zip(self._components, combination))
+
+
 class ScenarioSensitivity(BaseModel):
     element_wise_parameter_sweep: dict[str, ParameterDetails]
 
-    def generate_combinations(self) -> list[dict[ScenarioComponents, float]]:
+    def generate_combinations(self) -> Combinations:
         components = [sweep.component for sweep in self.element_wise_parameter_sweep.values()]
         value_lists = [sweep.values for sweep in self.element_wise_parameter_sweep.values()]
-        return [dict(zip(components, combination)) for combination in product(*value_lists)]
+        return Combinations(components, value_lists)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
 
 from src.models.enums.technologies import Technologies
 from src.models.sensitivity import ScenarioSensitivity
@@ -8,3 +8,24 @@ class SensitivitySettings(BaseModel):
     folder: str
     technologies: list[Technologies]
     sensitivities: dict[str, ScenarioSensitivity]
+
+
+class AnalysisSettings(BaseModel):
+    name: str
+    # Path to a sensitivity JSON, e.g. examples/sensitivity_set_up.json
+    config: str
+    # Share of the engine capacity relative to the other analyses while they all have work queued
+    weight: float = Field(1.0, gt=0)
+
+
+class MultiAnalysisSettings(BaseModel):
+    analyses: list[AnalysisSettings] = Field(min_length=1)
+
+    @field_validator("analyses")
+    @classmethod
+    def _unique_names(cls, analyses: list[AnalysisSettings]) -> list[AnalysisSettings]:
+        names = [analysis.name for analysis in analyses]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"Analysis names must be unique, duplicated: {duplicates}")
+        return analyses
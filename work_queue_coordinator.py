@@ -0,0 +1,45 @@
+import json
+import logging
+import os
+
+from src.gem.gem_service import get_base_gem_assessments
+from src.gem.incremental_runs import build_run_metadata
+from src.gem.work_queue import WorkQueue, collect_results, enqueue_sensitivity_tasks, wait_for_completion
+from src.helpers.base_assessment_cache import base_assessment_cache_path, save_base_assessments
+from src.helpers.write_to_excel_template import write_results_to_template_excel_file
+from src.models.settings import SensitivitySettings
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("coordinator.log", mode="a"),
+    ],
+)
+
+ANALYSIS_NAME = "emea"
+SENSITIVITY_CONFIG = "examples/sensitivity_set_up.json"
+RESULTS_DIRECTORY = "results"
+# Must be on a filesystem shared by every worker host
+QUEUE_PATH = os.path.join(RESULTS_DIRECTORY, f"{ANALYSIS_NAME}_queue.db")
+# Clears a queue left by a different run (other config, engine version or assessments) instead of refusing it
+RESET_QUEUE = False
+
+if __name__ == "__main__":
+    with open(SENSITIVITY_CONFIG) as f:
+        config = SensitivitySettings(**json.load(f))
+
+    queue = WorkQueue(QUEUE_PATH)
+    base_assessments = get_base_gem_assessments(config)
+    save_base_assessments(base_assessments, base_assessment_cache_path(RESULTS_DIRECTORY, ANALYSIS_NAME))
+    enqueue_sensitivity_tasks(
+        queue, base_assessments, config, metadata=build_run_metadata(base_assessments, config), reset=RESET_QUEUE
+    )
+
+    wait_for_completion(queue)
+    sensitivity_results = collect_results(queue)
+
+    sensitivity_results.write_json(os.path.join(RESULTS_DIRECTORY, f"{ANALYSIS_NAME}_results.json"))
+    write_results_to_template_excel_file(sensitivity_results, os.path.join(RESULTS_DIRECTORY, f"{ANALYSIS_NAME}.xlsx"))
+
+    logging.info("Work queue sensitivity analysis complete")
@@ -0,0 +1,28 @@
+import logging
+import os
+
+from src.gem.work_queue import WorkQueue, default_worker_id, run_worker
+from src.helpers.failure_archive import failure_archive_path
+from src.models.env_variables_config import get_environment_variables
+
+WORKER_ID = default_worker_id()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler(f"worker_{WORKER_ID}.log", mode="a"),
+    ],
+)
+
+ANALYSIS_NAME = "emea"
+RESULTS_DIRECTORY = "results"
+QUEUE_PATH = os.path.join(RESULTS_DIRECTORY, f"{ANALYSIS_NAME}_queue.db")
+
+if __name__ == "__main__":
+    run_worker(
+        WorkQueue(QUEUE_PATH),
+        claim_size=get_environment_variables().gem_batch_size,
+        worker_id=WORKER_ID,
+        failure_archive_file=failure_archive_path(ANALYSIS_NAME),
+    )
@@ -1,9 +1,9 @@
-import json
 import logging
 import os
 
-from src.helpers.write_to_excel_template import write_results_to_template_excel_file
-from src.models.gem_assessments import SensitivityResults
+from src.helpers.results_loader import iter_results_file
+from src.helpers.write_to_excel_template import write_results_to_template_excel_file, write_sharded_excel_files
+from src.models.enums.export_shards import ExportShardBy
 
 logging.basicConfig(
     level=logging.INFO,
@@ -14,19 +14,26 @@ logging.basicConfig(
 )
 
 
-def load_results(file_path: str) -> SensitivityResults:
-    logging.info(f"Loading settings from {file_path}")
-    with open(os.path.join(os.path.dirname(__file__), file_path), encoding="utf-8") as f:
-        data = json.load(f)
-        settings = SensitivityResults(**data)
-        logging.info("Results loaded")
-    return settings
-
-
 ANALYSIS_NAME = "emea"
 RESULTS_DIRECTORY = "results"
+# Restrict the export to these scenarios / project IDs, None exports everything
+SCENARIOS: list[str] | None = None
+PROJECT_IDS: list[str] | None = None
+# Split the export into one workbook per scenario or portfolio, plus an index workbook, None writes a single file
+SHARD_BY: ExportShardBy | None = None
 
 if __name__ == "__main__":
     file_path = os.path.join(RESULTS_DIRECTORY, f"{ANALYSIS_NAME}_results.json")
-    results = load_results(file_path)
-    write_results_to_template_excel_file(results, os.path.join(RESULTS_DIRECTORY, f"{ANALYSIS_NAME}.xlsx"))
+    logging.info(f"Streaming results from {file_path}")
+    # Results are parsed one at a time straight into the workbook instead of loading the whole file first
+    results = iter_results_file(
+        os.path.join(os.path.dirname(__file__), file_path),
+        scenarios=set(SCENARIOS) if SCENARIOS is not None else None,
+        project_ids=set(PROJECT_IDS) if PROJECT_IDS is not None else None,
+    )
+    if SHARD_BY is not None:
+        write_sharded_excel_files(
+            results, os.path.join(RESULTS_DIRECTORY, f"{ANALYSIS_NAME}_{SHARD_BY.value}"), ANALYSIS_NAME, SHARD_BY
+        )
+    else:
+        write_results_to_template_excel_file(results, os.path.join(RESULTS_DIRECTORY, f"{ANALYSIS_NAME}.xlsx"))